@@ -5,9 +5,12 @@ except for the agent classes themselves.
 """
 
 import cab.abm.agent as cab_agent
+import cab.abm.mailbox as cab_mailbox
+import cab.abm.registry as cab_registry
 import cab.ca.ca as cab_ca
 import cab.global_constants as cab_gc
 import cab.util.logging as cab_log
+import cab.util.rng as cab_rng
 import cab.util.stats as cab_stats
 
 __author__ = 'Michael Wagner'
@@ -22,9 +25,36 @@ class ABM:
         """
         self.agent_set = set()
         self.agent_locations = dict()
+        # Scheduled agents by class and tag, see cab.abm.registry.
+        self.registry = cab_registry.AgentRegistry()
         self.gc = gc
         self.new_agents = list()
         self.dead_agents = list()
+        # Thread pool of the two-phase execution, created on first use.
+        if getattr(self, 'thread_pool', None) is not None:
+            self.thread_pool.shutdown(wait=False)
+        self.thread_pool = None
+        # Worker processes of the two-phase execution, forked on first use, see cab.abm.two_phase.ProcessPool.
+        if getattr(self, 'process_pool', None) is not None:
+            self.process_pool.shutdown()
+        self.process_pool = None
+        # Homogeneous agents stored as arrays, see cab.abm.agent_population.
+        self.populations = list()
+        # Messages between agents, delivered at the start of the next step, see cab.abm.mailbox.
+        self.mailbox = cab_mailbox.Mailbox()
+        # Objects of removed agents to be reused for new ones, see cab.abm.agent_pool.
+        self.agent_pool = None
+        if gc.USE_AGENT_POOL:
+            import cab.abm.agent_pool as cab_agent_pool
+            self.agent_pool = cab_agent_pool.AgentPool(gc.AGENT_POOL_SIZE)
+        # Spatial hash of agents with continuous positions, see use_continuous_space.
+        self.space = None
+        # Agents per cell and free cells, built on first use, see cab.abm.occupancy.
+        self.occupancy = None
+        self.scheduler = None
+        if gc.USE_EVENT_SCHEDULER:
+            import cab.abm.scheduler as cab_scheduler
+            self.scheduler = cab_scheduler.EventScheduler()
         if proto_agent is not None:
             cab_log.trace('[ABM] have proto agent {0}'.format(proto_agent))
             self.add_agent(proto_agent)
@@ -42,11 +72,23 @@ class ABM:
         # changed_agents = []
         self.new_agents = list()
         self.dead_agents = list()
+        self.mailbox.deliver()
 
-        for a in self.agent_set:
-            a.perceive_and_act(self, ca)
-            if a.x != a.prev_x or a.y != a.prev_y:
-                self.update_agent_position(a)
+        for population in self.populations:
+            population.cycle(self, ca)
+
+        if self.scheduler is not None:
+            self.cycle_scheduled_agents(ca)
+            return
+
+        if self.gc.USE_TWO_PHASE_AGENTS:
+            self.propose_and_commit(ca)
+        else:
+            for a in self.agent_set:
+                a.perceive_and_act(self, ca)
+                self.registry.update(a)
+                if a.x != a.prev_x or a.y != a.prev_y:
+                    self.update_agent_position(a)
 
         # self.agent_set = set([agent for agent in self.agent_set if not agent.dead])
         # cab_log.trace("[ABM] agent set = {0}".format(self.agent_set))
@@ -64,13 +106,87 @@ class ABM:
 
         self.schedule_new_agents()
 
+    def cycle_scheduled_agents(self, ca: cab_ca.CabCA):
+        """
+        Let only the agents act that are due in this time step, then schedule them again.
+        Agents that were killed in this step are removed right away, also if they were asleep or waiting.
+        """
+        agents = self.scheduler.pop_due(self.gc.TIME_STEP)
+        if self.gc.USE_TWO_PHASE_AGENTS:
+            self.propose_and_commit(ca, [a for a in agents if not a.dead])
+        else:
+            for a in agents:
+                if a.dead:
+                    continue
+                a.perceive_and_act(self, ca)
+                self.registry.update(a)
+                if a.x != a.prev_x or a.y != a.prev_y:
+                    self.update_agent_position(a)
+
+        # The killed agents that are not due are found without looking at all agents, see CabAgent.dead.
+        killed = [agent for agent in self.scheduler.pop_killed() if agent in self.agent_set]
+        self.dead_agents = [agent for agent in dict.fromkeys(killed + agents) if agent.dead]
+        for agent in self.dead_agents:
+            self.remove_agent(agent)
+            self.agent_set.discard(agent)
+        for agent in agents:
+            if not agent.dead:
+                self.scheduler.reschedule(agent)
+
+        self.schedule_new_agents()
+
+    def trigger_event(self, event: str):
+        """
+        Wake up all agents that wait for the event, they act in the next time step.
+        """
+        if self.scheduler is not None:
+            self.scheduler.trigger(event)
+
+    def propose_and_commit(self, ca: cab_ca.CabCA, agents=None):
+        """
+        Two-phase execution: all agents propose their actions based on the same snapshot of the world,
+        possibly in parallel, then the actions are applied and conflicts resolved deterministically.
+        :param agents: The agents that act, by default all of them.
+        """
+        import cab.abm.two_phase as cab_two_phase
+        agents = sorted(self.agent_set if agents is None else agents, key=lambda agent: agent.a_id)
+        snapshot = cab_two_phase.take_snapshot(self, ca)
+        executor = self.gc.TWO_PHASE_EXECUTOR
+        if executor == 'process' and not cab_two_phase.can_fork():
+            executor = 'thread'
+        if executor == 'thread' and self.thread_pool is None:
+            import concurrent.futures
+            self.thread_pool = concurrent.futures.ThreadPoolExecutor(self.gc.TWO_PHASE_WORKERS)
+        if executor == 'process' and (self.process_pool is None or not self.process_pool.is_current(ca)):
+            # A CA with new grid states or field layers needs workers that know them.
+            if self.process_pool is not None:
+                self.process_pool.shutdown()
+            self.process_pool = cab_two_phase.ProcessPool(ca, self.gc.TWO_PHASE_WORKERS)
+        # Agents created while proposing get their ids in the commit phase, in a deterministic order.
+        next_agent_id = self.gc.NEXT_AGENT_ID
+        proposals = cab_two_phase.propose_all(agents, snapshot, executor, self.gc.TWO_PHASE_WORKERS,
+                                              self.thread_pool, self.process_pool)
+        self.gc.NEXT_AGENT_ID = next_agent_id
+        resolver = cab_two_phase.Resolver(self.gc.RNG_SEED, self.gc.TIME_STEP, self.gc.ONE_AGENT_PER_CELL)
+        resolver.resolve(self, ca, agents, proposals)
+        for agent in agents:
+            self.registry.update(agent)
+
     def update_agent_position(self, agent: cab_agent.CabAgent):
         """
         Update all agent positions in the location map.
         """
         if self.gc.ONE_AGENT_PER_CELL:
-            self.agent_locations.pop((agent.prev_x, agent.prev_y))
+            # A cell is counted as occupied as long as it is in the location map. An agent may move onto
+            # the cell of one that was killed in this step, which then leaves nothing behind when it is removed.
+            if self.agent_locations.get((agent.prev_x, agent.prev_y)) is agent:
+                del self.agent_locations[agent.prev_x, agent.prev_y]
+                if self.occupancy is not None:
+                    self.occupancy.vacate(agent.prev_x, agent.prev_y)
+            displaced = self.agent_locations.get((agent.x, agent.y))
             self.agent_locations[agent.x, agent.y] = agent
+            if displaced is None and self.occupancy is not None:
+                self.occupancy.occupy(agent.x, agent.y)
             cab_log.trace("[ABM] moving agent from = {0}, {1}".format(
                 agent.prev_x, agent.prev_y))
         else:
@@ -84,25 +200,64 @@ class ABM:
             except KeyError:
                 self.agent_locations[agent.x, agent.y] = {
                     agent}  # set([agent])
+            if self.occupancy is not None:
+                self.occupancy.vacate(agent.prev_x, agent.prev_y)
+                self.occupancy.occupy(agent.x, agent.y)
 
     def add_agent(self, agent: cab_agent.CabAgent):
         """
         Add an agent to the system.
         """
         self.new_agents.append(agent)
+        self.add_agent_location(agent)
+        if self.space is not None and hasattr(agent, 'px'):
+            self.space.insert(agent)
+        cab_log.trace(
+            "[ABM] agent added to position {0}, {1}".format(agent.x, agent.y))
+
+    def add_agent_location(self, agent):
+        """
+        List an agent on its cell in the location map and the occupancy index.
+        """
         pos = (agent.x, agent.y)
         if agent.x is not None and agent.y is not None:
             if self.gc.ONE_AGENT_PER_CELL:
                 if pos not in self.agent_locations:
                     self.agent_locations[pos] = agent
+                    if self.occupancy is not None:
+                        self.occupancy.occupy(agent.x, agent.y)
                     # Can't insert agent if cell is already occupied.
             else:
                 if pos in self.agent_locations:
                     self.agent_locations[pos].add(agent)
                 else:
                     self.agent_locations[pos] = {agent}
-        cab_log.trace(
-            "[ABM] agent added to position {0}, {1}".format(agent.x, agent.y))
+                if self.occupancy is not None:
+                    self.occupancy.occupy(agent.x, agent.y)
+
+    def add_population(self, population):
+        """
+        Add a population of array-based agents to the system. Its agents are listed in the location map
+        from now on, see cab.abm.agent_population.
+        """
+        self.populations.append(population)
+        population.abm = self
+        for view in population.views[:len(population)]:
+            if not view.dead:
+                self.add_agent_location(view)
+        cab_log.trace("[ABM] population {0} added with {1} agents".format(population, len(population)))
+
+    def agents_at(self, x: int, y: int) -> list:
+        """
+        Returns all agents at a position, including those of populations.
+        """
+        agents = list()
+        if (x, y) in self.agent_locations:
+            if self.gc.ONE_AGENT_PER_CELL:
+                agents.append(self.agent_locations[x, y])
+            else:
+                agents.extend(self.agent_locations[x, y])
+        return agents
 
     def schedule_new_agents(self):
         """
@@ -111,16 +266,137 @@ class ABM:
         for agent in self.new_agents:
             # pos = (agent.x, agent.y)
             self.agent_set.add(agent)
+            self.registry.add(agent)
+            if self.scheduler is not None:
+                agent.killed_agents = self.scheduler.killed
+                self.scheduler.reschedule(agent)
             cab_log.trace("[ABM] agent {0} scheduled by the ABM".format(agent))
 
     def remove_agent(self, agent: cab_agent.CabAgent):
         """
         Removes an agent from the system.
         """
+        self.registry.remove(agent)
+        if self.scheduler is not None:
+            self.scheduler.unschedule(agent)
+        self.remove_agent_location(agent)
+        if self.space is not None and hasattr(agent, 'px'):
+            self.space.remove(agent)
+        if self.agent_pool is not None and agent.dead:
+            self.agent_pool.release(agent)
+
+    def remove_agent_location(self, agent: cab_agent.CabAgent):
+        """
+        Take an agent off its cell in the location map and the occupancy index, if it is still there.
+        """
+        pos = (agent.x, agent.y)
         if self.gc.ONE_AGENT_PER_CELL:
-            if self.agent_locations[agent.x, agent.y].a_id == agent.a_id:
-                del(self.agent_locations[agent.x, agent.y])
+            if self.agent_locations.get(pos) is agent:
+                del(self.agent_locations[pos])
+                if self.occupancy is not None:
+                    self.occupancy.vacate(agent.x, agent.y)
         else:
-            self.agent_locations[agent.x, agent.y].discard(agent)
-            if len(self.agent_locations[agent.x, agent.y]) == 0:
-                del(self.agent_locations[agent.x, agent.y])
+            agents = self.agent_locations.get(pos)
+            if agents is not None and agent in agents:
+                agents.discard(agent)
+                if self.occupancy is not None:
+                    self.occupancy.vacate(agent.x, agent.y)
+                if len(agents) == 0:
+                    del(self.agent_locations[pos])
+
+    def create_agent(self, cls: type, x, y, *args, **kwargs) -> cab_agent.CabAgent:
+        """
+        Returns a new agent of the class, recycled from the agent pool if gc.USE_AGENT_POOL is set.
+        The agent still has to be added by add_agent. With the pool, removed agents must not be kept around,
+        as their objects come back as new agents.
+        :param args: Further arguments of the constructor, also passed to the reset method of recycled agents.
+        """
+        if self.agent_pool is None:
+            return cls(x, y, self.gc, *args, **kwargs)
+        return self.agent_pool.acquire(cls, x, y, self.gc, *args, **kwargs)
+
+    def post_message(self, sender: cab_agent.CabAgent, x: int, y: int, topic: str, content=None):
+        """
+        Send a message to the cell x, y, agents there receive it in the next step.
+        """
+        self.mailbox.post(None if sender is None else sender.a_id, x, y, topic, content)
+
+    def broadcast_message(self, ca: cab_ca.CabCA, sender: cab_agent.CabAgent, radius: int, topic: str,
+                          content=None):
+        """
+        Send a message to all cells within the radius around the sender, they receive it in the next step.
+        """
+        self.mailbox.broadcast(ca, sender.a_id, sender.x, sender.y, radius, topic, content)
+
+    def receive_messages(self, x: int, y: int, topic: str = None) -> list:
+        """
+        Returns the messages delivered to the cell x, y at the start of this step.
+        """
+        return self.mailbox.receive(x, y, topic)
+
+    def get_agents(self, cls: type = None, tag: str = None) -> set:
+        """
+        Returns the scheduled agents of a class, including subclasses, and/or with a tag.
+        The set is the index itself, so copy it before adding or removing agents while iterating.
+        """
+        return self.registry.get_agents(cls, tag)
+
+    def count_agents(self, cls: type = None, tag: str = None) -> int:
+        return self.registry.count(cls, tag)
+
+    def sum_agent_attribute(self, cls: type, name: str) -> float:
+        """
+        Returns the sum of an attribute over all agents of a class. The attribute has to be declared in
+        AGGREGATED_ATTRIBUTES, and the sum is up to date with the values after the agents last acted.
+        Changes made to other agents in between are picked up by calling update_agent_attributes.
+        """
+        return self.registry.sum(cls, name)
+
+    def update_agent_attributes(self, agent: cab_agent.CabAgent):
+        self.registry.update(agent)
+
+    def tag_agent(self, agent: cab_agent.CabAgent, tag: str):
+        self.registry.add_tag(agent, tag)
+
+    def untag_agent(self, agent: cab_agent.CabAgent, tag: str):
+        self.registry.remove_tag(agent, tag)
+
+    def use_continuous_space(self, ca: cab_ca.CabCA, bucket_size: float):
+        """
+        Index the agents with continuous positions in a spatial hash, see cab.abm.continuous.
+        :param bucket_size: Edge length of the buckets of the hash, ideally the most common query radius.
+        :returns The space, which moves the agents and answers radius and nearest neighbor queries.
+        """
+        import cab.abm.continuous as cab_continuous
+        self.space = cab_continuous.ContinuousSpace(self, ca, bucket_size)
+        for agent in list(self.agent_set) + self.new_agents:
+            if hasattr(agent, 'px') and agent.bucket is None:
+                self.space.insert(agent)
+        return self.space
+
+    def get_occupancy(self):
+        """
+        Returns the occupancy index of the agents, building it from the location map on first use.
+        """
+        if self.occupancy is None:
+            import cab.abm.occupancy as cab_occupancy
+            self.occupancy = cab_occupancy.OccupancyIndex(self.gc)
+            for (x, y), entry in self.agent_locations.items():
+                for _ in range(1 if self.gc.ONE_AGENT_PER_CELL else len(entry)):
+                    self.occupancy.occupy(x, y)
+        return self.occupancy
+
+    def random_free_position(self):
+        """
+        Returns a random cell without agents in O(1), None if there is none.
+        """
+        return self.get_occupancy().random_free_position(cab_rng.get_RNG())
+
+    def random_free_neighbor(self, ca: cab_ca.CabCA, x: int, y: int):
+        """
+        Returns a random neighbor of the cell at x, y without agents, None if there is none.
+        """
+        return self.get_occupancy().random_free_neighbor(ca, x, y, cab_rng.get_RNG())
+
+    def count_free_cells(self) -> int:
+        return len(self.get_occupancy())
@@ -3,34 +3,103 @@ This module contains all classes associated with the agents of the system.
 """
 
 
-import uuid
 from abc import ABCMeta, abstractmethod
 
 
 __author__ = 'Michael Wagner'
 
 
+def next_agent_id(gc) -> int:
+    """
+    Returns a new agent id. Ids are increasing integers, counted per simulation in gc.NEXT_AGENT_ID.
+    """
+    a_id = gc.NEXT_AGENT_ID
+    gc.NEXT_AGENT_ID = a_id + 1
+    return a_id
+
+
 class CabAgent(metaclass=ABCMeta):
     """
     Parent class for all agents.
     Every subclass has to implement the perceive_and_act() method.
     """
+    # Tags the ABM indexes the agents of the class by, see ABM.get_agents.
+    TAGS = ()
+    # Numeric attributes the ABM keeps the sum of for the class, see ABM.sum_agent_attribute.
+    AGGREGATED_ATTRIBUTES = ()
 
     def __init__(self, x, y, gc):
-        self.a_id = uuid.uuid4().urn
         self.gc = gc
+        # Not self.reset, subclasses may override it and their attributes don't exist yet.
+        CabAgent.reset(self, x, y)
+
+    def reset(self, x, y):
+        """
+        Reinitialize a recycled agent of the agent pool, see ABM.create_agent.
+        Subclasses with own attributes override this with the same arguments as their __init__,
+        except for gc, and call super().reset(x, y).
+        """
+        self.a_id = next_agent_id(self.gc)
         self.x = x
         self.y = y
         self.prev_x = x
         self.prev_y = y
-        self.size = gc.CELL_SIZE
-        self.color = gc.DEFAULT_AGENT_COLOR
-        self.dead = False
+        self.size = self.gc.CELL_SIZE
+        self.color = self.gc.DEFAULT_AGENT_COLOR
+        self._dead = False
+        # Requests to the event scheduler, see sleep_until and wait_for_event.
+        self.wake_time = None
+        self.waiting_for = None
+        # Killed list of the event scheduler, set by the ABM when the agent is scheduled, see dead.
+        self.killed_agents = None
+
+    @property
+    def dead(self) -> bool:
+        return self._dead
+
+    @dead.setter
+    def dead(self, dead: bool):
+        """
+        Killed agents are noted in the killed list of the event scheduler, so the ABM removes them in the
+        same step even if it doesn't visit every agent, see ABM.cycle_scheduled_agents.
+        Subclasses may set it before calling super().__init__, when nothing else is set yet.
+        """
+        if dead and not getattr(self, '_dead', False):
+            killed_agents = getattr(self, 'killed_agents', None)
+            if killed_agents is not None:
+                killed_agents.append(self)
+        self._dead = dead
 
     @abstractmethod
     def perceive_and_act(self, abm, ca):
         raise NotImplementedError("Method needs to be implemented")
 
+    def propose(self, world):
+        """
+        Used instead of perceive_and_act if gc.USE_TWO_PHASE_AGENTS is set.
+        Must not change anything, but return the intended actions, see cab.abm.two_phase.
+        :param world: WorldSnapshot of the current step.
+        :return: List of actions.
+        """
+        raise NotImplementedError("Method needs to be implemented for two-phase execution")
+
+    def sleep_until(self, time_step: int):
+        """
+        Don't act again before the given time step. Only has an effect if gc.USE_EVENT_SCHEDULER is set.
+        """
+        self.wake_time = time_step
+
+    def sleep_for(self, num_steps: int):
+        self.sleep_until(self.gc.TIME_STEP + num_steps)
+
+    def wait_for_event(self, event: str, timeout: int = None):
+        """
+        Don't act again before the event is triggered by abm.trigger_event, or the timeout is over.
+        Only has an effect if gc.USE_EVENT_SCHEDULER is set.
+        """
+        self.waiting_for = event
+        self.wake_time = None if timeout is None else self.gc.TIME_STEP + timeout
+
     def on_lmb_click(self, abm, ca):
         """
         Executed when the mouse is pointed at the agent and left clicked.
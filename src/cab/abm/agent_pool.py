@@ -0,0 +1,49 @@
+"""
+This module contains the agent pool of the ABM, which recycles the objects of dead agents.
+In models where agents are born and die all the time, new agents are taken from the pool and reinitialized
+by their reset method instead of being allocated, which saves allocations and garbage collection.
+"""
+
+import collections
+
+from typing import Dict, List
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+class AgentPool:
+    """
+    Removed agents per class, waiting to be reused.
+    """
+
+    def __init__(self, max_size: int = None):
+        """
+        :param max_size: Maximum number of agents kept per class, None means no limit.
+        """
+        self.max_size = max_size
+        self.free: Dict[type, List] = collections.defaultdict(list)
+        self.num_reused = 0
+
+    def __len__(self) -> int:
+        return sum(len(agents) for agents in self.free.values())
+
+    def release(self, agent):
+        free = self.free[type(agent)]
+        if self.max_size is None or len(free) < self.max_size:
+            free.append(agent)
+
+    def acquire(self, cls: type, x, y, gc, *args, **kwargs):
+        """
+        Returns an agent of the class at x, y, either a recycled one reinitialized by
+        agent.reset(x, y, *args, **kwargs) or a new one created by cls(x, y, gc, *args, **kwargs).
+        """
+        free = self.free.get(cls)
+        if not free:
+            return cls(x, y, gc, *args, **kwargs)
+        agent = free.pop()
+        agent.reset(x, y, *args, **kwargs)
+        self.num_reused += 1
+        cab_log.trace('[AgentPool] reusing agent object as {0}'.format(agent.a_id))
+        return agent
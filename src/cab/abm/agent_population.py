@@ -0,0 +1,361 @@
+"""
+This module contains populations of homogeneous agents, stored as struct of arrays.
+Instead of one CabAgent instance per agent, a population keeps the positions, colors, death flags and
+user attributes of all its agents in numpy columns and moves them with vectorized kernels.
+Positions are grid coordinates, i.e. (x, y) for rectangular and (q, r) for hexagonal grids.
+Once a population is added to the ABM, every agent is also listed in the location map and the occupancy
+index of the ABM by a PopulationAgent view, so neighborhoods, free cells and clicks include it.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+import cab.ca.ca_array as cab_array
+import cab.util.logging as cab_log
+import cab.util.rng as cab_rng
+
+__author__ = 'Michael Wagner'
+
+
+class PopulationAgent:
+    """
+    View of a single agent of a population, for code that expects agent objects like click handlers.
+    Every agent has one view for its whole life, its index is updated when the population moves its agents
+    together.
+    """
+
+    def __init__(self, population: 'AgentPopulation', index: int):
+        self.population = population
+        self.index = index
+
+    @property
+    def x(self) -> int:
+        return int(self.population.x[self.index])
+
+    @property
+    def y(self) -> int:
+        return int(self.population.y[self.index])
+
+    @property
+    def prev_x(self) -> int:
+        return int(self.population.columns['prev_x'][self.index])
+
+    @property
+    def prev_y(self) -> int:
+        return int(self.population.columns['prev_y'][self.index])
+
+    @property
+    def color(self) -> Tuple[int, int, int]:
+        return tuple(int(c) for c in self.population.color[self.index])
+
+    @property
+    def dead(self) -> bool:
+        return bool(self.population.dead[self.index])
+
+    def __getattr__(self, name):
+        columns = self.__dict__['population'].columns
+        if name in columns:
+            return columns[name][self.index]
+        raise AttributeError(name)
+
+    def on_lmb_click(self, abm, ca):
+        self.population.on_lmb_click(self.index, abm, ca)
+
+    def on_rmb_click(self, abm, ca):
+        self.population.on_rmb_click(self.index, abm, ca)
+
+
+class AgentPopulation:
+    """
+    Homogeneous agents as numpy columns. Subclasses implement perceive_and_act for all agents at once,
+    usually with the movement kernels of this class, and are added to the simulation by ABM.add_population.
+    """
+
+    def __init__(self, gc, ca, capacity: int = 1024, color: Tuple[int, int, int] = None, size: int = None):
+        """
+        :param gc: Global constants.
+        :param ca: The CA the agents live on.
+        :param capacity: Initial number of agents that fit into the columns, they grow as needed.
+        :param color: Default color of new agents.
+        :param size: Drawing size of the agents.
+        """
+        self.gc = gc
+        self.ca = ca
+        self.count = 0
+        self.capacity = max(1, capacity)
+        self.default_color = color if color is not None else gc.DEFAULT_AGENT_COLOR
+        self.size = size if size is not None else gc.CELL_SIZE
+        self.use_hex = gc.USE_HEX_CA
+        self.width = ca.width
+        self.height = ca.height
+        # Seeded from the simulation RNG, so populations are reproducible with the simulation seed.
+        self.rng = np.random.default_rng(cab_rng.get_RNG().getrandbits(64))
+        # The ABM the population was added to, which lists the agents in its location map.
+        self.abm = None
+        # The view of every agent, by index.
+        self.views: List[PopulationAgent] = list()
+        self.columns: Dict[str, np.ndarray] = dict()
+        self.defaults: Dict[str, object] = dict()
+        self.add_attribute('x', np.int64, 0)
+        self.add_attribute('y', np.int64, 0)
+        self.add_attribute('prev_x', np.int64, 0)
+        self.add_attribute('prev_y', np.int64, 0)
+        self.add_attribute('dead', np.bool_, False)
+        self.add_attribute('color', np.uint8, self.default_color, (3,))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getstate__(self):
+        # Copies, e.g. in the worker processes of the two-phase execution, are not part of a simulation.
+        state = self.__dict__.copy()
+        state['abm'] = None
+        state['ca'] = None
+        return state
+
+    def add_attribute(self, name: str, dtype, default=0, shape: Tuple[int, ...] = ()):
+        """
+        Add a column of one value per agent.
+        """
+        column = np.empty((self.capacity,) + shape, dtype=dtype)
+        column[:] = default
+        self.columns[name] = column
+        self.defaults[name] = default
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        Returns the values of a column for all agents. Changes to the returned array change the agents.
+        """
+        return self.columns[name][:self.count]
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.columns['x'][:self.count]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.columns['y'][:self.count]
+
+    @property
+    def dead(self) -> np.ndarray:
+        return self.columns['dead'][:self.count]
+
+    @property
+    def color(self) -> np.ndarray:
+        return self.columns['color'][:self.count]
+
+    # --- Birth and death ---
+
+    def spawn(self, xs, ys, **attributes) -> np.ndarray:
+        """
+        Add new agents at the given positions.
+        :param attributes: Initial values of columns, one value for all new agents or one per agent.
+        :returns The indices of the new agents.
+        """
+        xs = np.atleast_1d(np.asarray(xs, dtype=np.int64))
+        ys = np.broadcast_to(np.asarray(ys, dtype=np.int64), xs.shape)
+        n = len(xs)
+        if self.count + n > self.capacity:
+            self.grow(self.count + n)
+        new = slice(self.count, self.count + n)
+        for name, column in self.columns.items():
+            column[new] = attributes.get(name, self.defaults[name])
+        self.columns['x'][new] = xs
+        self.columns['y'][new] = ys
+        self.columns['prev_x'][new] = xs
+        self.columns['prev_y'][new] = ys
+        self.count += n
+        views = [PopulationAgent(self, i) for i in range(new.start, new.stop)]
+        self.views.extend(views)
+        if self.abm is not None:
+            for view in views:
+                self.abm.add_agent_location(view)
+        return np.arange(new.start, new.stop)
+
+    def grow(self, minimum: int):
+        capacity = self.capacity
+        while capacity < minimum:
+            capacity *= 2
+        cab_log.trace('[AgentPopulation] growing from {0} to {1} agents'.format(self.capacity, capacity))
+        for name, column in self.columns.items():
+            grown = np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.capacity] = column
+            grown[self.capacity:] = self.defaults[name]
+            self.columns[name] = grown
+        self.capacity = capacity
+
+    def kill(self, selection):
+        """
+        Mark agents as dead, they are removed at the end of the step.
+        :param selection: Indices or boolean mask of the agents.
+        """
+        self.dead[selection] = True
+
+    def remove_dead(self) -> int:
+        """
+        Remove all dead agents at once, moving the living ones together.
+        :returns The number of removed agents.
+        """
+        alive = ~self.dead
+        survivors = int(alive.sum())
+        removed = self.count - survivors
+        if removed:
+            if self.abm is not None:
+                for i in np.flatnonzero(~alive).tolist():
+                    self.abm.remove_agent_location(self.views[i])
+            for column in self.columns.values():
+                column[:survivors] = column[:self.count][alive]
+            self.count = survivors
+            self.views = [view for view, keep in zip(self.views, alive.tolist()) if keep]
+            for i, view in enumerate(self.views):
+                view.index = i
+        return removed
+
+    # --- Positions ---
+
+    def to_offset(self, xs, ys) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert grid coordinates into array columns and rows, see cab.ca.ca_array.
+        """
+        if self.use_hex:
+            return xs + np.floor_divide(ys, 2), ys
+        return xs, ys
+
+    def from_offset(self, columns, rows) -> Tuple[np.ndarray, np.ndarray]:
+        if self.use_hex:
+            return columns - np.floor_divide(rows, 2), rows
+        return columns, rows
+
+    def move_to(self, xs, ys, selection=None) -> np.ndarray:
+        """
+        Move agents to new positions. Positions beyond the grid wrap around if the CA does, otherwise
+        the agents stay where they are.
+        :param selection: Indices or boolean mask of the agents to move, by default all of them.
+        :returns Boolean mask of the agents that moved, relative to the selection.
+        """
+        if selection is None:
+            selection = slice(0, self.count)
+        columns, rows = self.to_offset(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64))
+        if self.ca.wrap_x:
+            columns = columns % self.width
+        if self.ca.wrap_y:
+            rows = rows % self.height
+        inside = (0 <= columns) & (columns < self.width) & (0 <= rows) & (rows < self.height)
+        xs, ys = self.from_offset(columns, rows)
+        # Copies, a slice of the columns would change along with them.
+        old_x = self.columns['x'][:self.count][selection].copy()
+        old_y = self.columns['y'][:self.count][selection].copy()
+        new_x = np.where(inside, xs, old_x)
+        new_y = np.where(inside, ys, old_y)
+        self.columns['prev_x'][:self.count][selection] = old_x
+        self.columns['prev_y'][:self.count][selection] = old_y
+        self.columns['x'][:self.count][selection] = new_x
+        self.columns['y'][:self.count][selection] = new_y
+        moved = inside & ((new_x != old_x) | (new_y != old_y))
+        if self.abm is not None:
+            # Only the agents that changed their cell are updated in the location map.
+            indices = np.atleast_1d(np.arange(self.count)[selection])
+            for i in indices[np.broadcast_to(moved, indices.shape)].tolist():
+                self.abm.update_agent_position(self.views[i])
+        return moved
+
+    def move_by(self, dx, dy, selection=None) -> np.ndarray:
+        """
+        Move agents by the given offsets in grid coordinates, see move_to.
+        """
+        if selection is None:
+            selection = slice(0, self.count)
+        return self.move_to(self.x[selection] + dx, self.y[selection] + dy, selection)
+
+    def random_walk(self, probability: float = 1.0) -> np.ndarray:
+        """
+        Every agent moves to a random neighboring cell with the given probability.
+        :returns Boolean mask of the agents that moved.
+        """
+        use_moore = self.gc.USE_MOORE_NEIGHBORHOOD
+        if self.use_hex:
+            directions = np.array(cab_array.HEX_AXIAL_DIRECTIONS, dtype=np.int64)
+        else:
+            directions = np.array(cab_array.neighbor_offsets(False, use_moore), dtype=np.int64)
+        choice = directions[self.rng.integers(0, len(directions), self.count)]
+        if probability < 1.0:
+            choice[self.rng.random(self.count) >= probability] = 0
+        return self.move_by(choice[:, 0], choice[:, 1])
+
+    def follow_gradient(self, layer) -> np.ndarray:
+        """
+        Every agent moves to the neighboring cell with the highest value of a field layer, if it is higher.
+        :returns Boolean mask of the agents that moved.
+        """
+        xs, ys = layer.gradient(self.x, self.y)
+        return self.move_to(xs, ys)
+
+    # --- Perception ---
+
+    def sample(self, layer) -> np.ndarray:
+        """
+        Returns the value of a field layer at the position of every agent.
+        """
+        return layer.sample(self.x, self.y)
+
+    def density(self) -> np.ndarray:
+        """
+        Returns the number of living agents per cell, as (rows, columns) array in offset layout.
+        """
+        alive = ~self.dead
+        columns, rows = self.to_offset(self.x[alive], self.y[alive])
+        counts = np.bincount(rows * self.width + columns, minlength=self.width * self.height)
+        return counts.reshape(self.height, self.width)
+
+    def cell_attribute(self, name: str) -> np.ndarray:
+        """
+        Returns an attribute of the cell under every agent. This reads the cell objects one by one,
+        use field layers or grid states for large populations.
+        """
+        grid = self.ca.ca_grid
+        return np.array([getattr(grid[x, y], name) for x, y in zip(self.x.tolist(), self.y.tolist())])
+
+    def agents_at(self, x: int, y: int) -> List[PopulationAgent]:
+        """
+        Returns the living agents at a position, looked up in the location map of the ABM once the population
+        is added to it.
+        """
+        if self.abm is not None:
+            return [agent for agent in self.abm.agents_at(x, y)
+                    if isinstance(agent, PopulationAgent) and agent.population is self and not agent.dead]
+        indices = np.flatnonzero((self.x == x) & (self.y == y) & ~self.dead)
+        return [self.views[i] for i in indices.tolist()]
+
+    # --- Simulation and drawing ---
+
+    def perceive_and_act(self, abm, ca):
+        """
+        Let all agents perceive and act at once. To be implemented by subclasses.
+        """
+        pass
+
+    def cycle(self, abm, ca):
+        self.perceive_and_act(abm, ca)
+        self.remove_dead()
+
+    def drawables(self) -> Iterator[Tuple[int, int, Tuple[int, int, int], int]]:
+        """
+        Yields (x, y, color, size) of all living agents, for the visualizers.
+        """
+        alive = ~self.dead
+        size = self.size
+        for x, y, color in zip(self.x[alive].tolist(), self.y[alive].tolist(), self.color[alive].tolist()):
+            yield x, y, tuple(color), size
+
+    def on_lmb_click(self, index: int, abm, ca):
+        """
+        Executed when the mouse is pointed at an agent and left clicked.
+        """
+        pass
+
+    def on_rmb_click(self, index: int, abm, ca):
+        """
+        Executed when the mouse is pointed at an agent and right clicked.
+        """
+        pass
@@ -0,0 +1,261 @@
+"""
+This module contains agents with continuous positions and the spatial hash to find them.
+Continuous positions are pixel coordinates in the frame of cab.ca.geometry, so a continuous agent is always
+also on the cell under its position, which is its x, y like for every other agent. The space buckets the
+agents in a grid of squares about the size of the typical query radius, so radius and nearest neighbor
+queries only look at the buckets close by. Distances are euclidean and, if the CA wraps around, measured
+the short way across the edges.
+"""
+
+import collections
+import heapq
+import math
+
+from typing import Dict, List, Optional, Tuple
+
+import cab.abm.agent as cab_agent
+import cab.ca.ca_hex as cab_ca_hex
+
+__author__ = 'Michael Wagner'
+
+
+def cell_at(gc, px: float, py: float) -> Tuple[int, int]:
+    """
+    Returns the grid position of the cell that contains the pixel position px, py.
+    """
+    size = gc.CELL_SIZE
+    if gc.USE_HEX_CA:
+        # Cell centers are at (sqrt(3) * (q + r / 2), 3 / 2 * r) * size, see HexGeometry.
+        q, r = cab_ca_hex.CAHex.hex_round((px * math.sqrt(3) / 3 - py / 3) / size, py * 2 / 3 / size)
+        if not gc.USE_CA_BORDERS:
+            # The grid wraps around left and right, hexagons sticking out belong to the other side.
+            i, j = cab_ca_hex.CAHex.to_offset(q, r)
+            q, r = cab_ca_hex.CAHex.from_offset(i % int(gc.GRID_WIDTH / size), j)
+        return q, r
+    return int(math.floor(px / size)), int(math.floor(py / size))
+
+
+class ContinuousAgent(cab_agent.CabAgent):
+    """
+    Agent with a continuous position px, py. It is moved by ContinuousSpace.move, which also updates its cell.
+    """
+
+    def __init__(self, px: float, py: float, gc):
+        super().__init__(*cell_at(gc, px, py), gc)
+        self.px = px
+        self.py = py
+        # Bucket of the spatial hash.
+        self.bucket = None
+
+    def reset(self, px: float, py: float):
+        super().reset(*cell_at(self.gc, px, py))
+        self.px = px
+        self.py = py
+        self.bucket = None
+
+
+class ContinuousSpace:
+    """
+    Spatial hash of continuous agents, see ABM.use_continuous_space.
+    """
+
+    def __init__(self, abm, ca, bucket_size: float):
+        """
+        :param abm: The ABM of the agents, which keeps track of their cells.
+        :param ca: The CA the agents live over, its borders and wrapping apply to the space.
+        :param bucket_size: Minimum edge length of the buckets, ideally the most common query radius.
+            Along an axis that wraps around it is enlarged so the buckets divide the grid evenly.
+        """
+        self.abm = abm
+        self.ca = ca
+        self.gc = ca.sys.gc
+        self.wrap_x = ca.wrap_x
+        self.wrap_y = ca.wrap_y
+        if self.gc.USE_HEX_CA:
+            self.period_x = ca.width * ca.geometry.horiz
+            self.period_y = ca.height * ca.geometry.vert
+        else:
+            self.period_x = ca.width * self.gc.CELL_SIZE
+            self.period_y = ca.height * self.gc.CELL_SIZE
+        self.num_buckets_x = max(1, int(self.period_x // bucket_size)) if self.wrap_x else None
+        self.num_buckets_y = max(1, int(self.period_y // bucket_size)) if self.wrap_y else None
+        self.bucket_w = self.period_x / self.num_buckets_x if self.wrap_x else bucket_size
+        self.bucket_h = self.period_y / self.num_buckets_y if self.wrap_y else bucket_size
+        self.buckets: Dict[Tuple[int, int], List] = collections.defaultdict(list)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    # --- Positions ---
+
+    def wrap(self, px: float, py: float) -> Optional[Tuple[float, float]]:
+        """
+        Returns the position moved into the grid across the edges that wrap around,
+        None if it is outside of the grid.
+        """
+        if self.wrap_x:
+            px %= self.period_x
+        if self.wrap_y:
+            py %= self.period_y
+        if cell_at(self.gc, px, py) not in self.ca.ca_grid:
+            return None
+        return px, py
+
+    def displacement(self, px: float, py: float, qx: float, qy: float) -> Tuple[float, float]:
+        """
+        Returns the vector from p to q, the short way across the edges that wrap around.
+        """
+        dx = qx - px
+        dy = qy - py
+        if self.wrap_x:
+            dx = (dx + self.period_x / 2) % self.period_x - self.period_x / 2
+        if self.wrap_y:
+            dy = (dy + self.period_y / 2) % self.period_y - self.period_y / 2
+        return dx, dy
+
+    def distance(self, px: float, py: float, qx: float, qy: float) -> float:
+        return math.hypot(*self.displacement(px, py, qx, qy))
+
+    # --- Index ---
+
+    def bucket_index(self, bx: int, by: int) -> Tuple[int, int]:
+        if self.wrap_x:
+            bx %= self.num_buckets_x
+        if self.wrap_y:
+            by %= self.num_buckets_y
+        return bx, by
+
+    def bucket_of(self, px: float, py: float) -> Tuple[int, int]:
+        return self.bucket_index(int(math.floor(px / self.bucket_w)), int(math.floor(py / self.bucket_h)))
+
+    def insert(self, agent: ContinuousAgent):
+        agent.bucket = self.bucket_of(agent.px, agent.py)
+        self.buckets[agent.bucket].append(agent)
+        self.count += 1
+
+    def remove(self, agent: ContinuousAgent):
+        bucket = self.buckets.get(agent.bucket)
+        if bucket is not None and agent in bucket:
+            bucket.remove(agent)
+            if not bucket:
+                del self.buckets[agent.bucket]
+            self.count -= 1
+        agent.bucket = None
+
+    def move(self, agent: ContinuousAgent, px: float, py: float) -> bool:
+        """
+        Move an agent to a new position and onto the cell there. Positions beyond the grid wrap around
+        if the CA does, otherwise the agent stays where it is.
+        The agent changes its cell in the ABM right away, so it may move any number of times per step.
+        :returns Whether the agent moved.
+        """
+        wrapped = self.wrap(px, py)
+        if wrapped is None:
+            return False
+        agent.px, agent.py = wrapped
+        bucket = self.bucket_of(agent.px, agent.py)
+        if bucket != agent.bucket:
+            self.remove(agent)
+            self.insert(agent)
+        cell = cell_at(self.gc, agent.px, agent.py)
+        if cell != (agent.x, agent.y):
+            agent.prev_x, agent.prev_y = agent.x, agent.y
+            agent.x, agent.y = cell
+            if agent.bucket is not None:
+                self.abm.update_agent_position(agent)
+            # Nothing left for the ABM to update after the agent acted.
+            agent.prev_x, agent.prev_y = cell
+        return True
+
+    # --- Queries ---
+
+    def bucket_ring(self, bx: int, by: int, ring: int):
+        """
+        Yields the buckets at Chebyshev distance ring from the bucket bx, by, without wrapping them.
+        """
+        if ring == 0:
+            yield bx, by
+            return
+        for i in range(-ring, ring + 1):
+            yield bx + i, by - ring
+            yield bx + i, by + ring
+        for j in range(-ring + 1, ring):
+            yield bx - ring, by + j
+            yield bx + ring, by + j
+
+    def query_radius(self, px: float, py: float, radius: float,
+                     exclude=None) -> List[Tuple[ContinuousAgent, float]]:
+        """
+        Returns all agents within the radius around px, py and their distances, in no particular order.
+        :param exclude: Agent to leave out, usually the one asking.
+        """
+        x0 = int(math.floor((px - radius) / self.bucket_w))
+        x1 = int(math.floor((px + radius) / self.bucket_w))
+        y0 = int(math.floor((py - radius) / self.bucket_h))
+        y1 = int(math.floor((py + radius) / self.bucket_h))
+        columns = range(x0, x1 + 1)
+        rows = range(y0, y1 + 1)
+        # Buckets are wrapped and deduplicated, the range may reach around the whole grid.
+        if self.wrap_x:
+            columns = range(self.num_buckets_x) if len(columns) >= self.num_buckets_x else \
+                [bx % self.num_buckets_x for bx in columns]
+        if self.wrap_y:
+            rows = range(self.num_buckets_y) if len(rows) >= self.num_buckets_y else \
+                [by % self.num_buckets_y for by in rows]
+        found = []
+        buckets = self.buckets
+        # The displacement is inlined, this loop is the hot spot of neighbor searches.
+        period_x = self.period_x if self.wrap_x else None
+        period_y = self.period_y if self.wrap_y else None
+        squared_radius = radius * radius
+        for by in rows:
+            for bx in columns:
+                bucket = buckets.get((bx, by))
+                if bucket is None:
+                    continue
+                for agent in bucket:
+                    dx = agent.px - px
+                    dy = agent.py - py
+                    if period_x is not None:
+                        dx = (dx + period_x / 2) % period_x - period_x / 2
+                    if period_y is not None:
+                        dy = (dy + period_y / 2) % period_y - period_y / 2
+                    squared = dx * dx + dy * dy
+                    if squared <= squared_radius and agent is not exclude:
+                        found.append((agent, math.sqrt(squared)))
+        return found
+
+    def nearest(self, px: float, py: float, k: int, exclude=None,
+                max_radius: float = math.inf) -> List[Tuple[ContinuousAgent, float]]:
+        """
+        Returns the k agents closest to px, py and their distances, closest first.
+        Buckets are searched ring by ring until no unsearched bucket can be closer than the k-th agent.
+        :param exclude: Agent to leave out, usually the one asking.
+        :param max_radius: Only agents within this distance are returned.
+        """
+        total = self.count - (1 if exclude is not None and exclude.bucket is not None else 0)
+        if total <= 0 or k <= 0:
+            return []
+        bx, by = int(math.floor(px / self.bucket_w)), int(math.floor(py / self.bucket_h))
+        seen = set()
+        candidates = []
+        ring = 0
+        while True:
+            for key in self.bucket_ring(bx, by, ring):
+                key = self.bucket_index(*key)
+                if key in seen:
+                    continue
+                seen.add(key)
+                for agent in self.buckets.get(key, ()):
+                    if agent is not exclude:
+                        candidates.append((self.distance(px, py, agent.px, agent.py), agent))
+            # Every bucket that has not been searched is at least this far away.
+            bound = ring * min(self.bucket_w, self.bucket_h)
+            if bound > max_radius or len(candidates) == total:
+                break
+            if len(candidates) >= k and heapq.nsmallest(k, candidates, key=lambda c: c[0])[-1][0] <= bound:
+                break
+            ring += 1
+        candidates.sort(key=lambda entry: entry[0])
+        return [(agent, distance) for distance, agent in candidates[:k] if distance <= max_radius]
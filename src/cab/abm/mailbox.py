@@ -0,0 +1,111 @@
+"""
+This module contains the mailbox of the ABM, through which agents send messages to cells.
+Messages posted during a step, to one cell or to all cells within a radius, are buffered in a flat list.
+At the start of the next step they are sorted by cell, sender and the order in which each sender posted them,
+and delivered all at once, so what an agent receives neither depends on the order in which the agents acted
+nor changes while they act. Agents read the messages of a cell instead of looking up and calling each other.
+"""
+
+import collections
+
+from typing import Dict, List, Tuple
+
+__author__ = 'Michael Wagner'
+
+
+Message = collections.namedtuple('Message', ['sender_id', 'x', 'y', 'topic', 'content'])
+Message.__doc__ = 'A message to the cell x, y. sender_id is the a_id of the sending agent or None.'
+
+
+def sender_key(sender_id) -> Tuple:
+    """
+    Returns the sort key of a sender id: agent ids in numeric order, then other ids by their string,
+    then messages without sender.
+    """
+    if sender_id is None:
+        return 2, 0, ''
+    if isinstance(sender_id, int):
+        return 0, sender_id, ''
+    return 1, 0, str(sender_id)
+
+
+class Mailbox:
+    """
+    Outgoing messages of the current step and delivered messages of the previous one.
+    Delivered messages are stored as one list sorted by cell, with the range of every cell in it.
+    """
+
+    def __init__(self):
+        self.outgoing: List[Tuple] = list()
+        # Number of messages every sender posted in this step, to order its messages.
+        self.sent: Dict = collections.defaultdict(int)
+        self.delivered: List[Message] = list()
+        self.ranges: Dict[Tuple[int, int], Tuple[int, int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.delivered)
+
+    def post(self, sender_id, x: int, y: int, topic: str, content=None):
+        """
+        Send a message to the cell x, y, which is delivered in the next step.
+        """
+        self.post_all(sender_id, [(x, y)], topic, content)
+
+    def broadcast(self, ca, sender_id, x: int, y: int, radius: int, topic: str, content=None):
+        """
+        Send a message to all cells within the given number of neighborhood steps of the cell x, y,
+        including the cell itself. The neighborhood, borders and wrapping of the CA apply.
+        """
+        self.post_all(sender_id, self.cells_within(ca, x, y, radius), topic, content)
+
+    def post_all(self, sender_id, positions, topic: str, content=None):
+        n = self.sent[sender_id]
+        self.sent[sender_id] = n + 1
+        key = sender_key(sender_id)
+        for (x, y) in positions:
+            self.outgoing.append((y, x, key, n, Message(sender_id, x, y, topic, content)))
+
+    @staticmethod
+    def cells_within(ca, x: int, y: int, radius: int) -> List[Tuple[int, int]]:
+        """
+        Returns the positions reached from x, y in up to radius steps along the neighbors of the cells.
+        """
+        if (x, y) not in ca.ca_grid:
+            return []
+        seen = {(x, y)}
+        frontier = [(x, y)]
+        for _ in range(radius):
+            reached = []
+            for pos in frontier:
+                for neighbor in ca.ca_grid[pos].neighbors:
+                    if (neighbor.x, neighbor.y) not in seen:
+                        seen.add((neighbor.x, neighbor.y))
+                        reached.append((neighbor.x, neighbor.y))
+            frontier = reached
+        return list(seen)
+
+    def deliver(self):
+        """
+        Replace the delivered messages by the ones posted since the last delivery.
+        """
+        self.outgoing.sort(key=lambda entry: entry[:4])
+        self.delivered = [entry[4] for entry in self.outgoing]
+        self.ranges = dict()
+        start = 0
+        for i in range(1, len(self.delivered) + 1):
+            if i == len(self.delivered) or self.outgoing[i][:2] != self.outgoing[start][:2]:
+                message = self.delivered[start]
+                self.ranges[message.x, message.y] = (start, i)
+                start = i
+        self.outgoing = list()
+        self.sent.clear()
+
+    def receive(self, x: int, y: int, topic: str = None) -> List[Message]:
+        """
+        Returns the messages delivered to the cell x, y in this step, optionally only those of a topic.
+        """
+        start, stop = self.ranges.get((x, y), (0, 0))
+        messages = self.delivered[start:stop]
+        if topic is not None:
+            messages = [message for message in messages if message.topic == topic]
+        return messages
@@ -0,0 +1,105 @@
+"""
+This module contains the occupancy index of the ABM.
+Every cell has an index in offset layout, row * width + column (see cab.ca.ca_array), which is also the order
+in which the CAs create their cells. The index counts the agents per cell and keeps the free cells in an
+array with swap-remove, so a random free cell, the number of free cells and whether a cell is free are
+answered in O(1), and a random free neighbor in O(number of neighbors).
+"""
+
+from array import array
+from typing import List, Optional, Tuple
+
+__author__ = 'Michael Wagner'
+
+
+class OccupancyIndex:
+    """
+    Agents per cell and the set of free cells.
+    """
+
+    def __init__(self, gc):
+        """
+        :param gc: Global constants, the grid size is derived the same way the CAs do.
+        """
+        self.use_hex = gc.USE_HEX_CA
+        self.width = int(gc.GRID_WIDTH / gc.CELL_SIZE)
+        self.height = int(gc.GRID_HEIGHT / gc.CELL_SIZE)
+        num_cells = self.width * self.height
+        # Number of agents per cell. With ONE_AGENT_PER_CELL this is the occupancy bitmap.
+        self.counts = array('l', bytes(array('l').itemsize * num_cells))
+        # Free cells in arbitrary order, and the slot of every cell in it, -1 if the cell is occupied.
+        self.free = array('l', range(num_cells))
+        self.slots = array('l', range(num_cells))
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+    def to_index(self, x: int, y: int) -> int:
+        if self.use_hex:
+            return y * self.width + x + y // 2
+        return y * self.width + x
+
+    def from_index(self, index: int) -> Tuple[int, int]:
+        row, column = divmod(index, self.width)
+        if self.use_hex:
+            return column - row // 2, row
+        return column, row
+
+    def contains(self, x: int, y: int) -> bool:
+        if not 0 <= y < self.height:
+            return False
+        column = x + y // 2 if self.use_hex else x
+        return 0 <= column < self.width
+
+    def is_free(self, x: int, y: int) -> bool:
+        return self.counts[self.to_index(x, y)] == 0
+
+    def occupy(self, x: int, y: int):
+        """
+        Count an agent that entered the cell. Positions outside of the grid are ignored.
+        """
+        if not self.contains(x, y):
+            return
+        index = self.to_index(x, y)
+        self.counts[index] += 1
+        if self.counts[index] == 1:
+            # Swap-remove the cell from the free cells.
+            slot = self.slots[index]
+            last = self.free[-1]
+            self.free[slot] = last
+            self.slots[last] = slot
+            self.free.pop()
+            self.slots[index] = -1
+
+    def vacate(self, x: int, y: int):
+        """
+        Count an agent that left the cell.
+        """
+        if not self.contains(x, y):
+            return
+        index = self.to_index(x, y)
+        self.counts[index] -= 1
+        if self.counts[index] == 0:
+            self.slots[index] = len(self.free)
+            self.free.append(index)
+
+    def random_free_position(self, rng) -> Optional[Tuple[int, int]]:
+        """
+        Returns a random free cell, None if all cells are occupied.
+        """
+        if not self.free:
+            return None
+        return self.from_index(self.free[rng.randrange(len(self.free))])
+
+    def free_neighbors(self, ca, x: int, y: int) -> List[Tuple[int, int]]:
+        return [pos for pos in ca.neighbor_positions(x, y)
+                if self.contains(*pos) and self.counts[self.to_index(*pos)] == 0]
+
+    def random_free_neighbor(self, ca, x: int, y: int, rng) -> Optional[Tuple[int, int]]:
+        """
+        Returns a random free neighbor of the cell, None if all neighbors are occupied.
+        """
+        free = self.free_neighbors(ca, x, y)
+        if not free:
+            return None
+        return free[rng.randrange(len(free))]
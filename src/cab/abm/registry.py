@@ -0,0 +1,115 @@
+"""
+This module contains the registry of the ABM, which indexes the agents by class and tag.
+Agent classes declare tags in TAGS and numeric attributes to be summed up in AGGREGATED_ATTRIBUTES.
+The ABM updates the registry whenever agents are added, removed or have acted, so counting the agents of
+a class and summing their attributes takes O(1), and iterating over them takes O(number of such agents).
+"""
+
+import collections
+
+from typing import Dict, Set, Tuple
+
+__author__ = 'Michael Wagner'
+
+
+class AgentRegistry:
+    """
+    Agents by class, including base classes, and by tag, plus sums of their aggregated attributes.
+    """
+
+    def __init__(self):
+        self.by_class: Dict[type, Set] = collections.defaultdict(set)
+        self.by_tag: Dict[str, Set] = collections.defaultdict(set)
+        # Sums per class and attribute, and the values every agent contributed to them.
+        self.sums: Dict[Tuple[type, str], float] = collections.defaultdict(float)
+        self.contributions: Dict = dict()
+        self.tags: Dict = dict()
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def __contains__(self, agent) -> bool:
+        return agent in self.tags
+
+    @staticmethod
+    def classes(agent):
+        return type(agent).__mro__[:-1]
+
+    def add(self, agent):
+        if agent in self.tags:
+            return
+        for cls in self.classes(agent):
+            self.by_class[cls].add(agent)
+        tags = set(getattr(agent, 'TAGS', ()))
+        for tag in tags:
+            self.by_tag[tag].add(agent)
+        self.tags[agent] = tags
+        self.contributions[agent] = dict()
+        self.update(agent)
+
+    def remove(self, agent):
+        if agent not in self.tags:
+            return
+        for cls in self.classes(agent):
+            self.by_class[cls].discard(agent)
+        for tag in self.tags.pop(agent):
+            self.by_tag[tag].discard(agent)
+        for name, value in self.contributions.pop(agent).items():
+            for cls in self.classes(agent):
+                self.sums[cls, name] -= value
+
+    def update(self, agent):
+        """
+        Update the sums with the current values of the aggregated attributes of the agent.
+        """
+        contributed = self.contributions.get(agent)
+        if contributed is None:
+            return
+        for name in getattr(agent, 'AGGREGATED_ATTRIBUTES', ()):
+            value = getattr(agent, name)
+            delta = value - contributed.get(name, 0)
+            if delta:
+                contributed[name] = value
+                for cls in self.classes(agent):
+                    self.sums[cls, name] += delta
+
+    def add_tag(self, agent, tag: str):
+        if agent in self.tags:
+            self.tags[agent].add(tag)
+            self.by_tag[tag].add(agent)
+
+    def remove_tag(self, agent, tag: str):
+        if agent in self.tags:
+            self.tags[agent].discard(tag)
+            self.by_tag[tag].discard(agent)
+
+    def has_tag(self, agent, tag: str) -> bool:
+        return tag in self.tags.get(agent, ())
+
+    def get_agents(self, cls: type = None, tag: str = None) -> Set:
+        """
+        Returns the agents of a class and/or with a tag, without copying them if only one is given.
+        The set must not be changed, and not be iterated over while agents are added or removed.
+        """
+        if cls is None and tag is None:
+            return set(self.tags)
+        if tag is None:
+            return self.by_class.get(cls, set())
+        if cls is None:
+            return self.by_tag.get(tag, set())
+        return self.by_class.get(cls, set()) & self.by_tag.get(tag, set())
+
+    def count(self, cls: type = None, tag: str = None) -> int:
+        if cls is None and tag is None:
+            return len(self.tags)
+        return len(self.get_agents(cls, tag))
+
+    def sum(self, cls: type, name: str) -> float:
+        """
+        Returns the sum of an aggregated attribute over all agents of the class.
+        """
+        return self.sums.get((cls, name), 0)
+
+    def mean(self, cls: type, name: str) -> float:
+        count = self.count(cls)
+        return self.sum(cls, name) / count if count else 0.0
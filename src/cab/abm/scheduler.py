@@ -0,0 +1,111 @@
+"""
+This module contains the discrete-event scheduler of the ABM.
+Instead of letting every agent act in every step, agents are kept in a priority queue ordered by the time
+step they want to act next. Agents that wait for an event are woken up when it is triggered.
+The cost of a step thereby depends on the number of agents that act, not on the number of agents.
+"""
+
+import collections
+import heapq
+import itertools
+
+from typing import Dict, List
+
+__author__ = 'Michael Wagner'
+
+
+class EventScheduler:
+    """
+    Priority queue of agents by wake-up time, plus the agents waiting for each event.
+    Every agent has at most one valid schedule entry. Rescheduling an agent invalidates its older entries
+    in the queue, which are skipped when they come up instead of being searched for and removed.
+    An agent waits for at most one event, its entry there is removed as soon as it is rescheduled.
+    """
+
+    def __init__(self):
+        self.queue = []
+        # Waiting agents and their schedule entries per event.
+        self.waiting: Dict[str, Dict] = collections.defaultdict(dict)
+        # The event each waiting agent waits for.
+        self.events: Dict = dict()
+        # Current schedule entry per agent.
+        self.tokens: Dict = dict()
+        self.counter = itertools.count()
+        # The last time step that has been processed.
+        self.now = -1
+        # Agents killed since the ABM last removed its dead agents, see CabAgent.dead.
+        # Agents keep a reference to the list, so it is only ever emptied, never replaced.
+        self.killed: List = list()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def schedule(self, agent, time_step: int = None, event: str = None):
+        """
+        Schedule an agent. Without time step and event it acts in the next step.
+        :param time_step: The agent acts in this time step, or in the next one if it already passed.
+        :param event: The agent acts in the step after this event is triggered.
+        """
+        token = next(self.counter)
+        self.tokens[agent] = token
+        self.stop_waiting(agent)
+        if event is not None:
+            self.waiting[event][agent] = token
+            self.events[agent] = event
+        if time_step is not None or event is None:
+            time_step = self.now + 1 if time_step is None else max(time_step, self.now + 1)
+            heapq.heappush(self.queue, (time_step, token, agent))
+
+    def reschedule(self, agent):
+        """
+        Schedule an agent after it acted, as requested by its wake_time and waiting_for attributes.
+        """
+        time_step, event = agent.wake_time, agent.waiting_for
+        agent.wake_time = None
+        agent.waiting_for = None
+        self.schedule(agent, time_step, event)
+
+    def unschedule(self, agent):
+        """
+        Forget an agent, e.g. when it is removed. Its entry in the queue is skipped when it comes up.
+        """
+        self.tokens.pop(agent, None)
+        self.stop_waiting(agent)
+
+    def stop_waiting(self, agent):
+        event = self.events.pop(agent, None)
+        if event is not None:
+            agents = self.waiting[event]
+            del agents[agent]
+            if not agents:
+                del self.waiting[event]
+
+    def trigger(self, event: str):
+        """
+        Wake up all agents waiting for the event in the next step.
+        """
+        for agent, token in list(self.waiting.get(event, {}).items()):
+            if self.tokens.get(agent) == token:
+                self.schedule(agent)
+
+    def pop_killed(self) -> List:
+        """
+        Remove and return the agents killed since the last call.
+        """
+        killed = list(self.killed)
+        self.killed.clear()
+        return killed
+
+    def pop_due(self, time_step: int) -> List:
+        """
+        Remove and return all agents that act in the given time step, in the order they were scheduled.
+        """
+        self.now = time_step
+        due = []
+        while self.queue and self.queue[0][0] <= time_step:
+            _, token, agent = heapq.heappop(self.queue)
+            if self.tokens.get(agent) == token:
+                del self.tokens[agent]
+                self.stop_waiting(agent)
+                due.append(agent)
+        return due
@@ -0,0 +1,295 @@
+"""
+This module contains the two-phase execution of agents.
+In the propose phase every agent looks at a frozen snapshot of the world and returns the actions it intends
+to take, which can happen in parallel since nothing changes in the meantime. In the commit phase a resolver
+applies all actions and settles conflicts, like two agents claiming the same cell, with a random number
+generator that is seeded by the simulation seed and the time step, so runs are reproducible.
+Actions refer to agents by their a_id, because with a process pool the agents returning them are copies.
+Spawned agents get their ids when they are added, since ids drawn in parallel workers would collide.
+The process pool stays alive for the whole simulation. Its workers are forked once and keep a replica of
+the CA with the wiring of its cells, which is brought up to date with the states of the cells and of the
+grid states every step, see ProcessPool.
+"""
+
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import pickle
+import random
+
+from typing import Dict, List, Sequence, Tuple
+
+import cab.abm.agent as cab_agent
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+Move = collections.namedtuple('Move', ['agent_id', 'x', 'y'])
+Move.__doc__ = 'Move the agent to the cell x, y.'
+Spawn = collections.namedtuple('Spawn', ['agent_id', 'new_agent'])
+Spawn.__doc__ = 'Add a new agent at its own position.'
+Die = collections.namedtuple('Die', ['agent_id'])
+Die.__doc__ = 'Remove the agent from the simulation.'
+ModifyCell = collections.namedtuple('ModifyCell', ['agent_id', 'x', 'y', 'changes'])
+ModifyCell.__doc__ = 'Set the attributes of the cell x, y given in the dictionary changes.'
+SetAttributes = collections.namedtuple('SetAttributes', ['agent_id', 'changes'])
+SetAttributes.__doc__ = 'Set the attributes of the agent itself given in the dictionary changes.'
+Send = collections.namedtuple('Send', ['agent_id', 'x', 'y', 'radius', 'topic', 'content'])
+Send.__doc__ = 'Post a message to the cells within radius of x, y, see cab.abm.mailbox.'
+
+WorldSnapshot = collections.namedtuple('WorldSnapshot', ['time_step', 'ca', 'occupants', 'mailbox'])
+WorldSnapshot.__doc__ = """
+The world as seen by all agents in the propose phase.
+occupants maps every occupied position to a tuple of the agents there.
+mailbox holds the messages delivered in this step, read them with mailbox.receive and send with Send actions.
+The CA must only be read, its cells are not changed before all proposals are in.
+"""
+
+
+def take_snapshot(abm, ca) -> WorldSnapshot:
+    occupants = dict()
+    for pos, entry in abm.agent_locations.items():
+        occupants[pos] = (entry,) if abm.gc.ONE_AGENT_PER_CELL else tuple(entry)
+    return WorldSnapshot(abm.gc.TIME_STEP, ca, occupants, abm.mailbox)
+
+
+def propose_chunk(agents: Sequence, snapshot: WorldSnapshot) -> List[List[tuple]]:
+    return [list(agent.propose(snapshot) or []) for agent in agents]
+
+
+def can_fork() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def cell_states(ca) -> List[Tuple[Tuple[int, int], Dict]]:
+    """
+    Returns the attributes of all cells that are not fixed by their place on the grid.
+    """
+    import cab.ca.ca_chunked as cab_chunk
+    return [(pos, {name: value for name, value in cell.__dict__.items() if name not in cab_chunk.LAYOUT_ATTRIBUTES})
+            for pos, cell in ca.ca_grid.items()]
+
+
+def grid_state_contents(ca) -> List[Tuple[str, int, object]]:
+    """
+    Returns name, current generation and values of every grid state of the CA. Memory-mapped values are
+    left out, forked workers map the same files.
+    """
+    import numpy as np
+    return [(name, state.current, None if isinstance(state.read, np.memmap) else state.read)
+            for name, state in ca.grid_states.items()]
+
+
+# The CA the worker processes of the pool were forked with, and their replica of it.
+_replica_ca = None
+# Key of the world the replica was last brought up to date with, its agents and snapshot.
+_synced_world = (None, None, None)
+
+
+def propose_synced_chunk(key: int, world: bytes, r0: int, r1: int) -> List[List[tuple]]:
+    """
+    Run in a worker process: bring the replica up to date with the world of the current step, once per step,
+    and collect the actions of the agents r0 to r1.
+    """
+    global _synced_world
+    if _synced_world[0] != key:
+        import numpy as np
+        agents, time_step, occupants, mailbox, cells, grid_states = pickle.loads(world)
+        ca = _replica_ca
+        for pos, state in cells:
+            ca.ca_grid[pos].__dict__.update(state)
+        for name, current, values in grid_states:
+            state = ca.grid_states[name]
+            state.current = current
+            if values is not None:
+                np.copyto(state.read, values)
+        _synced_world = (key, agents, WorldSnapshot(time_step, ca, occupants, mailbox))
+    _, agents, snapshot = _synced_world
+    return propose_chunk(agents[r0:r1], snapshot)
+
+
+class ProcessPool:
+    """
+    Worker processes for the propose phase that stay alive for the whole simulation.
+    The workers are forked with the CA, so they share its cells and their wiring without pickling them.
+    Every step they receive the agents, the occupants, the mailbox and the states of the cells and grid states,
+    pickled once for all of them. States of rule engines are not sent, agents can't rely on them while proposing.
+    A pool only serves the CA it was forked with and as long as the CA has no new grid states or field layers,
+    see is_current.
+    """
+
+    def __init__(self, ca, num_workers: int):
+        global _replica_ca
+        _replica_ca = ca
+        self.ca = ca
+        self.layout = self.ca_layout(ca)
+        self.keys = itertools.count()
+        self.executor = concurrent.futures.ProcessPoolExecutor(num_workers,
+                                                               mp_context=multiprocessing.get_context('fork'))
+
+    @staticmethod
+    def ca_layout(ca) -> Tuple:
+        return tuple(ca.grid_states), tuple(ca.field_layers)
+
+    def is_current(self, ca) -> bool:
+        return ca is self.ca and _replica_ca is ca and self.ca_layout(ca) == self.layout
+
+    def submit(self, agents: List, snapshot: WorldSnapshot, bounds: List[Tuple[int, int]]) -> List:
+        world = pickle.dumps((agents, snapshot.time_step, snapshot.occupants, snapshot.mailbox,
+                              cell_states(snapshot.ca), grid_state_contents(snapshot.ca)),
+                             protocol=pickle.HIGHEST_PROTOCOL)
+        key = next(self.keys)
+        return [self.executor.submit(propose_synced_chunk, key, world, r0, r1) for (r0, r1) in bounds]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def propose_all(agents: List, snapshot: WorldSnapshot, executor: str = None, num_workers: int = 4,
+                thread_pool: concurrent.futures.ThreadPoolExecutor = None,
+                process_pool: ProcessPool = None) -> List[List[tuple]]:
+    """
+    Collect the actions of all agents.
+    :param agents: The agents, in a deterministic order.
+    :param snapshot: The world they perceive.
+    :param executor: "thread", "process" or None to run in the calling thread.
+    :param num_workers: Number of threads or processes.
+    :param thread_pool: Pool to use for the "thread" executor.
+    :param process_pool: Pool to use for the "process" executor, forked with the CA of the snapshot.
+    :returns One list of actions per agent.
+    """
+    chunk_size = max(1, -(-len(agents) // (4 * num_workers)))
+    bounds = [(r0, min(len(agents), r0 + chunk_size)) for r0 in range(0, len(agents), chunk_size)]
+    if executor == 'process' and process_pool is None:
+        cab_log.trace('[TwoPhase] no process pool, proposing in the calling thread')
+        executor = None
+    if executor == 'thread':
+        futures = [thread_pool.submit(propose_chunk, agents[r0:r1], snapshot) for (r0, r1) in bounds]
+    elif executor == 'process':
+        futures = process_pool.submit(agents, snapshot, bounds)
+    else:
+        return propose_chunk(agents, snapshot)
+    proposals = []
+    for future in futures:
+        proposals.extend(future.result())
+    return proposals
+
+
+class Resolver:
+    """
+    Applies the actions of one step in a deterministic order:
+    deaths, moves, spawns, cell modifications, attribute changes and finally messages.
+    """
+
+    def __init__(self, seed, time_step: int, one_agent_per_cell: bool):
+        self.rng = random.Random('{0}:{1}'.format(seed, time_step))
+        self.one_agent_per_cell = one_agent_per_cell
+
+    def pick(self, candidates: List):
+        """
+        Returns the winner of a conflict. Candidates must be given in a deterministic order.
+        """
+        return candidates[self.rng.randrange(len(candidates))]
+
+    def resolve(self, abm, ca, agents: List, proposals: List[List[tuple]]):
+        """
+        :param abm: The ABM to commit to.
+        :param ca: The CA to commit to.
+        :param agents: The agents, in the order they proposed.
+        :param proposals: The actions of every agent.
+        """
+        by_id = {agent.a_id: agent for agent in agents}
+        actions = collections.defaultdict(list)
+        for agent, proposed in zip(agents, proposals):
+            for action in proposed:
+                if action.agent_id != agent.a_id:
+                    cab_log.trace('[TwoPhase] {0} proposed an action of another agent'.format(agent.a_id))
+                    continue
+                actions[type(action)].append(action)
+
+        # The dead leave their cells at once, so others can move there and the occupancy index stays right.
+        for action in actions[Die]:
+            agent = by_id[action.agent_id]
+            agent.dead = True
+            abm.remove_agent_location(agent)
+
+        self.resolve_moves(abm, ca, by_id, actions[Move])
+
+        for action in actions[Spawn]:
+            agent = by_id[action.agent_id]
+            new_agent = action.new_agent
+            pos = (new_agent.x, new_agent.y)
+            if self.one_agent_per_cell and pos in abm.agent_locations:
+                cab_log.trace('[TwoPhase] spawn of {0} at occupied {1} dropped'.format(agent.a_id, pos))
+                continue
+            new_agent.a_id = cab_agent.next_agent_id(abm.gc)
+            # Agents created in a worker process bring their own copy of the constants.
+            new_agent.gc = abm.gc
+            abm.add_agent(new_agent)
+
+        # Conflicting changes of the same attribute of a cell are settled by picking one of them.
+        contested: Dict[Tuple[int, int, str], List] = collections.defaultdict(list)
+        for action in actions[ModifyCell]:
+            for attribute, value in action.changes.items():
+                contested[action.x, action.y, attribute].append(value)
+        for (x, y, attribute), values in contested.items():
+            if (x, y) in ca.ca_grid:
+                setattr(ca.ca_grid[x, y], attribute, self.pick(values))
+
+        for action in actions[SetAttributes]:
+            agent = by_id[action.agent_id]
+            for attribute, value in action.changes.items():
+                setattr(agent, attribute, value)
+
+        for action in actions[Send]:
+            abm.mailbox.broadcast(ca, action.agent_id, action.x, action.y, action.radius, action.topic,
+                                  action.content)
+
+    def resolve_moves(self, abm, ca, by_id: Dict, moves: List[Move]):
+        """
+        Move all agents whose target is valid. With one agent per cell each target is given to one
+        claimant, and a move only succeeds if the target is free after all other moves,
+        so chains and cycles of agents moving along are allowed.
+        """
+        claims = collections.OrderedDict()
+        for move in moves:
+            agent = by_id[move.agent_id]
+            if agent.dead or (move.x, move.y) not in ca.ca_grid or (move.x, move.y) == (agent.x, agent.y):
+                continue
+            claims.setdefault((move.x, move.y), []).append(agent)
+        targets = dict()
+        for pos, claimants in claims.items():
+            if self.one_agent_per_cell:
+                targets[self.pick(claimants)] = pos
+            else:
+                for agent in claimants:
+                    targets[agent] = pos
+
+        if self.one_agent_per_cell:
+            blocked = True
+            while blocked:
+                blocked = False
+                for agent, pos in list(targets.items()):
+                    occupant = abm.agent_locations.get(pos)
+                    if occupant is not None and occupant not in targets:
+                        del targets[agent]
+                        blocked = True
+
+        for agent, (x, y) in targets.items():
+            agent.prev_x, agent.prev_y = agent.x, agent.y
+            agent.x, agent.y = x, y
+        if self.one_agent_per_cell:
+            # All movers leave before anyone arrives, otherwise agents moving along would overwrite each other.
+            for agent in targets:
+                abm.agent_locations.pop((agent.prev_x, agent.prev_y))
+                if abm.occupancy is not None:
+                    abm.occupancy.vacate(agent.prev_x, agent.prev_y)
+            for agent in targets:
+                abm.agent_locations[agent.x, agent.y] = agent
+                if abm.occupancy is not None:
+                    abm.occupancy.occupy(agent.x, agent.y)
+        else:
+            for agent in targets:
+                abm.update_agent_position(agent)
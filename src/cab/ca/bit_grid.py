@@ -0,0 +1,245 @@
+"""
+This module contains a bit-packed backend for two-state rectangular CAs.
+Every row of the grid is stored as 64-bit words, column x being bit x % 64 of word x // 64, so a
+4096 x 4096 grid takes 2 MB. Neighbor counts are computed for 64 cells at once by adding the shifted
+rows with bitwise adders, and the rule is applied by comparing the resulting bit-sliced counters.
+Cells are only unpacked on demand, e.g. for updating the colors of the cells that changed.
+"""
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+import cab.ca.rule_engine as cab_rule
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+WORD_BITS = 64
+# Bits of the neighbor counters, enough for the 8 neighbors of the Moore neighborhood.
+COUNTER_BITS = 4
+# Number of words that are stepped at once.
+TILE_WORDS = 16384
+
+
+def pack_rows(cells: np.ndarray) -> np.ndarray:
+    """
+    Pack a boolean array of shape (rows, width) into words of shape (rows, ceil(width / 64)).
+    """
+    height, width = cells.shape
+    num_words = (width + WORD_BITS - 1) // WORD_BITS
+    padded = np.zeros((height, num_words * WORD_BITS), dtype=np.uint8)
+    padded[:, :width] = cells
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+
+def unpack_rows(words: np.ndarray, width: int) -> np.ndarray:
+    """
+    Unpack words of shape (rows, num_words) into a boolean array of shape (rows, width).
+    """
+    bits = np.unpackbits(np.ascontiguousarray(words, dtype='<u8').view(np.uint8), axis=1, bitorder='little')
+    return bits[:, :width].astype(bool)
+
+
+class BitGrid:
+    """
+    Steps a two-state rule on a bit-packed copy of a rectangular CA.
+    """
+
+    def __init__(self, ca, rule, palette: Sequence[Tuple[int, int, int]] = None, sync_colors: bool = True):
+        """
+        :param ca: The CA to step.
+        :param rule: A two-state cab.ca.rule_engine.TotalisticRule or its B/S notation.
+        :param palette: Colors of dead and living cells.
+        :param sync_colors: Whether the colors of changed cells are updated after every generation.
+        """
+        gc = ca.sys.gc
+        if gc.USE_HEX_CA:
+            raise ValueError('bit-packed grids are only available for rectangular CAs')
+        if isinstance(rule, str):
+            rule = cab_rule.TotalisticRule.parse(rule)
+        if not rule.is_two_state():
+            raise ValueError('bit-packed grids need a two-state rule in B/S notation')
+        self.ca = ca
+        self.rule = rule
+        self.use_moore = gc.USE_MOORE_NEIGHBORHOOD
+        self.width = ca.width
+        self.height = ca.height
+        self.wrap_x = ca.wrap_x
+        self.wrap_y = ca.wrap_y
+        self.palette = list(palette) if palette is not None else cab_rule.default_palette(gc, 2)
+        self.sync_colors = sync_colors
+        self.num_words = (self.width + WORD_BITS - 1) // WORD_BITS
+        self.words = np.zeros((self.height, self.num_words), dtype=np.uint64)
+        # Clears the padding bits beyond the last column.
+        self.last_word_mask = np.uint64((1 << (self.width - (self.num_words - 1) * WORD_BITS)) - 1)
+        cab_log.trace('[BitGrid] {0} rows of {1} words'.format(self.height, self.num_words))
+
+    def get_state(self, x: int, y: int) -> int:
+        return int(self.words[y, x // WORD_BITS] >> np.uint64(x % WORD_BITS)) & 1
+
+    def set_state(self, x: int, y: int, value: int):
+        bit = np.uint64(1 << (x % WORD_BITS))
+        if value:
+            self.words[y, x // WORD_BITS] |= bit
+        else:
+            self.words[y, x // WORD_BITS] &= ~bit
+        if self.sync_colors:
+            self.ca.ca_grid[x, y].color = self.palette[1 if value else 0]
+
+    def load_from_cells(self, get_state):
+        """
+        Initialize the states from the cells.
+        :param get_state: Function that returns whether a cell is alive.
+        """
+        cells = np.zeros((self.height, self.width), dtype=bool)
+        for (x, y), cell in self.ca.ca_grid.items():
+            cells[y, x] = bool(get_state(cell))
+        self.words = pack_rows(cells).astype(np.uint64)
+        if self.sync_colors:
+            self.sync_all_colors()
+
+    def unpack(self, r0: int = 0, r1: int = None) -> np.ndarray:
+        """
+        Returns the states of rows r0 to r1 as boolean array of shape (rows, width).
+        """
+        return unpack_rows(self.words[r0:r1], self.width)
+
+    def population(self) -> int:
+        return int(np.unpackbits(self.words.view(np.uint8)).sum())
+
+    # --- Shifted copies of the grid ---
+
+    def from_left(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Returns the rows with every cell holding the state of its left neighbor.
+        """
+        out = rows << np.uint64(1)
+        out[:, 1:] |= rows[:, :-1] >> np.uint64(WORD_BITS - 1)
+        if self.wrap_x:
+            last = (self.width - 1) % WORD_BITS
+            out[:, 0] |= (rows[:, -1] >> np.uint64(last)) & np.uint64(1)
+        out[:, -1] &= self.last_word_mask
+        return out
+
+    def from_right(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Returns the rows with every cell holding the state of its right neighbor.
+        """
+        out = rows >> np.uint64(1)
+        out[:, :-1] |= rows[:, 1:] << np.uint64(WORD_BITS - 1)
+        if self.wrap_x:
+            last = (self.width - 1) % WORD_BITS
+            out[:, -1] |= (rows[:, 0] & np.uint64(1)) << np.uint64(last)
+        return out
+
+    def read_block(self, r0: int, r1: int) -> np.ndarray:
+        """
+        Returns rows r0 to r1 with one halo row above and below, wrapped around or dead beyond the grid.
+        """
+        if r0 > 0 and r1 < self.height:
+            return self.words[r0 - 1:r1 + 1]
+        block = np.zeros((r1 - r0 + 2, self.num_words), dtype=np.uint64)
+        block[1:-1] = self.words[r0:r1]
+        if r0 > 0:
+            block[0] = self.words[r0 - 1]
+        elif self.wrap_y:
+            block[0] = self.words[-1]
+        if r1 < self.height:
+            block[-1] = self.words[r1]
+        elif self.wrap_y:
+            block[-1] = self.words[0]
+        return block
+
+    # --- Evolution ---
+
+    def neighbor_planes(self, block: np.ndarray):
+        """
+        Yields one bit plane per neighbor direction for the inner rows of a block.
+        """
+        above = block[:-2]
+        below = block[2:]
+        yield above
+        yield below
+        yield self.from_left(block[1:-1])
+        yield self.from_right(block[1:-1])
+        if self.use_moore:
+            yield self.from_left(above)
+            yield self.from_right(above)
+            yield self.from_left(below)
+            yield self.from_right(below)
+
+    def count_neighbors(self, block: np.ndarray):
+        """
+        Add up the neighbor planes of a block into bit-sliced counters, counters[i] holding bit i of every count.
+        """
+        shape = (block.shape[0] - 2, block.shape[1])
+        counters = [np.zeros(shape, dtype=np.uint64) for _ in range(COUNTER_BITS)]
+        carry = np.empty(shape, dtype=np.uint64)
+        next_carry = np.empty(shape, dtype=np.uint64)
+        for k, plane in enumerate(self.neighbor_planes(block)):
+            np.copyto(carry, plane)
+            # After k + 1 planes the count has at most (k + 1).bit_length() bits, the others can't carry.
+            for counter in counters[:(k + 1).bit_length()]:
+                np.bitwise_and(counter, carry, out=next_carry)
+                counter ^= carry
+                carry, next_carry = next_carry, carry
+        return counters
+
+    @staticmethod
+    def count_equals(counters, n: int) -> np.ndarray:
+        """
+        Returns the bits of all cells whose neighbor count is n.
+        """
+        result = counters[0].copy() if n & 1 else ~counters[0]
+        for i, counter in enumerate(counters[1:], 1):
+            if (n >> i) & 1:
+                result &= counter
+            else:
+                result &= ~counter
+        return result
+
+    def step(self):
+        """
+        Compute the next generation, a few rows at a time so that the intermediate planes stay in the cache.
+        """
+        new = np.empty_like(self.words)
+        tile_rows = max(1, TILE_WORDS // self.num_words)
+        for r0 in range(0, self.height, tile_rows):
+            r1 = min(self.height, r0 + tile_rows)
+            block = self.read_block(r0, r1)
+            counters = self.count_neighbors(block)
+            alive = block[1:-1]
+            tile = new[r0:r1]
+            tile[:] = 0
+            for n in range(2 ** COUNTER_BITS):
+                if n in self.rule.birth and n in self.rule.survival:
+                    tile |= self.count_equals(counters, n)
+                elif n in self.rule.birth:
+                    tile |= self.count_equals(counters, n) & ~alive
+                elif n in self.rule.survival:
+                    tile |= self.count_equals(counters, n) & alive
+        new[:, -1] &= self.last_word_mask
+        previous = self.words
+        self.words = new
+        if self.sync_colors:
+            self.update_colors(previous)
+
+    def update_colors(self, previous: np.ndarray):
+        """
+        Set the color of every cell that changed its state, only unpacking the words that changed.
+        """
+        rows, word_indices = np.nonzero(previous != self.words)
+        if len(rows) == 0:
+            return
+        changed = unpack_rows((previous ^ self.words)[rows, word_indices][:, None], WORD_BITS)
+        states = unpack_rows(self.words[rows, word_indices][:, None], WORD_BITS)
+        grid = self.ca.ca_grid
+        for k, bit in zip(*np.nonzero(changed)):
+            x = int(word_indices[k]) * WORD_BITS + int(bit)
+            grid[x, int(rows[k])].color = self.palette[1 if states[k, bit] else 0]
+
+    def sync_all_colors(self):
+        cells = self.unpack()
+        for (x, y), cell in self.ca.ca_grid.items():
+            cell.color = self.palette[1 if cells[y, x] else 0]
@@ -21,6 +21,17 @@ class CabCA(metaclass=ABCMeta):
         """
         self.proto_cell = proto_cell
         self.cab_sys = cab_sys
+        self.geometry = None
+        # Array-backed cell states, see create_grid_state.
+        self.grid_states = dict()
+        self.field_layers = dict()
+        self.wrap_x = False
+        self.wrap_y = False
+        self.pathfinder = None
+        self.line_of_sight = None
+        # Steps the whole grid at once instead of the cells' own update methods, see set_rule.
+        # There is one at a time, see check_no_rule_engine.
+        self.rule_engine = None
 
     def cycle_automaton(self):
         """
@@ -37,6 +48,202 @@ class CabCA(metaclass=ABCMeta):
         """
         raise NotImplementedError("Method needs to be implemented")
 
+    def create_grid_state(self, name: str, dtype='float64', fill=0):
+        """
+        Create a double-buffered array with one value per cell, see cab.ca.grid_state.
+        The array is memory-mapped into GRID_STATE_PATH if that is set, otherwise it is kept in memory.
+        Memory-mapped arrays are reopened from earlier runs if GRID_STATE_KEY is set, see close_grid_states.
+        :param name: Name under which the state is kept in grid_states.
+        :param dtype: Numpy type of the values.
+        :param fill: Initial value of all cells.
+        :returns The new GridState.
+        """
+        import cab.ca.grid_state as cab_grid_state
+        gc = self.cab_sys.gc
+        state = cab_grid_state.GridState(name, self.height, self.width, dtype, fill,
+                                         gc.GRID_STATE_PATH, gc.GRID_STATE_TILE_ROWS, gc.GRID_STATE_KEY)
+        self.grid_states[name] = state
+        return state
+
+    def close_grid_states(self):
+        """
+        Release the grid states of this CA and the field layers stored in them. Memory-mapped states are written
+        back to disk if GRID_STATE_KEY is set, otherwise their files are deleted.
+        """
+        for state in self.grid_states.values():
+            state.close()
+        self.grid_states = dict()
+        self.field_layers = dict()
+
+    def sweep_grid_state(self, state, kernel, halo: int = 1, fill=0):
+        """
+        Compute the next generation of a grid state tile by tile, wrapping around the edges like the CA does.
+        :param state: The GridState to update.
+        :param kernel: Function (block, row) -> new rows, see GridState.sweep.
+        :param halo: Number of rows the kernel needs to see above and below a tile.
+        :param fill: Value of cells beyond the edges of the grid.
+        """
+        state.sweep(kernel, halo, self.wrap_y, fill)
+
+    def add_field_layer(self, name: str, initial: float = 0.0):
+        """
+        Create a scalar field on the grid, like pheromones or resources, see cab.ca.field_layer.
+        :param name: Name under which the layer is kept in field_layers.
+        :param initial: Initial value of all cells.
+        :returns The new FieldLayer.
+        """
+        import cab.ca.field_layer as cab_field
+        layer = cab_field.FieldLayer(self, name, initial)
+        self.field_layers[name] = layer
+        return layer
+
+    def check_no_rule_engine(self):
+        """
+        Raise an error if a rule engine already steps this CA, one engine never silently replaces another.
+        """
+        if self.rule_engine is not None:
+            raise ValueError('the CA is already stepped by a {0}, call remove_rule_engine first'.format(
+                type(self.rule_engine).__name__))
+
+    def remove_rule_engine(self):
+        """
+        Go back to the update methods of the cells, or to kinetic Monte Carlo if gc.USE_ASYNC_CA is set.
+        """
+        self.rule_engine = None
+
+    def use_kinetic_monte_carlo(self, time_per_step: float = None):
+        """
+        Update the cells asynchronously by the stochastic events they expose, see cab.ca.kmc.
+        :param time_per_step: Simulated time per step, by default gc.ASYNC_CA_TIME_PER_STEP.
+        :returns The KineticMonteCarlo.
+        """
+        import cab.ca.kmc as cab_kmc
+        self.check_no_rule_engine()
+        if time_per_step is None:
+            time_per_step = self.sys.gc.ASYNC_CA_TIME_PER_STEP
+        self.rule_engine = cab_kmc.KineticMonteCarlo(self, time_per_step)
+        return self.rule_engine
+
+    def create_convolution(self, kernel, normalize: bool = True, method: str = None):
+        """
+        Create a convolution of grid states with a large kernel, see cab.ca.convolution.
+        :param kernel: Square array of weights, indexed by the offsets of the neighbors.
+        :param normalize: Whether the kernel is scaled to sum up to one.
+        :param method: "direct" or "fft", by default chosen by the number of non-zero weights.
+        """
+        import cab.ca.convolution as cab_conv
+        return cab_conv.Convolution(self, kernel, normalize, method)
+
+    def set_continuous_rule(self, kernel, growth=None, dt: float = 0.1, palette=None, sync_colors: bool = True):
+        """
+        Step this CA with a continuous, Lenia-like rule instead of the update methods of the cells.
+        The values of the cells are stored in the field layer 'continuous_state'.
+        :param kernel: Square array of weights, indexed by the offsets of the neighbors.
+        :param growth: Function of the convolved values that is added to the values every step.
+        :param dt: Time step.
+        :param palette: Colors of the values 0 and 1.
+        :param sync_colors: Whether cell colors are kept up to date.
+        :returns The ContinuousRule.
+        """
+        import cab.ca.convolution as cab_conv
+        self.check_no_rule_engine()
+        self.rule_engine = cab_conv.ContinuousRule(self, kernel, growth, dt, palette, sync_colors)
+        return self.rule_engine
+
+    def set_rule(self, rule, palette=None, sync_colors: bool = True):
+        """
+        Step this CA with a declarative outer-totalistic rule instead of the update methods of the cells.
+        :param rule: A cab.ca.rule_engine.TotalisticRule, or its B/S notation like "B3/S23".
+        :param palette: Color of each state, written to the cells after each generation.
+        :param sync_colors: Whether cell colors are kept up to date.
+        :returns The RuleEngine, for setting and reading cell states.
+        """
+        import cab.ca.rule_engine as cab_rule
+        self.check_no_rule_engine()
+        if isinstance(rule, str):
+            rule = cab_rule.TotalisticRule.parse(rule)
+        self.rule_engine = cab_rule.RuleEngine(self, rule, palette, sync_colors)
+        if sync_colors:
+            self.rule_engine.sync_all_colors()
+        return self.rule_engine
+
+    def use_bit_grid(self, rule, palette=None, sync_colors: bool = True):
+        """
+        Step this CA on a bit-packed copy of its states, for rectangular CAs with a two-state rule in B/S notation.
+        :param rule: A cab.ca.rule_engine.TotalisticRule, or its B/S notation like "B3/S23".
+        :param palette: Colors of dead and living cells.
+        :param sync_colors: Whether cell colors are kept up to date.
+        :returns The BitGrid, for setting and reading cell states.
+        """
+        import cab.ca.bit_grid as cab_bits
+        self.check_no_rule_engine()
+        self.rule_engine = cab_bits.BitGrid(self, rule, palette, sync_colors)
+        if sync_colors:
+            self.rule_engine.sync_all_colors()
+        return self.rule_engine
+
+    def use_hashlife(self, rule, bounded: bool = True, palette=None):
+        """
+        Step this CA with a Hashlife universe, for rectangular CAs with a two-state rule in B/S notation.
+        Use advance(k) of the returned universe to jump 2^k generations and sync_cells() to show the result.
+        :param rule: A cab.ca.rule_engine.TotalisticRule, or its B/S notation like "B3/S23".
+        :param bounded: Whether cells beyond the borders stay dead, as they do on the CA itself.
+                        False lets patterns leave the CA into an unbounded plane.
+        :param palette: Colors of dead and living cells.
+        :returns The Hashlife universe.
+        """
+        import cab.ca.hashlife as cab_hashlife
+        self.check_no_rule_engine()
+        self.rule_engine = cab_hashlife.Hashlife(self, rule, bounded, palette)
+        return self.rule_engine
+
+    def tabulate_transitions(self, states=None, sync_cells: bool = True):
+        """
+        Step this CA by looking up memoized transitions instead of calling the update methods of all cells.
+        Only for cells with a finite set of states, see cab.ca.transition_table.
+        :param states: The states of the cells, by default the STATES attribute of the cell class.
+        :param sync_cells: Whether the state and color attributes of the cells are kept up to date.
+        :returns The TransitionTable.
+        """
+        import cab.ca.transition_table as cab_tt
+        self.check_no_rule_engine()
+        self.rule_engine = cab_tt.TransitionTable(self, states, sync_cells)
+        return self.rule_engine
+
+    def connect_from_topology(self):
+        """
+        Set the neighbors of all cells from the shared topology of this grid configuration,
+        instead of working them out cell by cell, see cab.ca.topology.
+        """
+        import cab.ca.topology as cab_topology
+        cab_topology.connect_cells(list(self.ca_grid.values()), cab_topology.get_topology(self))
+
+    def get_pathfinder(self):
+        """
+        Returns the pathfinding service of this CA, see cab.ca.pathfinding.
+        """
+        if self.pathfinder is None:
+            import cab.ca.pathfinding as cab_path
+            self.pathfinder = cab_path.PathFinder(self)
+        return self.pathfinder
+
+    def get_line_of_sight(self):
+        """
+        Returns the line of sight service of this CA, see cab.ca.line_of_sight.
+        """
+        if self.line_of_sight is None:
+            import cab.ca.line_of_sight as cab_los
+            self.line_of_sight = cab_los.LineOfSight(self)
+        return self.line_of_sight
+
+    def get_all_polygons(self):
+        """
+        Returns the pixel corners of all cells in the order of ca_grid, for renderers. Requires numpy,
+        use geometry.corners for single cells.
+        :returns Integer numpy array of shape (number of cells, number of corners, 2).
+        """
+        return self.geometry.all_polygons(list(self.ca_grid.keys()))
+
     def get_agent_neighborhood(self, agent_x, agent_y, dist) ->\
             Dict[Tuple[int, int], Tuple[cab_cell.CACell, Union[bool, cab_agent.CabAgent]]]:
         """
@@ -0,0 +1,88 @@
+"""
+This module contains array helpers for cellular automata whose cell states live in numpy arrays.
+Arrays are indexed [row, column] in offset layout: for rectangular grids this is [y, x], for hexagonal
+grids [r, q + floor(r / 2)], so odd rows are shifted half a cell to the right.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+__author__ = 'Michael Wagner'
+
+
+RECT_MOORE_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+RECT_VON_NEUMANN_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+# Axial (dq, dr) of the six hex neighbors, same order as HEX_DIRECTIONS.
+HEX_AXIAL_DIRECTIONS = [(+1, -1), (+1, 0), (0, +1), (-1, +1), (-1, 0), (0, -1)]
+
+
+def hex_row_offsets(parity: int) -> List[Tuple[int, int]]:
+    """
+    Returns the (dx, dy) offsets of the neighbors of a hex cell in a row with the given parity.
+    The order is the same as the one of HEX_DIRECTIONS.
+    """
+    # Axial direction (dq, dr) becomes dx = dq + floor((r + dr) / 2) - floor(r / 2).
+    return [(dq + (parity + dr) // 2 - parity // 2, dr) for (dq, dr) in HEX_AXIAL_DIRECTIONS]
+
+
+def neighbor_offsets(use_hex: bool, use_moore: bool, parity: int = 0) -> List[Tuple[int, int]]:
+    """
+    Returns the (dx, dy) offsets of all neighbors of a cell.
+    :param use_hex: Whether the grid is hexagonal.
+    :param use_moore: Moore or von Neumann neighborhood, only used for rectangular grids.
+    :param parity: Parity of the row of the cell, only used for hexagonal grids.
+    """
+    if use_hex:
+        return hex_row_offsets(parity % 2)
+    elif use_moore:
+        return RECT_MOORE_OFFSETS
+    else:
+        return RECT_VON_NEUMANN_OFFSETS
+
+
+def shift_columns(rows: np.ndarray, dx: int, wrap: bool, fill=0) -> np.ndarray:
+    """
+    Returns the rows shifted so that out[:, x] = rows[:, x + dx].
+    Columns shifted in from outside the grid are either wrapped around or set to fill.
+    """
+    if dx == 0:
+        return rows
+    if wrap:
+        return np.roll(rows, -dx, axis=1)
+    out = np.full_like(rows, fill)
+    if dx > 0:
+        out[:, :-dx] = rows[:, dx:]
+    else:
+        out[:, -dx:] = rows[:, :dx]
+    return out
+
+
+def neighbor_sum(block: np.ndarray, row: int, halo: int, use_hex: bool, use_moore: bool,
+                 wrap_x: bool, fill=0, dtype=None) -> np.ndarray:
+    """
+    Sums up the values of all neighbors of every cell in a block of rows.
+    :param block: Rows of the grid including halo rows above and below.
+    :param row: Absolute row index of the first non-halo row, needed for the parity of hex rows.
+    :param halo: Number of halo rows on either side, at least 1.
+    :param use_hex: Whether the grid is hexagonal.
+    :param use_moore: Moore or von Neumann neighborhood for rectangular grids.
+    :param wrap_x: Whether the left and right edges of the grid are connected.
+    :param fill: Value of neighbors beyond the left and right edge, if they are not wrapped.
+    :param dtype: Type of the result, defaults to the type of the block.
+    :returns Array with the shape of the block without halo rows.
+    """
+    n = block.shape[0] - 2 * halo
+    out = np.zeros((n, block.shape[1]), dtype=dtype if dtype is not None else block.dtype)
+    if use_hex:
+        # Rows of different parity have different neighbors, so handle every other row at once.
+        for first in (0, 1):
+            if first >= n:
+                continue
+            for (dx, dy) in neighbor_offsets(True, use_moore, row + first):
+                rows = block[halo + dy + first:halo + dy + n:2]
+                out[first::2] += shift_columns(rows, dx, wrap_x, fill)
+    else:
+        for (dx, dy) in neighbor_offsets(False, use_moore):
+            out += shift_columns(block[halo + dy:halo + dy + n], dx, wrap_x, fill)
+    return out
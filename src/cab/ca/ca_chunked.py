@@ -0,0 +1,214 @@
+"""
+This module contains a lazily allocated grid for huge or sparse cellular automata.
+The grid is split into square tiles of cells, which are only created once a cell inside them is accessed,
+or once a cell next to them differs from the default cell and may therefore change them.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+
+import cab.ca.cell as cab_cell
+
+__author__ = 'Michael Wagner'
+
+
+# Attributes that place a cell on the grid rather than describe its state.
+LAYOUT_ATTRIBUTES = frozenset(['x', 'y', 'q', 'r', 'z', 'neighbors', 'is_border'])
+
+
+class LazyNeighbors:
+    """
+    Neighbor list of a cell in a chunked grid.
+    Neighbors are looked up in the grid when they are accessed, so that tiles at the edge of the
+    materialized area don't force their neighbor tiles into existence. Neighbors in untouched tiles
+    are represented by the shared default cell of the grid.
+    """
+
+    def __init__(self, grid, positions: List[Tuple[int, int]]):
+        self.grid = grid
+        self.positions = positions
+        self.cells = None
+
+    def resolve(self) -> List[cab_cell.CACell]:
+        if self.cells is not None:
+            return self.cells
+        cells = [self.grid.peek(pos) for pos in self.positions]
+        # Once all neighbors exist, the list doesn't change anymore and can be kept.
+        if all(c is not self.grid.default_cell for c in cells):
+            self.cells = cells
+        return cells
+
+    def __getitem__(self, index):
+        return self.resolve()[index]
+
+    def __iter__(self) -> Iterator[cab_cell.CACell]:
+        return iter(self.resolve())
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+
+class ChunkedGrid:
+    """
+    Dictionary-like replacement for ca_grid, mapping positions to cells.
+    Accessing a cell with grid[x, y] creates its whole tile if necessary. Iterating over the grid only
+    visits cells of tiles that have been created, which is what the CA steps. Use peek() to read a cell
+    without creating its tile.
+    Untouched tiles are assumed to be at rest: a default cell surrounded by default cells stays one.
+    Before each step the CA calls expand(), which creates the tiles next to cells that differ from the
+    default cell, so activity spreads into untouched tiles just as on a complete grid.
+    """
+
+    def __init__(self, ca, chunk_size: int):
+        """
+        :param ca: The CA that owns the grid, it provides create_cell, neighbor_positions,
+                   to_offset and from_offset.
+        :param chunk_size: Width and height of a tile in cells.
+        """
+        self.ca = ca
+        self.width = ca.width
+        self.height = ca.height
+        self.chunk_size = chunk_size
+        self.chunks: Dict[Tuple[int, int], List[cab_cell.CACell]] = dict()
+        # Cells with neighbors in tiles that don't exist yet, with the keys of those tiles, per tile.
+        self.frontier: Dict[Tuple[int, int], List[Tuple[cab_cell.CACell, Tuple]]] = dict()
+        # Stand-in for every cell in an untouched tile. It must not be modified. A border cell would make
+        # untouched cells look like part of the border, so it is taken from the middle of the grid and
+        # cleared for grids too small to have an inside.
+        self.default_cell = ca.create_cell(*ca.from_offset(self.width // 2, self.height // 2))
+        self.default_cell.is_border = False
+
+    def chunk_of(self, pos: Tuple[int, int]) -> Tuple[Tuple[int, int], int]:
+        """
+        Returns the key of the tile containing the position and the index of the cell inside the tile.
+        Raises KeyError if the position is not on the grid.
+        """
+        i, j = self.ca.to_offset(*pos)
+        if not (0 <= i < self.width and 0 <= j < self.height):
+            raise KeyError(pos)
+        cs = self.chunk_size
+        return (i // cs, j // cs), (j % cs) * cs + (i % cs)
+
+    def materialize_chunk(self, key: Tuple[int, int]) -> List[cab_cell.CACell]:
+        """
+        Create all cells of a tile. Positions of the tile beyond the grid edge are None.
+        """
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            return chunk
+        cs = self.chunk_size
+        chunk = [None] * (cs * cs)
+        border = []
+        for lj in range(cs):
+            j = key[1] * cs + lj
+            if j >= self.height:
+                break
+            for li in range(cs):
+                i = key[0] * cs + li
+                if i >= self.width:
+                    break
+                x, y = self.ca.from_offset(i, j)
+                cell = self.ca.create_cell(x, y)
+                positions = self.ca.neighbor_positions(x, y)
+                cell.set_neighbors(LazyNeighbors(self, positions))
+                chunk[lj * cs + li] = cell
+                # Neighbors of a cell are at most one column and row away, also across a wrapped edge.
+                if li in (0, cs - 1) or lj in (0, cs - 1) or i == self.width - 1 or j == self.height - 1:
+                    keys = set(self.chunk_of(pos)[0] for pos in positions)
+                    keys.discard(key)
+                    if keys:
+                        border.append((cell, tuple(keys)))
+        self.chunks[key] = chunk
+        if border:
+            self.frontier[key] = border
+        return chunk
+
+    def differs_from_default(self, cell: cab_cell.CACell) -> bool:
+        """
+        Whether any attribute of the cell, except for its place on the grid, differs from the default cell.
+        """
+        default = self.default_cell.__dict__
+        for name, value in cell.__dict__.items():
+            if name in LAYOUT_ATTRIBUTES:
+                continue
+            if name not in default:
+                return True
+            default_value = default[name]
+            if value is not default_value and value != default_value:
+                return True
+        return False
+
+    def expand(self):
+        """
+        Create the missing tiles next to cells that differ from the default cell.
+        Activity spreads by at most one cell per step, so one call before every step is enough.
+        """
+        chunks = self.chunks
+        for key in list(self.frontier):
+            remaining = []
+            for cell, keys in self.frontier[key]:
+                missing = tuple(k for k in keys if k not in chunks)
+                if not missing:
+                    continue
+                if self.differs_from_default(cell):
+                    for k in missing:
+                        self.materialize_chunk(k)
+                else:
+                    remaining.append((cell, missing))
+            if remaining:
+                self.frontier[key] = remaining
+            else:
+                del self.frontier[key]
+
+    def is_materialized(self, pos: Tuple[int, int]) -> bool:
+        key, _ = self.chunk_of(pos)
+        return key in self.chunks
+
+    def peek(self, pos: Tuple[int, int]) -> cab_cell.CACell:
+        """
+        Returns the cell at the position if its tile exists, otherwise the shared default cell.
+        """
+        key, index = self.chunk_of(pos)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return self.default_cell
+        return chunk[index]
+
+    def __getitem__(self, pos: Tuple[int, int]) -> cab_cell.CACell:
+        key, index = self.chunk_of(pos)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.materialize_chunk(key)
+        return chunk[index]
+
+    def get(self, pos: Tuple[int, int], default=None):
+        if pos not in self:
+            return default
+        return self[pos]
+
+    def __contains__(self, pos) -> bool:
+        i, j = self.ca.to_offset(*pos)
+        return 0 <= i < self.width and 0 <= j < self.height
+
+    def values(self) -> Iterator[cab_cell.CACell]:
+        # Tiles created while iterating are visited in the next pass only.
+        for chunk in list(self.chunks.values()):
+            for cell in chunk:
+                if cell is not None:
+                    yield cell
+
+    def keys(self) -> Iterator[Tuple[int, int]]:
+        for cell in self.values():
+            yield cell.x, cell.y
+
+    def items(self) -> Iterator[Tuple[Tuple[int, int], cab_cell.CACell]]:
+        for cell in self.values():
+            yield (cell.x, cell.y), cell
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        """
+        Number of cells that have been created.
+        """
+        return sum(1 for chunk in self.chunks.values() for cell in chunk if cell is not None)
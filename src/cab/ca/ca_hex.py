@@ -2,13 +2,15 @@
 This module contains the class for a CA with hexagonal cells in pointy top layout.
 """
 
-from typing import Dict, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
 import math
 import multiprocessing as mp
 
 import cab.abm.agent as cab_agent
 import cab.ca.cell as cab_cell
+import cab.ca.ca_chunked as cab_chunk
+import cab.ca.geometry as cab_geo
 import cab.ca.ca as cab_ca
 import cab.util.rng as cab_rng
 import cab.util.stats as cab_stats
@@ -40,30 +42,74 @@ class CAHex(cab_ca.CabCA):
         self.width: int = int(self.grid_width / self.sys.gc.CELL_SIZE)
         self.cell_size: int = self.sys.gc.CELL_SIZE
         self.use_borders: bool = self.sys.gc.USE_CA_BORDERS
-        self.proto_cell: cab_cell.CellHex = None
+        self.geometry = cab_geo.get_hex_geometry(self.cell_size)
+        # Without borders the grid wraps around the left and right edges only.
+        self.wrap_x: bool = not self.use_borders
+        self.wrap_y: bool = False
 
-        if proto_cell is None:
-            for j in range(0, self.height):
-                for i in range(0, self.width):
-                    # self.ca_grid[i, j] = CellHex(i, j, gc.CELL_SIZE, gc)
-                    q = i - math.floor(j / 2)
-                    self.ca_grid[q, j] = cab_cell.CellHex(q, j, self.sys.gc)
-                    # print('x={0}, y={1}'.format(q, j))
-                    if self.sys.gc.USE_CA_BORDERS and (i == 0 or j == 0 or i == (self.width - 1) or j == (self.height - 1)):
-                        self.ca_grid[q, j].is_border = True
+        self.proto_cell = proto_cell
+
+        if self.sys.gc.USE_CHUNKED_GRID:
+            # Cells are only created tile by tile, once they are accessed for the first time.
+            self.ca_grid = cab_chunk.ChunkedGrid(self, self.sys.gc.CHUNK_SIZE)
         else:
-            self.proto_cell = proto_cell
             for j in range(0, self.height):
                 for i in range(0, self.width):
-                    # self.ca_grid[i, j] = proto_cell.clone(i, j, gc.CELL_SIZE)
                     q = i - math.floor(j / 2)
-                    self.ca_grid[q, j] = proto_cell.clone(q, j)
-                    # print('x={0}, y={1}'.format(q, j))
-                    if self.sys.gc.USE_CA_BORDERS and (i == 0 or j == 0 or i == (self.width - 1) or j == (self.height - 1)):
-                        self.ca_grid[q, j].is_border = True
+                    self.ca_grid[q, j] = self.create_cell(q, j)
+
+            if self.sys.gc.USE_TOPOLOGY_CACHE:
+                self.connect_from_topology()
+            else:
+                for cell in list(self.ca_grid.values()):
+                    self.set_cell_neighborhood(cell)
 
-        for cell in list(self.ca_grid.values()):
-            self.set_cell_neighborhood(cell)
+    def create_cell(self, q: int, r: int) -> cab_cell.CellHex:
+        """
+        Create the cell for hex position q, r, either a default cell or a clone of the proto cell.
+        Cells on the outer ring of the grid are marked as border cells if borders are enabled.
+        """
+        if self.proto_cell is None:
+            cell = cab_cell.CellHex(q, r, self.sys.gc)
+        else:
+            cell = self.proto_cell.clone(q, r)
+        i, j = self.to_offset(q, r)
+        if self.sys.gc.USE_CA_BORDERS and (i == 0 or j == 0 or i == (self.width - 1) or j == (self.height - 1)):
+            cell.is_border = True
+        return cell
+
+    def neighbor_positions(self, q: int, r: int) -> List[Tuple[int, int]]:
+        """
+        Returns the positions of all neighbors of the cell at q, r, in the same order as
+        set_cell_neighborhood assigns them, including the wrap around the left and right edges.
+        """
+        positions = []
+        for d in self.sys.gc.HEX_DIRECTIONS:
+            x = q + d[0]
+            y = r + d[1]
+            if not 0 <= y < self.height:
+                continue
+            min_x = 0 - math.floor(y / 2)
+            max_x = (self.width - 1) - math.floor(y / 2)
+            if min_x <= x <= max_x:
+                positions.append((x, y))
+            elif not self.sys.gc.USE_CA_BORDERS:
+                positions.append((max_x if x < min_x else min_x, y))
+        return positions
+
+    @staticmethod
+    def to_offset(q: int, r: int) -> Tuple[int, int]:
+        """
+        Convert hex coordinates into column and row of the grid.
+        """
+        return q + math.floor(r / 2), r
+
+    @staticmethod
+    def from_offset(i: int, j: int) -> Tuple[int, int]:
+        """
+        Convert column and row of the grid into hex coordinates.
+        """
+        return i - math.floor(j / 2), j
 
     # Common Interface for all CA classes
 
@@ -96,8 +142,16 @@ class CAHex(cab_ca.CabCA):
         """
         Update the cellular automaton.
         """
-        self.update_cells_from_neighborhood()
-        self.update_cells_state()
+        if self.rule_engine is None and self.sys.gc.USE_ASYNC_CA:
+            # Rates are collected on the first step, after the model had the chance to initialize its cells.
+            self.use_kinetic_monte_carlo()
+        if self.rule_engine is not None:
+            self.rule_engine.step()
+        else:
+            if self.sys.gc.USE_CHUNKED_GRID:
+                self.ca_grid.expand()
+            self.update_cells_from_neighborhood()
+            self.update_cells_state()
 
     @cab_stats.timedmethod
     def update_cells_from_neighborhood(self):
@@ -209,7 +263,9 @@ class CAHex(cab_ca.CabCA):
         Returns coordinates of a random cell position that is within the boundaries of the grid.
         :returns Coordinates in hex form.
         """
-        return cab_rng.get_RNG().choice(list(self.ca_grid.keys()))
+        # Cells are created row by row, so this draws the same cell as choosing from the keys of the grid.
+        j, i = divmod(cab_rng.get_RNG().randrange(self.width * self.height), self.width)
+        return self.from_offset(i, j)
 
     @staticmethod  # TODO: Get the input type hints right!
     def hex_round(q: float, r: float) -> Tuple[int, int]:
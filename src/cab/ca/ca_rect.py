@@ -3,11 +3,14 @@ This module contains the class for a CA with rectangular cells.
 Moore and von-Neumann neighborhoods are available.
 """
 
-from typing import Dict, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
 import cab.ca.ca as cab_ca
+import cab.ca.ca_chunked as cab_chunk
 import cab.abm.agent as cab_agent
 import cab.ca.cell as cab_cell
+import cab.ca.geometry as cab_geo
+import cab.util.rng as cab_rng
 
 __author__: str = 'Michael Wagner'
 
@@ -29,31 +32,87 @@ class CARect(cab_ca.CabCA):
         self.cell_size: int = self.sys.gc.CELL_SIZE
         self.use_moore_neighborhood: bool = self.sys.gc.USE_MOORE_NEIGHBORHOOD
         self.use_borders: bool = self.sys.gc.USE_CA_BORDERS
-        self.proto_cell: cab_cell.CellRect = None
+        self.geometry = cab_geo.get_rect_geometry(self.cell_size)
+        # The cells of a rectangular grid are never wired across its edges, with or without borders,
+        # and array-backed states, field layers and the agent services follow the same topology.
+        self.wrap_x: bool = False
+        self.wrap_y: bool = False
 
-        if proto_cell is None:
-            for j in range(0, self.height):
-                for i in range(0, self.width):
-                    self.ca_grid[i, j] = cab_cell.CellRect(i, j, self.sys.gc)
+        self.proto_cell = proto_cell
+
+        if self.sys.gc.USE_CHUNKED_GRID:
+            # Cells are only created tile by tile, once they are accessed for the first time.
+            self.ca_grid = cab_chunk.ChunkedGrid(self, self.sys.gc.CHUNK_SIZE)
         else:
-            self.proto_cell = proto_cell
             for j in range(0, self.height):
                 for i in range(0, self.width):
-                    self.ca_grid[i, j] = proto_cell.clone(i, j)
+                    self.ca_grid[i, j] = self.create_cell(i, j)
+
+            if self.sys.gc.USE_TOPOLOGY_CACHE:
+                self.connect_from_topology()
+            elif self.use_moore_neighborhood:
+                self.init_moore()
+                self.init_moore_borders()
+            else:
+                self.init_von_neumann()
+                self.init_von_neumann_borders()
+
+    def create_cell(self, x: int, y: int) -> cab_cell.CellRect:
+        """
+        Create the cell for grid position x, y, either a default cell or a clone of the proto cell.
+        """
+        if self.proto_cell is None:
+            return cab_cell.CellRect(x, y, self.sys.gc)
+        else:
+            return self.proto_cell.clone(x, y)
 
+    def neighbor_positions(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """
+        Returns the positions of all neighbors of the cell at x, y, in the same order as
+        init_moore and init_von_neumann assign them.
+        """
         if self.use_moore_neighborhood:
-            self.init_moore()
-            self.init_moore_borders()
+            candidates = [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y),
+                          (x - 1, y - 1), (x + 1, y - 1), (x - 1, y + 1), (x + 1, y + 1)]
         else:
-            self.init_von_neumann()
-            self.init_von_neumann_borders()
+            candidates = [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)]
+        return [(i, j) for (i, j) in candidates if 0 <= i < self.width and 0 <= j < self.height]
+
+    @staticmethod
+    def to_offset(x: int, y: int) -> Tuple[int, int]:
+        """
+        Convert grid coordinates into column and row of the grid. Rectangular grids are stored that way already.
+        """
+        return x, y
+
+    @staticmethod
+    def from_offset(i: int, j: int) -> Tuple[int, int]:
+        """
+        Convert column and row of the grid into grid coordinates.
+        """
+        return i, j
+
+    def get_random_valid_position(self) -> Tuple[int, int]:
+        """
+        Returns coordinates of a random cell position that is within the boundaries of the grid.
+        """
+        j, i = divmod(cab_rng.get_RNG().randrange(self.width * self.height), self.width)
+        return i, j
 
     def cycle_automaton(self):
         """
         This method updates the cellular automaton
         """
-        self.update_cells_from_neighborhood()
-        self.update_cells_state()
+        if self.rule_engine is None and self.sys.gc.USE_ASYNC_CA:
+            # Rates are collected on the first step, after the model had the chance to initialize its cells.
+            self.use_kinetic_monte_carlo()
+        if self.rule_engine is not None:
+            self.rule_engine.step()
+        else:
+            if self.sys.gc.USE_CHUNKED_GRID:
+                self.ca_grid.expand()
+            self.update_cells_from_neighborhood()
+            self.update_cells_state()
 
     def update_cells_from_neighborhood(self):
         for cell in self.ca_grid.values():
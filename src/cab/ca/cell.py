@@ -6,6 +6,8 @@ This module contains all classes associated with the CA cells.
 from abc import ABCMeta, abstractmethod
 import math
 
+import cab.ca.geometry as cab_geo
+
 
 __author__ = 'Michael Wagner'
 
@@ -20,7 +22,6 @@ class CACell(metaclass=ABCMeta):
         self.y = y
         self.gc = gc
         self.neighbors = []
-        self.corners = []
         self.rectangular = True
         self.is_border = False
         self.color = gc.DEFAULT_CELL_COLOR
@@ -28,11 +29,12 @@ class CACell(metaclass=ABCMeta):
     def set_neighbors(self, neighbors):
         self.neighbors = neighbors
 
-    def set_corners(self):
-        pass
-
     def get_corners(self):
-        return self.corners
+        """
+        Returns the pixel corners of this cell. They are placed from the shared shape template on every call,
+        cells don't keep them. Renderers take them from the geometry of the CA instead.
+        """
+        return []
 
     @abstractmethod
     def sense_neighborhood(self):
@@ -46,6 +48,35 @@ class CACell(metaclass=ABCMeta):
     def clone(self, x, y):
         return CACell(x, y, self.gc)
 
+    def is_passable(self):
+        """
+        Whether agents can move through this cell, used by the pathfinding of the CA.
+        Overwrite for cells that act as obstacles and call ca.get_pathfinder().notify_passability_changed
+        when the answer changes.
+        """
+        return True
+
+    def is_opaque(self):
+        """
+        Whether this cell blocks the view, used by the line of sight service of the CA.
+        Overwrite for cells that act as walls and call ca.get_line_of_sight().notify_opacity_changed
+        when the answer changes.
+        """
+        return False
+
+    def get_event_rate(self):
+        """
+        Rate of the next stochastic event of this cell, used if gc.USE_ASYNC_CA is set.
+        Overwrite together with fire_event, a rate of 0 means the cell never fires.
+        """
+        return 0.0
+
+    def fire_event(self):
+        """
+        Apply the stochastic event of this cell, used if gc.USE_ASYNC_CA is set.
+        """
+        pass
+
     def on_lmb_click(self, abm, ca):
         """
         Executed when the mouse is pointed at the cell and left clicked.
@@ -82,15 +113,9 @@ class CellRect(CACell):
         super().__init__(x, y, gc)
         self.w = gc.CELL_SIZE
         self.h = gc.CELL_SIZE
-        self.set_corners()
 
-    def set_corners(self):
-        self.corners = []
-        self.corners.append((self.x * self.w, self.y * self.h))
-        self.corners.append((self.x * self.w + self.w, self.y * self.h))
-        self.corners.append(
-            (self.x * self.w + self.w, self.y * self.h + self.h))
-        self.corners.append((self.x * self.w, self.y * self.h + self.h))
+    def get_corners(self):
+        return cab_geo.get_rect_geometry(self.w).corners(self.x, self.y)
 
     def clone(self, x, y):
         pass
@@ -120,19 +145,8 @@ class CellHex(CACell):
         self.rectangular = False
         self.c_size = gc.CELL_SIZE
 
-        self.corners = []
-        self.set_corners()
-
-    def set_corners(self):
-        self.corners = []
-        for i in range(6):
-            angle = 2 * math.pi / 6 * (i + 0.5)
-
-            x = (self.x * self.horiz) + self.c_size * math.cos(angle)
-            offset = self.y * (self.horiz / 2)
-
-            y = (self.y * self.vert) + self.c_size * math.sin(angle)
-            self.corners.append((int(x) + int(offset), int(y)))
+    def get_corners(self):
+        return cab_geo.get_hex_geometry(self.c_size).corners(self.x, self.y)
 
     def get_cube(self):
         return self.x, self.y, self.z
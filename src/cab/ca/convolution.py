@@ -0,0 +1,244 @@
+"""
+This module contains large-kernel convolutions for continuous cellular automata, like Lenia or
+reaction-diffusion systems with wide neighborhoods.
+Kernels are square arrays of shape (2R + 1, 2R + 1), indexed [dy + R, dx + R] for rectangular and
+[dr + R, dq + R] for hexagonal grids, where (dq, dr) are axial offsets. Small kernels are applied as direct
+stencils, large ones by FFT with the kernel spectrum cached between steps.
+Hex grids are sheared from offset into axial layout first, where a hex neighborhood is a plain 2D stencil.
+Beyond the edges of the CA all values are zero, except across the edges the CA wraps around.
+"""
+
+import math
+
+from typing import Callable, Dict, Sequence, Tuple
+
+import numpy as np
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+def kernel_distances(radius: int, use_hex: bool) -> np.ndarray:
+    """
+    Returns the euclidean distance between the centers of the cells of a kernel and its center, in cells.
+    """
+    d = np.arange(-radius, radius + 1, dtype=np.float64)
+    dy, dx = np.meshgrid(d, d, indexing='ij')
+    if use_hex:
+        # Axial (dq, dr) to cartesian, with neighboring centers one unit apart.
+        dx, dy = dx + dy / 2.0, dy * math.sqrt(3) / 2.0
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def disc_kernel(radius: int, use_hex: bool = False) -> np.ndarray:
+    """
+    All cells within the radius, except the center, weigh 1.
+    """
+    distances = kernel_distances(radius, use_hex)
+    kernel = (distances <= radius + 1e-9).astype(np.float64)
+    kernel[radius, radius] = 0.0
+    return kernel
+
+
+def ring_kernel(radius: int, use_hex: bool = False, peak: float = 0.5, width: float = 0.15) -> np.ndarray:
+    """
+    Smooth ring that peaks at the given fraction of the radius, the usual kernel of Lenia.
+    """
+    relative = kernel_distances(radius, use_hex) / radius
+    kernel = np.exp(-((relative - peak) / width) ** 2 / 2.0)
+    kernel[relative > 1.0] = 0.0
+    return kernel
+
+
+def gaussian_kernel(radius: int, sigma: float, use_hex: bool = False) -> np.ndarray:
+    distances = kernel_distances(radius, use_hex)
+    kernel = np.exp(-(distances / sigma) ** 2 / 2.0)
+    kernel[distances > radius + 1e-9] = 0.0
+    return kernel
+
+
+def fast_size(n: int) -> int:
+    """
+    Returns the smallest number >= n without prime factors beyond 5, for which FFTs are fast.
+    """
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+class Convolution:
+    """
+    Sums up the values in the neighborhood of every cell, weighted by a kernel.
+    """
+
+    def __init__(self, ca, kernel: np.ndarray, normalize: bool = True, method: str = None):
+        """
+        :param ca: The CA whose grid states are convolved.
+        :param kernel: Weights of the neighborhood, see the module description.
+        :param normalize: Whether the kernel is scaled to sum up to one.
+        :param method: "direct" or "fft", by default direct for kernels with at most
+                       gc.CONVOLUTION_MAX_DIRECT_TAPS non-zero weights.
+        """
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if kernel.ndim != 2 or kernel.shape[0] != kernel.shape[1] or kernel.shape[0] % 2 == 0:
+            raise ValueError('kernel must be a square array of odd size')
+        if normalize:
+            kernel = kernel / kernel.sum()
+        self.ca = ca
+        self.kernel = kernel
+        self.radius = kernel.shape[0] // 2
+        self.use_hex = ca.sys.gc.USE_HEX_CA
+        self.wrap_x = ca.wrap_x
+        self.wrap_y = ca.wrap_y
+        self.taps = [(dx - self.radius, dy - self.radius, float(kernel[dy, dx]))
+                     for dy, dx in zip(*np.nonzero(kernel))]
+        if method is None:
+            method = 'direct' if len(self.taps) <= ca.sys.gc.CONVOLUTION_MAX_DIRECT_TAPS else 'fft'
+        if method not in ('direct', 'fft'):
+            raise ValueError('unknown convolution method "{0}"'.format(method))
+        self.method = method
+        # Kernel spectra per padded shape.
+        self.spectra: Dict[Tuple[int, int], np.ndarray] = dict()
+        cab_log.trace('[Convolution] {0} taps of radius {1}, using {2}'.format(len(self.taps), self.radius, method))
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        return self.apply(values)
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """
+        Convolve values in offset layout, as stored in grid states and field layers.
+        :returns The weighted neighborhood sums, in offset layout.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.use_hex:
+            sheared = self.to_axial(values)
+            return self.from_axial(self.convolve(sheared), values.shape)
+        return self.convolve(values)
+
+    # --- Hex layout ---
+
+    def axial_columns(self, height: int, width: int) -> np.ndarray:
+        """
+        Returns the column of every cell in axial layout, where row r is shifted by floor(r / 2) to the left.
+        """
+        rows = np.arange(height)[:, None]
+        columns = np.arange(width)[None, :] - rows // 2
+        if self.wrap_x:
+            return columns % width
+        return columns + (height - 1) // 2
+
+    def to_axial(self, values: np.ndarray) -> np.ndarray:
+        height, width = values.shape
+        columns = self.axial_columns(height, width)
+        axial_width = width if self.wrap_x else width + (height - 1) // 2
+        sheared = np.zeros((height, axial_width), dtype=values.dtype)
+        sheared[np.arange(height)[:, None], columns] = values
+        return sheared
+
+    def from_axial(self, sheared: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+        height, width = shape
+        return sheared[np.arange(height)[:, None], self.axial_columns(height, width)]
+
+    # --- Convolution ---
+
+    def convolve(self, values: np.ndarray) -> np.ndarray:
+        if self.method == 'direct':
+            return self.convolve_direct(values)
+        return self.convolve_fft(values)
+
+    def convolve_direct(self, values: np.ndarray) -> np.ndarray:
+        """
+        Add up the shifted values, one shift per non-zero weight.
+        """
+        height, width = values.shape
+        r = self.radius
+        padded = np.pad(values, ((r, r), (0, 0)), mode='wrap' if self.wrap_y else 'constant')
+        padded = np.pad(padded, ((0, 0), (r, r)), mode='wrap' if self.wrap_x else 'constant')
+        result = np.zeros_like(values)
+        for (dx, dy, weight) in self.taps:
+            result += weight * padded[r + dy:r + dy + height, r + dx:r + dx + width]
+        return result
+
+    def get_spectrum(self, shape: Tuple[int, int]) -> np.ndarray:
+        """
+        Returns the spectrum of the mirrored kernel for FFTs of the given shape, computing it only once.
+        """
+        spectrum = self.spectra.get(shape)
+        if spectrum is None:
+            padded = np.zeros(shape, dtype=np.float64)
+            # The sum over value[y + dy, x + dx] is a convolution with the kernel mirrored at its center.
+            rows = np.array([(-dy) % shape[0] for (_, dy, _) in self.taps], dtype=np.int64)
+            columns = np.array([(-dx) % shape[1] for (dx, _, _) in self.taps], dtype=np.int64)
+            np.add.at(padded, (rows, columns), [weight for (_, _, weight) in self.taps])
+            spectrum = np.fft.rfft2(padded)
+            self.spectra[shape] = spectrum
+        return spectrum
+
+    def convolve_fft(self, values: np.ndarray) -> np.ndarray:
+        """
+        Multiply the spectra. Axes that wrap around are transformed as they are, the others are padded
+        with zeros so that the cyclic convolution doesn't wrap around.
+        """
+        height, width = values.shape
+        shape = (height if self.wrap_y else fast_size(height + self.radius),
+                 width if self.wrap_x else fast_size(width + self.radius))
+        spectrum = self.get_spectrum(shape)
+        result = np.fft.irfft2(np.fft.rfft2(values, s=shape) * spectrum, s=shape)
+        return result[:height, :width]
+
+
+def lenia_growth(potential: np.ndarray, mu: float = 0.15, sigma: float = 0.015) -> np.ndarray:
+    """
+    Growth of Lenia, positive for neighborhood sums close to mu and approaching -1 elsewhere.
+    """
+    return 2.0 * np.exp(-((potential - mu) / sigma) ** 2 / 2.0) - 1.0
+
+
+class ContinuousRule:
+    """
+    Steps a continuous CA in the style of Lenia: every cell moves its value by a growth function
+    of its convolved neighborhood, clipped to [0, 1].
+    """
+
+    def __init__(self, ca, kernel: np.ndarray, growth: Callable[[np.ndarray], np.ndarray] = None,
+                 dt: float = 0.1, palette: Sequence[Tuple[int, int, int]] = None, sync_colors: bool = True):
+        """
+        :param ca: The CA to step.
+        :param kernel: Weights of the neighborhood, normalized to sum up to one.
+        :param growth: Function of the neighborhood sums, by default the gaussian bump of Lenia.
+        :param dt: Time step.
+        :param palette: Colors of the values 0 and 1, values in between are interpolated.
+        :param sync_colors: Whether cell colors are updated after every step.
+        """
+        self.ca = ca
+        self.convolution = Convolution(ca, kernel)
+        self.growth = growth if growth is not None else lenia_growth
+        self.dt = dt
+        self.palette = list(palette) if palette is not None else [ca.sys.gc.DEFAULT_CELL_COLOR, (255, 255, 255)]
+        self.sync_colors = sync_colors
+        self.layer = ca.add_field_layer('continuous_state')
+
+    def step(self):
+        """
+        Compute the next generation.
+        """
+        values = self.layer.values
+        potential = self.convolution(values)
+        values[:] = np.clip(values + self.dt * self.growth(potential), 0.0, 1.0)
+        if self.sync_colors:
+            self.sync_all_colors()
+
+    def sync_all_colors(self):
+        low = np.array(self.palette[0], dtype=np.float64)
+        high = np.array(self.palette[1], dtype=np.float64)
+        values = self.layer.values
+        for (x, y), cell in self.ca.ca_grid.items():
+            i, j = self.ca.to_offset(x, y)
+            v = values[j, i]
+            cell.color = tuple(int(c) for c in low + (high - low) * v)
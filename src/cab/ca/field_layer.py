@@ -0,0 +1,160 @@
+"""
+This module contains scalar field layers of the cellular automaton, like pheromones or resources.
+A field layer is a named float array with one value per cell, that is diffused, decayed and sampled
+with vectorized operations instead of loops over the cells and their neighbors.
+Positions are given in grid coordinates, i.e. (x, y) for rectangular and (q, r) for hexagonal grids.
+"""
+
+from typing import Iterable, Tuple
+
+import numpy as np
+
+import cab.ca.ca_array as cab_array
+
+__author__ = 'Michael Wagner'
+
+
+class FieldLayer:
+    """
+    A float value per cell, stored in a GridState of the CA.
+    """
+
+    def __init__(self, ca, name: str, initial: float = 0.0):
+        """
+        :param ca: The CA the field lives on.
+        :param name: Name of the field, also used for the grid state.
+        :param initial: Initial value of all cells.
+        """
+        self.ca = ca
+        self.name = name
+        self.use_hex = ca.sys.gc.USE_HEX_CA
+        self.use_moore = ca.sys.gc.USE_MOORE_NEIGHBORHOOD
+        self.num_neighbors = len(cab_array.neighbor_offsets(self.use_hex, self.use_moore))
+        self.state = ca.create_grid_state(name, 'float64', initial)
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        The current values as (rows, columns) array in offset layout.
+        """
+        return self.state.read
+
+    def to_index(self, xs, ys) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert grid coordinates into row and column indices of the value array.
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        if self.use_hex:
+            return ys, xs + np.floor_divide(ys, 2)
+        return ys, xs
+
+    def from_index(self, rows, cols) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert row and column indices of the value array into grid coordinates.
+        """
+        if self.use_hex:
+            return cols - np.floor_divide(rows, 2), rows
+        return cols, rows
+
+    def get(self, x: int, y: int) -> float:
+        row, col = self.to_index(x, y)
+        return float(self.values[row, col])
+
+    def set(self, x: int, y: int, value: float):
+        row, col = self.to_index(x, y)
+        self.values[row, col] = value
+
+    def sample(self, xs, ys) -> np.ndarray:
+        """
+        Returns the values at many positions at once.
+        """
+        rows, cols = self.to_index(xs, ys)
+        return self.values[rows, cols]
+
+    def deposit(self, xs, ys, amounts):
+        """
+        Add amounts to the values at many positions at once. Repeated positions accumulate.
+        :param amounts: A single amount for all positions or one amount per position.
+        """
+        rows, cols = self.to_index(xs, ys)
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=np.float64), rows.shape)
+        np.add.at(self.values, (rows, cols), amounts)
+
+    def deposit_from_agents(self, agents: Iterable, amount: float):
+        """
+        Every living agent adds the given amount to the value of the cell it occupies.
+        """
+        positions = [(a.x, a.y) for a in agents if a.x is not None and a.y is not None and not a.dead]
+        if positions:
+            xs, ys = zip(*positions)
+            self.deposit(xs, ys, amount)
+
+    def decay(self, rate: float):
+        """
+        Lose the given fraction of the value in every cell.
+        """
+        values = self.values
+        for (r0, r1) in self.state.tiles():
+            values[r0:r1] *= (1.0 - rate)
+
+    def diffuse(self, rate: float):
+        """
+        Every cell shares the given fraction of its value equally among its neighbors.
+        Shares that would go to neighbors beyond a border stay in the cell, so the total amount is conserved.
+        """
+        height = self.state.height
+        wrap_x = self.ca.wrap_x
+        wrap_y = self.ca.wrap_y
+        use_hex = self.use_hex
+        use_moore = self.use_moore
+        num_neighbors = self.num_neighbors
+
+        def kernel(block, row):
+            valid = np.ones_like(block)
+            if not wrap_y:
+                first = row - 1
+                for k in range(block.shape[0]):
+                    if not 0 <= first + k < height:
+                        valid[k] = 0.0
+            values = block[1:-1]
+            received = cab_array.neighbor_sum(block, row, 1, use_hex, use_moore, wrap_x)
+            num_valid = cab_array.neighbor_sum(valid, row, 1, use_hex, use_moore, wrap_x)
+            kept = values * (1.0 - rate + rate * (num_neighbors - num_valid) / num_neighbors)
+            return kept + received * (rate / num_neighbors)
+
+        self.ca.sweep_grid_state(self.state, kernel)
+
+    def gradient(self, xs, ys) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the neighbor with the highest value for many positions at once, e.g. to follow a pheromone trail.
+        Positions without a neighbor of higher value are returned unchanged.
+        :returns Grid coordinates (xs, ys) of the chosen cells.
+        """
+        rows, cols = self.to_index(np.atleast_1d(xs), np.atleast_1d(ys))
+        values = self.values
+        best_rows = rows.copy()
+        best_cols = cols.copy()
+        best = values[rows, cols]
+        height, width = values.shape
+        # Neighbors of hex cells depend on the parity of their row.
+        for parity in ((0, 1) if self.use_hex else (0,)):
+            mask = (rows % 2 == parity) if self.use_hex else np.ones(rows.shape, dtype=bool)
+            if not mask.any():
+                continue
+            for (dx, dy) in cab_array.neighbor_offsets(self.use_hex, self.use_moore, parity):
+                n_rows = rows[mask] + dy
+                n_cols = cols[mask] + dx
+                if self.ca.wrap_x:
+                    n_cols %= width
+                if self.ca.wrap_y:
+                    n_rows %= height
+                inside = (0 <= n_rows) & (n_rows < height) & (0 <= n_cols) & (n_cols < width)
+                candidate = np.full(n_rows.shape, -np.inf)
+                candidate[inside] = values[n_rows[inside], n_cols[inside]]
+                better = candidate > best[mask]
+                idx = np.flatnonzero(mask)[better]
+                best[idx] = candidate[better]
+                best_rows[idx] = n_rows[better]
+                best_cols[idx] = n_cols[better]
+        return self.from_index(best_rows, best_cols)
@@ -0,0 +1,116 @@
+"""
+This module contains the shape templates of rectangular and hexagonal cells.
+A template holds the corner offsets of one cell, scaled by the cell size, and places them at
+any grid position on demand. Templates are shared by all cells and CAs of the same cell size.
+"""
+
+import math
+
+from typing import Dict, List, Tuple
+
+__author__ = 'Michael Wagner'
+
+
+class RectGeometry:
+    """
+    Shape template of a rectangular cell.
+    """
+
+    def __init__(self, cell_size: int):
+        self.w = cell_size
+        self.h = cell_size
+        self.offsets: List[Tuple[int, int]] = [(0, 0), (self.w, 0), (self.w, self.h), (0, self.h)]
+
+    def corners(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """
+        Returns the pixel corners of the cell at grid position x, y.
+        """
+        return [(x * self.w + dx, y * self.h + dy) for (dx, dy) in self.offsets]
+
+    def outline(self, x: int, y: int) -> List[Tuple[float, float]]:
+        """
+        Returns the exact corners of the cell at grid position x, y. Identical to the pixel corners.
+        """
+        return self.corners(x, y)
+
+    def all_polygons(self, positions):
+        """
+        Returns the pixel corners of many cells at once. Requires numpy.
+        :param positions: Sequence of (x, y) grid positions.
+        :returns Integer numpy array of shape (number of positions, 4, 2).
+        """
+        import numpy as np
+        pos = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        offsets = np.asarray(self.offsets, dtype=np.int64)
+        scale = np.array([self.w, self.h], dtype=np.int64)
+        return (pos * scale)[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+
+
+class HexGeometry:
+    """
+    Shape template of a hexagonal cell in pointy top layout.
+    """
+
+    def __init__(self, cell_size: int):
+        self.c_size = cell_size
+        self.h = cell_size * 2
+        self.vert = self.h * (3 / 4)
+        self.w = self.h * (math.sqrt(3) / 2)
+        self.horiz = self.w
+        self.offsets: List[Tuple[float, float]] = []
+        for i in range(6):
+            angle = 2 * math.pi / 6 * (i + 0.5)
+            self.offsets.append((self.c_size * math.cos(angle), self.c_size * math.sin(angle)))
+
+    def corners(self, q: int, r: int) -> List[Tuple[int, int]]:
+        """
+        Returns the pixel corners of the cell at hex position q, r.
+        The rounding is the same as the cells always did: truncate the corner and the row offset separately.
+        """
+        x = q * self.horiz
+        y = r * self.vert
+        offset = int(r * (self.horiz / 2))
+        return [(int(x + dx) + offset, int(y + dy)) for (dx, dy) in self.offsets]
+
+    def outline(self, q: int, r: int) -> List[Tuple[float, float]]:
+        """
+        Returns the corners of the cell at hex position q, r without rounding them to pixels.
+        Neighboring outlines share their edges exactly, which the truncated pixel corners don't.
+        """
+        x = q * self.horiz + r * (self.horiz / 2)
+        y = r * self.vert
+        return [(x + dx, y + dy) for (dx, dy) in self.offsets]
+
+    def all_polygons(self, positions):
+        """
+        Returns the pixel corners of many cells at once, rounded like corners(). Requires numpy.
+        :param positions: Sequence of (q, r) hex positions.
+        :returns Integer numpy array of shape (number of positions, 6, 2).
+        """
+        import numpy as np
+        pos = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(self.offsets, dtype=np.float64)
+        polygons = np.empty((len(pos), 6, 2), dtype=np.int64)
+        x = (pos[:, 0] * self.horiz)[:, np.newaxis] + offsets[np.newaxis, :, 0]
+        y = (pos[:, 1] * self.vert)[:, np.newaxis] + offsets[np.newaxis, :, 1]
+        offset = np.trunc(pos[:, 1] * (self.horiz / 2)).astype(np.int64)
+        polygons[:, :, 0] = np.trunc(x).astype(np.int64) + offset[:, np.newaxis]
+        polygons[:, :, 1] = np.trunc(y).astype(np.int64)
+        return polygons
+
+
+geometry_cache: Dict[Tuple[str, int], object] = dict()
+
+
+def get_rect_geometry(cell_size: int) -> RectGeometry:
+    key = ('rect', cell_size)
+    if key not in geometry_cache:
+        geometry_cache[key] = RectGeometry(cell_size)
+    return geometry_cache[key]
+
+
+def get_hex_geometry(cell_size: int) -> HexGeometry:
+    key = ('hex', cell_size)
+    if key not in geometry_cache:
+        geometry_cache[key] = HexGeometry(cell_size)
+    return geometry_cache[key]
@@ -0,0 +1,175 @@
+"""
+This module contains double-buffered per-cell state arrays for cellular automata.
+A state holds a read and a write generation of a (height, width) array in offset layout, see cab.ca.ca_array.
+The arrays either live in memory or in numpy.memmap files, for grids that are larger than the RAM.
+Memory-mapped states with a key are kept on disk and reopened by later runs with the same key and grid,
+states without one get a unique key and delete their files when they are closed or garbage collected.
+Generations are computed tile by tile, a tile being a band of consecutive rows, so that memory-mapped
+states are read and written sequentially.
+"""
+
+import os
+import uuid
+import weakref
+
+from typing import Callable, Iterator, List, Tuple
+
+import numpy as np
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+def remove_files(paths: List[str]):
+    for file_name in paths:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+class GridState:
+    """
+    Double-buffered array of one value per cell.
+    """
+
+    def __init__(self, name: str, height: int, width: int, dtype='float64', fill=0,
+                 path: str = None, tile_rows: int = 256, key: str = None):
+        """
+        :param name: Name of the state, used for the file names of memory-mapped arrays.
+        :param height: Number of rows of the grid.
+        :param width: Number of columns of the grid.
+        :param dtype: Numpy type of the values.
+        :param fill: Initial value of all cells, unless an existing file is reopened.
+        :param path: Directory for the memory-mapped arrays, None keeps the arrays in memory.
+        :param tile_rows: Number of rows that are processed at once by sweep().
+        :param key: Prefix of the file names of memory-mapped arrays. Files with a key are kept and reopened,
+                    without one a unique key is chosen and the files are temporary.
+        """
+        self.name = name
+        self.height = height
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.tile_rows = max(1, tile_rows)
+        self.keep_files = key is not None
+        self.file_names: List[str] = []
+        self.finalizer = None
+        if path is None:
+            self.buffers = [np.full((height, width), fill, dtype=self.dtype) for _ in range(2)]
+        else:
+            os.makedirs(path, exist_ok=True)
+            if key is None:
+                key = uuid.uuid4().hex
+            self.buffers = []
+            size = height * width * self.dtype.itemsize
+            for generation in range(2):
+                # Shape and type are part of the name, so a file of the right size holds the right array.
+                file_name = os.path.join(path, '{0}.{1}.{2}.{3}x{4}.{5}.dat'.format(
+                    key, name, self.dtype.str.lstrip('<>=|'), height, width, generation))
+                self.file_names.append(file_name)
+                if os.path.exists(file_name) and os.path.getsize(file_name) == size:
+                    cab_log.trace('[GridState] reopening {0}'.format(file_name))
+                    buffer = np.memmap(file_name, dtype=self.dtype, mode='r+', shape=(height, width))
+                else:
+                    cab_log.trace('[GridState] mapping {0}'.format(file_name))
+                    buffer = np.memmap(file_name, dtype=self.dtype, mode='w+', shape=(height, width))
+                    for (r0, r1) in self.tiles():
+                        buffer[r0:r1] = fill
+                self.buffers.append(buffer)
+            if not self.keep_files:
+                self.finalizer = weakref.finalize(self, remove_files, list(self.file_names))
+        self.current = 0
+
+    @property
+    def read(self) -> np.ndarray:
+        """
+        The current generation. Cells are sensed from it.
+        """
+        return self.buffers[self.current]
+
+    @property
+    def write(self) -> np.ndarray:
+        """
+        The next generation. Cells are updated into it.
+        """
+        return self.buffers[1 - self.current]
+
+    def swap(self):
+        """
+        Make the next generation the current one.
+        """
+        self.current = 1 - self.current
+
+    def tiles(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (first row, end row) of all tiles, top to bottom.
+        """
+        for r0 in range(0, self.height, self.tile_rows):
+            yield r0, min(self.height, r0 + self.tile_rows)
+
+    def read_block(self, r0: int, r1: int, halo: int = 1, wrap_y: bool = False, fill=0) -> np.ndarray:
+        """
+        Returns rows r0 to r1 of the current generation with halo rows above and below.
+        Halo rows beyond the top or bottom edge are either wrapped around or set to fill.
+        """
+        source = self.read
+        lo = r0 - halo
+        hi = r1 + halo
+        if lo >= 0 and hi <= self.height:
+            return np.asarray(source[lo:hi])
+        block = np.full((hi - lo, self.width), fill, dtype=self.dtype)
+        for k, r in enumerate(range(lo, hi)):
+            if 0 <= r < self.height:
+                block[k] = source[r]
+            elif wrap_y:
+                block[k] = source[r % self.height]
+        return block
+
+    def sweep(self, kernel: Callable[[np.ndarray, int], np.ndarray], halo: int = 1,
+              wrap_y: bool = False, fill=0):
+        """
+        Compute the next generation tile by tile and make it the current one.
+        :param kernel: Function (block, row) -> new rows. The block holds the rows of the tile of the current
+                       generation with halo rows on either side, row is the index of the first row of the tile.
+        :param halo: Number of rows the kernel needs to see above and below a tile.
+        :param wrap_y: Whether the top and bottom edges of the grid are connected.
+        :param fill: Value of halo rows beyond the grid.
+        """
+        target = self.write
+        for (r0, r1) in self.tiles():
+            target[r0:r1] = kernel(self.read_block(r0, r1, halo, wrap_y, fill), r0)
+        self.flush()
+        self.swap()
+
+    def set_all(self, value):
+        for buffer in self.buffers:
+            for (r0, r1) in self.tiles():
+                buffer[r0:r1] = value
+
+    def flush(self):
+        """
+        Write memory-mapped generations back to disk.
+        """
+        for buffer in self.buffers:
+            if isinstance(buffer, np.memmap):
+                buffer.flush()
+
+    def close(self):
+        """
+        Release memory-mapped generations. Kept files are written back, with the current generation moved
+        into the first file where it is read from when the state is reopened. Temporary files are deleted.
+        The state can't be used anymore afterwards.
+        """
+        if not self.file_names or not self.buffers:
+            self.buffers = []
+            return
+        if self.keep_files:
+            if self.current == 1:
+                for (r0, r1) in self.tiles():
+                    self.buffers[0][r0:r1] = self.buffers[1][r0:r1]
+                self.current = 0
+            self.flush()
+        self.buffers = []
+        if self.finalizer is not None:
+            self.finalizer()
+        cab_log.trace('[GridState] closed {0}'.format(self.name))
@@ -0,0 +1,377 @@
+"""
+This module contains a Hashlife engine for rectangular CAs with a deterministic two-state outer-totalistic rule.
+The grid is stored as a quadtree whose nodes are hash-consed, so identical regions exist only once, and the
+future of every node is memoized. Large, regular patterns can thereby be advanced by 2^k generations at a time.
+Bounded space has dead cells beyond the borders of the CA, like every other engine of a rectangular CA. It is
+only memoized generation by generation, because the clipping at the borders breaks longer jumps.
+Unbounded space is an infinite plane of dead cells, which has to be asked for.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import cab.ca.ca_array as cab_array
+import cab.ca.rule_engine as cab_rule
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+class Node:
+    """
+    Square of 2^level x 2^level cells. Never create nodes directly, they are interned by Hashlife.join.
+    Nodes are compared by identity, which is what makes the memoization cheap.
+    """
+    __slots__ = ('nw', 'ne', 'sw', 'se', 'level', 'population')
+
+    def __init__(self, nw, ne, sw, se, level: int, population: int):
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.level = level
+        self.population = population
+
+
+DEAD = Node(None, None, None, None, 0, 0)
+ALIVE = Node(None, None, None, None, 0, 1)
+
+
+class Hashlife:
+    """
+    Quadtree universe with memoized evolution.
+    The root covers the cells [origin_x, origin_x + 2^level) x [origin_y, origin_y + 2^level).
+    """
+
+    def __init__(self, ca, rule, bounded: bool = True, palette: Sequence[Tuple[int, int, int]] = None,
+                 max_nodes: int = None):
+        """
+        :param ca: The CA the universe is loaded from and written back to.
+        :param rule: A two-state cab.ca.rule_engine.TotalisticRule or its B/S notation.
+        :param bounded: Whether cells beyond the borders of the CA stay dead, as they do on the CA itself.
+                        False lets patterns leave the CA into an unbounded plane.
+        :param palette: Colors of dead and living cells.
+        :param max_nodes: Number of nodes kept before the caches are dropped, by default gc.HASHLIFE_MAX_NODES.
+        """
+        gc = ca.sys.gc
+        if gc.USE_HEX_CA:
+            raise ValueError('Hashlife is only available for rectangular CAs')
+        if isinstance(rule, str):
+            rule = cab_rule.TotalisticRule.parse(rule)
+        if not rule.is_two_state():
+            raise ValueError('Hashlife needs a two-state rule in B/S notation')
+        self.bounded = bounded
+        if 0 in rule.birth and not self.bounded:
+            raise ValueError('rules with B0 fill the unbounded plane')
+        self.ca = ca
+        self.rule = rule
+        self.width = ca.width
+        self.height = ca.height
+        self.offsets = cab_array.neighbor_offsets(False, gc.USE_MOORE_NEIGHBORHOOD)
+        self.palette = list(palette) if palette is not None else cab_rule.default_palette(gc, 2)
+        self.max_nodes = gc.HASHLIFE_MAX_NODES if max_nodes is None else max_nodes
+        self.generation = 0
+
+        self.nodes: Dict[Tuple[Node, Node, Node, Node], Node] = dict()
+        self.results: Dict[Tuple[Node, int], Node] = dict()
+        self.clipped: Dict[Tuple[Node, Node], Node] = dict()
+        self.empty_nodes: List[Node] = [DEAD]
+        self.full_nodes: List[Node] = [ALIVE]
+
+        # The smallest root whose center quarter holds the whole CA, which keeps the bounded root a fixed size.
+        level = 3
+        while 2 ** (level - 1) < max(self.width, self.height):
+            level += 1
+        self.origin_x = self.origin_y = -2 ** (level - 2)
+        self.root = self.empty(level)
+        self.mask = None
+        if self.bounded:
+            # The successor of the root is its center quarter, which is what the mask covers.
+            quarter = 2 ** (level - 2)
+            self.mask = self.build_rect(level - 1, self.origin_x + quarter, self.origin_y + quarter)
+
+    # --- Node construction ---
+
+    def join(self, nw: Node, ne: Node, sw: Node, se: Node) -> Node:
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node(nw, ne, sw, se, nw.level + 1,
+                        nw.population + ne.population + sw.population + se.population)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, level: int) -> Node:
+        while len(self.empty_nodes) <= level:
+            e = self.empty_nodes[-1]
+            self.empty_nodes.append(self.join(e, e, e, e))
+        return self.empty_nodes[level]
+
+    def full(self, level: int) -> Node:
+        while len(self.full_nodes) <= level:
+            f = self.full_nodes[-1]
+            self.full_nodes.append(self.join(f, f, f, f))
+        return self.full_nodes[level]
+
+    def expand(self):
+        """
+        Surround the root with dead cells, doubling its size while keeping the cells in place.
+        """
+        root = self.root
+        e = self.empty(root.level - 1)
+        self.root = self.join(self.join(e, e, e, root.nw), self.join(e, e, root.ne, e),
+                              self.join(e, root.sw, e, e), self.join(root.se, e, e, e))
+        self.origin_x -= 2 ** (root.level - 1)
+        self.origin_y -= 2 ** (root.level - 1)
+
+    def build(self, points: List[Tuple[int, int]], level: int, x0: int, y0: int) -> Node:
+        """
+        Build the node of the given level with its top left cell at x0, y0 from the positions of living cells.
+        """
+        if not points:
+            return self.empty(level)
+        if level == 0:
+            return ALIVE
+        half = 2 ** (level - 1)
+        quadrants = ([], [], [], [])
+        for (x, y) in points:
+            quadrants[(x >= x0 + half) + 2 * (y >= y0 + half)].append((x, y))
+        return self.join(self.build(quadrants[0], level - 1, x0, y0),
+                         self.build(quadrants[1], level - 1, x0 + half, y0),
+                         self.build(quadrants[2], level - 1, x0, y0 + half),
+                         self.build(quadrants[3], level - 1, x0 + half, y0 + half))
+
+    def build_rect(self, level: int, x0: int, y0: int) -> Node:
+        """
+        Build the node of the given level with its top left cell at x0, y0 that is alive exactly inside the CA.
+        """
+        size = 2 ** level
+        if x0 >= self.width or y0 >= self.height or x0 + size <= 0 or y0 + size <= 0:
+            return self.empty(level)
+        if x0 >= 0 and y0 >= 0 and x0 + size <= self.width and y0 + size <= self.height:
+            return self.full(level)
+        half = size // 2
+        return self.join(self.build_rect(level - 1, x0, y0), self.build_rect(level - 1, x0 + half, y0),
+                         self.build_rect(level - 1, x0, y0 + half),
+                         self.build_rect(level - 1, x0 + half, y0 + half))
+
+    def clip(self, node: Node, mask: Node) -> Node:
+        """
+        Returns the cells that are alive in both nodes.
+        """
+        if node.population == 0 or mask.population == 2 ** (2 * mask.level):
+            return node
+        if mask.population == 0:
+            return self.empty(node.level)
+        key = (node, mask)
+        result = self.clipped.get(key)
+        if result is None:
+            result = self.join(self.clip(node.nw, mask.nw), self.clip(node.ne, mask.ne),
+                               self.clip(node.sw, mask.sw), self.clip(node.se, mask.se))
+            self.clipped[key] = result
+        return result
+
+    # --- Evolution ---
+
+    def step_base(self, node: Node) -> Node:
+        """
+        Brute force the center 2x2 cells of a 4x4 node one generation ahead.
+        """
+        cells = [[0] * 4 for _ in range(4)]
+        for qy, row in ((0, (node.nw, node.ne)), (2, (node.sw, node.se))):
+            for qx, quadrant in zip((0, 2), row):
+                for dy, line in ((0, (quadrant.nw, quadrant.ne)), (1, (quadrant.sw, quadrant.se))):
+                    for dx, leaf in zip((0, 1), line):
+                        cells[qy + dy][qx + dx] = leaf.population
+        result = []
+        for y in (1, 2):
+            for x in (1, 2):
+                count = sum(cells[y + dy][x + dx] for (dx, dy) in self.offsets)
+                alive = count in self.rule.survival if cells[y][x] else count in self.rule.birth
+                result.append(ALIVE if alive else DEAD)
+        return self.join(*result)
+
+    def successor(self, node: Node, j: int) -> Node:
+        """
+        Returns the center of the node, advanced by 2^j generations. Needs j <= node.level - 2.
+        """
+        if node.population == 0 and 0 not in self.rule.birth:
+            return node.nw
+        key = (node, j)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if node.level == 2:
+            result = self.step_base(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            join = self.join
+            # Jumps of the full 2^(level - 2) generations are made in two halves.
+            half = j if j < node.level - 2 else j - 1
+            c1 = self.successor(nw, half)
+            c2 = self.successor(join(nw.ne, ne.nw, nw.se, ne.sw), half)
+            c3 = self.successor(ne, half)
+            c4 = self.successor(join(nw.sw, nw.se, sw.nw, sw.ne), half)
+            c5 = self.successor(join(nw.se, ne.sw, sw.ne, se.nw), half)
+            c6 = self.successor(join(ne.sw, ne.se, se.nw, se.ne), half)
+            c7 = self.successor(sw, half)
+            c8 = self.successor(join(sw.ne, se.nw, sw.se, se.sw), half)
+            c9 = self.successor(se, half)
+            if half == j:
+                # The nine sub-squares already went all the way, only their centers are combined.
+                result = join(join(c1.se, c2.sw, c4.ne, c5.nw), join(c2.se, c3.sw, c5.ne, c6.nw),
+                              join(c4.se, c5.sw, c7.ne, c8.nw), join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                result = join(self.successor(join(c1, c2, c4, c5), half),
+                              self.successor(join(c2, c3, c5, c6), half),
+                              self.successor(join(c4, c5, c7, c8), half),
+                              self.successor(join(c5, c6, c8, c9), half))
+        self.results[key] = result
+        return result
+
+    def is_padded(self) -> bool:
+        """
+        Whether all living cells lie in the center quarter of the root.
+        """
+        root = self.root
+        return root.population == (root.nw.se.population + root.ne.sw.population +
+                                   root.sw.ne.population + root.se.nw.population)
+
+    def advance(self, k: int):
+        """
+        Advance the universe by 2^k generations.
+        """
+        if self.bounded:
+            for _ in range(2 ** k):
+                self.advance_bounded()
+        else:
+            while self.root.level < k + 3 or not self.is_padded():
+                self.expand()
+            self.expand()
+            level = self.root.level
+            self.root = self.successor(self.root, k)
+            self.origin_x += 2 ** (level - 2)
+            self.origin_y += 2 ** (level - 2)
+            self.generation += 2 ** k
+            self.collect_if_needed()
+
+    def advance_by(self, generations: int):
+        """
+        Advance the universe by any number of generations, using the largest possible jumps.
+        """
+        k = 0
+        while generations:
+            if generations & 1:
+                self.advance(k)
+            generations >>= 1
+            k += 1
+
+    def advance_bounded(self):
+        """
+        Advance one generation and kill all cells beyond the borders. The root keeps its size and origin.
+        """
+        center = self.clip(self.successor(self.root, 0), self.mask)
+        e = self.empty(center.level - 1)
+        self.root = self.join(self.join(e, e, e, center.nw), self.join(e, e, center.ne, e),
+                              self.join(e, center.sw, e, e), self.join(center.se, e, e, e))
+        self.generation += 1
+        self.collect_if_needed()
+
+    def step(self):
+        """
+        Advance one generation and update the cells of the CA, the hook called by cycle_automaton.
+        """
+        self.advance(0)
+        self.sync_cells()
+
+    # --- Cache management ---
+
+    def collect_if_needed(self):
+        if len(self.nodes) > self.max_nodes:
+            self.collect()
+
+    def collect(self):
+        """
+        Drop all caches and rebuild the node table from the nodes that are still in use.
+        """
+        cab_log.trace('[Hashlife] dropping {0} nodes and {1} results'.format(len(self.nodes), len(self.results)))
+        self.nodes = dict()
+        self.results = dict()
+        self.clipped = dict()
+        self.empty_nodes = [DEAD]
+        self.full_nodes = [ALIVE]
+        interned: Dict[int, Node] = {id(DEAD): DEAD, id(ALIVE): ALIVE}
+
+        def intern(node: Node) -> Node:
+            result = interned.get(id(node))
+            if result is None:
+                result = self.join(intern(node.nw), intern(node.ne), intern(node.sw), intern(node.se))
+                interned[id(node)] = result
+            return result
+
+        self.root = intern(self.root)
+        if self.mask is not None:
+            self.mask = intern(self.mask)
+
+    # --- Conversion to and from the CA ---
+
+    def get_state(self, x: int, y: int) -> int:
+        node = self.root
+        x -= self.origin_x
+        y -= self.origin_y
+        size = 2 ** node.level
+        if not (0 <= x < size and 0 <= y < size):
+            return 0
+        while node.level > 0:
+            if node.population == 0:
+                return 0
+            size //= 2
+            node = (node.nw, node.ne, node.sw, node.se)[(x >= size) + 2 * (y >= size)]
+            x %= size
+            y %= size
+        return node.population
+
+    def set_cells(self, points: Iterable[Tuple[int, int]]):
+        """
+        Replace the universe with the given living cells, keeping the generation counter.
+        """
+        points = list(points)
+        if self.bounded:
+            points = [(x, y) for (x, y) in points if 0 <= x < self.width and 0 <= y < self.height]
+        else:
+            while any(not (0 <= x - self.origin_x < 2 ** self.root.level and
+                           0 <= y - self.origin_y < 2 ** self.root.level) for (x, y) in points):
+                self.expand()
+        self.root = self.build(points, self.root.level, self.origin_x, self.origin_y)
+
+    def load_from_cells(self, get_state):
+        """
+        Initialize the universe from the cells of the CA.
+        :param get_state: Function that returns whether a cell is alive.
+        """
+        self.set_cells(pos for pos, cell in self.ca.ca_grid.items() if get_state(cell))
+
+    def live_cells(self) -> List[Tuple[int, int]]:
+        """
+        Returns the positions of all living cells, also those beyond the CA in unbounded space.
+        """
+        cells = []
+        stack = [(self.root, self.origin_x, self.origin_y)]
+        while stack:
+            node, x, y = stack.pop()
+            if node.population == 0:
+                continue
+            if node.level == 0:
+                cells.append((x, y))
+                continue
+            half = 2 ** (node.level - 1)
+            stack.extend(((node.nw, x, y), (node.ne, x + half, y),
+                          (node.sw, x, y + half), (node.se, x + half, y + half)))
+        return cells
+
+    def sync_cells(self):
+        """
+        Set the colors of the cells of the CA from the universe.
+        """
+        alive = set(self.live_cells())
+        for pos, cell in self.ca.ca_grid.items():
+            cell.color = self.palette[pos in alive]
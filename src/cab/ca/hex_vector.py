@@ -0,0 +1,162 @@
+"""
+This module contains array versions of the hex coordinate methods of CAHex.
+All functions take numpy arrays or scalars, broadcast them against each other and return arrays,
+so coordinates of many agents, cells or pixels are converted in one call.
+Coordinates follow CAHex: axial (q, r) for storage, cube (x, y, z) with x + y + z = 0 for algorithms,
+offset (i, j) = (q + floor(r / 2), r) for arrays, and pixel centers as drawn by cab.ca.geometry.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+from cab.ca.ca_array import HEX_AXIAL_DIRECTIONS
+
+__author__ = 'Michael Wagner'
+
+
+SQRT3 = np.sqrt(3.0)
+
+
+# --- Conversions ---
+
+def axial_to_cube(q, r) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    q = np.asarray(q)
+    r = np.asarray(r)
+    return q, r, -q - r
+
+
+def cube_to_axial(x, y, z) -> Tuple[np.ndarray, np.ndarray]:
+    return np.asarray(x), np.asarray(y)
+
+
+def axial_to_offset(q, r) -> Tuple[np.ndarray, np.ndarray]:
+    r = np.asarray(r)
+    return np.asarray(q) + np.floor_divide(r, 2), r
+
+
+def offset_to_axial(i, j) -> Tuple[np.ndarray, np.ndarray]:
+    j = np.asarray(j)
+    return np.asarray(i) - np.floor_divide(j, 2), j
+
+
+def offset_to_cube(i, j) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return axial_to_cube(*offset_to_axial(i, j))
+
+
+def cube_round(x, y, z) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Round cube coordinates to the nearest hex, like CAHex.cube_round.
+    :returns Integer cube coordinates.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    rx, ry, rz = np.round(x), np.round(y), np.round(z)
+    dx, dy, dz = np.abs(rx - x), np.abs(ry - y), np.abs(rz - z)
+    fix_x = (dx > dy) & (dx > dz)
+    fix_y = ~fix_x & (dy > dz)
+    fix_z = ~fix_x & ~fix_y
+    rx = np.where(fix_x, -ry - rz, rx)
+    ry = np.where(fix_y, -rx - rz, ry)
+    rz = np.where(fix_z, -rx - ry, rz)
+    return rx.astype(np.int64), ry.astype(np.int64), rz.astype(np.int64)
+
+
+def hex_round(q, r) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Round fractional axial coordinates to the nearest hex, like CAHex.hex_round.
+    """
+    return cube_to_axial(*cube_round(*axial_to_cube(q, r)))
+
+
+def pixel_to_hex(px, py, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the axial coordinates of the hexes that contain the pixels, e.g. for mouse picking.
+    """
+    px = np.asarray(px, dtype=np.float64) / cell_size
+    py = np.asarray(py, dtype=np.float64) / cell_size
+    return hex_round(px * SQRT3 / 3 - py / 3, py * 2 / 3)
+
+
+def hex_to_pixel(q, r, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the pixel centers of the hexes, see HexGeometry.outline.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    r = np.asarray(r, dtype=np.float64)
+    return cell_size * SQRT3 * (q + r / 2), cell_size * 1.5 * r
+
+
+# --- Distances ---
+
+def hex_distance(q1, r1, q2, r2) -> np.ndarray:
+    """
+    Returns the number of steps between hexes, like CAHex.hex_distance, but as integers.
+    """
+    dq = np.asarray(q1) - np.asarray(q2)
+    dr = np.asarray(r1) - np.asarray(r2)
+    return (np.abs(dq) + np.abs(dq + dr) + np.abs(dr)) // 2
+
+
+def distance_matrix(q1, r1, q2, r2) -> np.ndarray:
+    """
+    Returns the distances between every hex of the first and every hex of the second set,
+    as array of shape (len(q1), len(q2)).
+    """
+    return hex_distance(np.asarray(q1)[:, np.newaxis], np.asarray(r1)[:, np.newaxis],
+                        np.asarray(q2)[np.newaxis, :], np.asarray(r2)[np.newaxis, :])
+
+
+# --- Shapes ---
+
+def ring(q: int, r: int, radius: int) -> np.ndarray:
+    """
+    Returns the hexes at the given distance around q, r, walking around counter-clockwise.
+    :returns Axial coordinates as array of shape (6 * radius, 2), or (1, 2) for radius 0.
+    """
+    if radius == 0:
+        return np.array([[q, r]], dtype=np.int64)
+    directions = np.array(HEX_AXIAL_DIRECTIONS, dtype=np.int64)
+    # Start radius steps in direction 4 and walk radius steps along each direction.
+    corners = np.array([q, r]) + radius * directions[4] + radius * np.cumsum(
+        np.vstack([[0, 0], directions[:5]]), axis=0)
+    steps = np.arange(radius)[np.newaxis, :, np.newaxis] * directions[:, np.newaxis, :]
+    return (corners[:, np.newaxis, :] + steps).reshape(-1, 2)
+
+
+def spiral(q: int, r: int, radius: int) -> np.ndarray:
+    """
+    Returns q, r and the rings around it up to the given distance, from the inside out.
+    :returns Axial coordinates as array of shape (1 + 3 * radius * (radius + 1), 2).
+    """
+    return np.vstack([ring(q, r, k) for k in range(radius + 1)])
+
+
+def line(q1: int, r1: int, q2: int, r2: int) -> np.ndarray:
+    """
+    Returns the hexes on the straight line from q1, r1 to q2, r2, both included.
+    :returns Axial coordinates as array of shape (distance + 1, 2).
+    """
+    n = int(hex_distance(q1, r1, q2, r2))
+    t = np.linspace(0.0, 1.0, n + 1) if n > 0 else np.zeros(1)
+    x1, y1, z1 = axial_to_cube(q1, r1)
+    x2, y2, z2 = axial_to_cube(q2, r2)
+    # The nudge keeps points on an edge between two hexes from being rounded inconsistently.
+    x = x1 + (x2 - x1) * t + 1e-6
+    y = y1 + (y2 - y1) * t + 2e-6
+    z = z1 + (z2 - z1) * t - 3e-6
+    return np.stack(cube_to_axial(*cube_round(x, y, z)), axis=1)
+
+
+def step_towards(q1, r1, q2, r2) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the first hex to go to from q1, r1 towards q2, r2, like CAHex.get_cell_in_direction,
+    and q2, r2 itself where both are the same.
+    """
+    x1, y1, z1 = axial_to_cube(q1, r1)
+    x2, y2, z2 = axial_to_cube(q2, r2)
+    n = hex_distance(q1, r1, q2, r2)
+    t = 1.0 / np.maximum(n, 1)
+    x, y, z = cube_round(x1 + (x2 - x1) * t, y1 + (y2 - y1) * t, z1 + (z2 - z1) * t)
+    return cube_to_axial(x, y, z)
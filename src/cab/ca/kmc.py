@@ -0,0 +1,125 @@
+"""
+This module contains the asynchronous, stochastic update of cellular automata by kinetic Monte Carlo.
+Every cell exposes the rate of its next event by CACell.get_event_rate(). Events are drawn one at a time
+(Gillespie's direct method): the time to the next event is exponentially distributed with the total rate,
+and the cell is chosen with probability proportional to its rate. Rates are kept in a sum tree, so drawing
+an event and updating the rates of the firing cell and its neighbors both take O(log N).
+The cost of a time unit thereby depends on the number of events, not on the size of the grid.
+"""
+
+import math
+
+from typing import List
+
+import cab.util.logging as cab_log
+import cab.util.rng as cab_rng
+
+__author__ = 'Michael Wagner'
+
+
+class RateTree:
+    """
+    Complete binary tree whose leaves are the rates of the cells and whose inner nodes are the sums of
+    their children, stored in a list with the root at index 1.
+    """
+
+    def __init__(self, num_leaves: int):
+        self.size = 1
+        while self.size < num_leaves:
+            self.size *= 2
+        self.tree: List[float] = [0.0] * (2 * self.size)
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    def get(self, i: int) -> float:
+        return self.tree[self.size + i]
+
+    def update(self, i: int, rate: float):
+        """
+        Set the rate of leaf i. The sums are recomputed instead of adjusted, so rounding errors don't pile up.
+        """
+        tree = self.tree
+        j = self.size + i
+        tree[j] = rate
+        j //= 2
+        while j:
+            tree[j] = tree[2 * j] + tree[2 * j + 1]
+            j //= 2
+
+    def sample(self, target: float) -> int:
+        """
+        Returns the leaf in whose interval the target falls, for a target in [0, total).
+        """
+        tree = self.tree
+        j = 1
+        while j < self.size:
+            left = tree[2 * j]
+            if target < left or tree[2 * j + 1] <= 0.0:
+                j = 2 * j
+            else:
+                target -= left
+                j = 2 * j + 1
+        return j - self.size
+
+
+class KineticMonteCarlo:
+    """
+    Fires the events of the cells of a CA in continuous time.
+    After a cell fired, the rates of the cell and its neighbors are recomputed. If a rate also depends on
+    cells further away, call update_rate for them.
+    """
+
+    def __init__(self, ca, time_per_step: float = 1.0):
+        """
+        :param ca: The CA whose cells fire events.
+        :param time_per_step: Simulated time that passes with every call of step().
+        """
+        self.ca = ca
+        self.time_per_step = time_per_step
+        self.rng = cab_rng.get_RNG()
+        self.time = 0.0
+        self.num_events = 0
+        self.cells = list(ca.ca_grid.values())
+        self.index = {(cell.x, cell.y): i for i, cell in enumerate(self.cells)}
+        self.rates = RateTree(len(self.cells))
+        for i, cell in enumerate(self.cells):
+            self.rates.update(i, cell.get_event_rate())
+        cab_log.trace('[KineticMonteCarlo] total rate {0}'.format(self.rates.total))
+
+    def update_rate(self, cell):
+        self.rates.update(self.index[cell.x, cell.y], cell.get_event_rate())
+
+    def fire_next(self, until: float = math.inf) -> bool:
+        """
+        Fire the next event if it happens before the given time, otherwise advance the time to it.
+        :returns Whether an event was fired.
+        """
+        total = self.rates.total
+        if total <= 0.0:
+            self.time = max(self.time, until)
+            return False
+        next_time = self.time - math.log(1.0 - self.rng.random()) / total
+        if next_time > until:
+            # Events are memoryless, so the event after 'until' can be drawn anew later.
+            self.time = until
+            return False
+        self.time = next_time
+        cell = self.cells[self.rates.sample(self.rng.random() * total)]
+        cell.fire_event()
+        self.update_rate(cell)
+        for neighbor in cell.neighbors:
+            self.update_rate(neighbor)
+        self.num_events += 1
+        return True
+
+    def run_until(self, time: float):
+        while self.fire_next(time):
+            pass
+
+    def step(self):
+        """
+        Advance the simulated time by time_per_step, the hook called by cycle_automaton.
+        """
+        self.run_until(self.time + self.time_per_step)
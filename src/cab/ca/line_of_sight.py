@@ -0,0 +1,248 @@
+"""
+This module contains the line of sight service of the cellular automaton.
+A cell is visible from another one if no opaque cell lies on the line between them, the line being
+drawn by Bresenham's algorithm on rectangular grids and by interpolating cube coordinates on hexagonal ones.
+The lines to all cells within a radius only depend on the radius and the grid type, so they are computed
+once and shared as a ray tree: lines with the same beginning share their nodes, and a field of view is a
+single walk over the tree that skips everything behind an opaque cell. Fields of view are cached per
+position and radius until a cell they looked at changes its opacity.
+Whether a cell blocks the view is decided by CACell.is_opaque().
+"""
+
+import collections
+
+from typing import Callable, Dict, List, Set, Tuple
+
+import cab.ca.ca_hex as cab_ca_hex
+
+__author__ = 'Michael Wagner'
+
+
+def bresenham_line(dx: int, dy: int) -> List[Tuple[int, int]]:
+    """
+    Returns the cells on the line from 0, 0 to dx, dy, both included.
+    """
+    cells = []
+    x, y = 0, 0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    dx, dy = abs(dx), abs(dy)
+    error = dx - dy
+    while True:
+        cells.append((x * step_x, y * step_y))
+        if x == dx and y == dy:
+            return cells
+        double_error = 2 * error
+        if double_error > -dy:
+            error -= dy
+            x += 1
+        if double_error < dx:
+            error += dx
+            y += 1
+
+
+def hex_line(dq: int, dr: int) -> List[Tuple[int, int]]:
+    """
+    Returns the hexes on the line from 0, 0 to dq, dr, both included.
+    """
+    n = int(cab_ca_hex.CAHex.hex_distance(0, 0, dq, dr))
+    cells = []
+    for k in range(n + 1):
+        t = k / n if n else 0.0
+        # The nudge keeps points on an edge between two hexes from being rounded inconsistently.
+        x, y, _ = cab_ca_hex.CAHex.cube_round(dq * t + 1e-6, dr * t + 2e-6, -(dq + dr) * t - 3e-6)
+        cells.append((x, y))
+    return cells
+
+
+class RayTree:
+    """
+    The lines from the origin to all cells within a radius, merged where they begin the same way,
+    flattened in depth first order. Node i has the offset dx[i], dy[i] from the origin, is the end of
+    the line to its offset if terminal[i] is set, and its subtree ends before index skip[i].
+    """
+
+    def __init__(self, use_hex: bool, use_moore: bool, radius: int):
+        self.radius = radius
+        offsets = []
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                if use_hex:
+                    distance = cab_ca_hex.CAHex.hex_distance(0, 0, dx, dy)
+                elif use_moore:
+                    distance = max(abs(dx), abs(dy))
+                else:
+                    distance = abs(dx) + abs(dy)
+                if distance <= radius:
+                    offsets.append((distance, dx, dy))
+        offsets.sort()
+        # Nested dictionaries: offset -> [terminal, children].
+        root = [False, dict()]
+        for _, dx, dy in offsets:
+            node = root
+            line = hex_line(dx, dy) if use_hex else bresenham_line(dx, dy)
+            for offset in line[1:]:
+                node = node[1].setdefault(offset, [False, dict()])
+            node[0] = True
+        root[0] = True
+        self.dx: List[int] = []
+        self.dy: List[int] = []
+        self.terminal: List[bool] = []
+        self.skip: List[int] = []
+        self.flatten((0, 0), root)
+
+    def flatten(self, offset: Tuple[int, int], node):
+        # Iterative, the depth of the tree grows with the radius.
+        stack = [(offset, node, False)]
+        while stack:
+            offset, node, done = stack.pop()
+            if done:
+                self.skip[node] = len(self.dx)
+                continue
+            index = len(self.dx)
+            self.dx.append(offset[0])
+            self.dy.append(offset[1])
+            self.terminal.append(node[0])
+            self.skip.append(0)
+            stack.append((None, index, True))
+            for child_offset, child in reversed(list(node[1].items())):
+                stack.append((child_offset, child, False))
+
+    def __len__(self) -> int:
+        return len(self.dx)
+
+
+# Ray trees by grid type and radius, shared by all CAs.
+ray_trees: Dict[Tuple[bool, bool, int], RayTree] = dict()
+
+
+def get_ray_tree(use_hex: bool, use_moore: bool, radius: int) -> RayTree:
+    key = (use_hex, use_hex or use_moore, radius)
+    if key not in ray_trees:
+        ray_trees[key] = RayTree(use_hex, use_moore, radius)
+    return ray_trees[key]
+
+
+class LineOfSight:
+    """
+    Answers visibility queries on the grid of a CA and caches fields of view.
+    Call notify_opacity_changed whenever is_opaque() of a cell changes its answer.
+    """
+
+    def __init__(self, ca, max_cached: int = 4096):
+        """
+        :param ca: The CA to look across.
+        :param max_cached: Number of fields of view kept in the cache, the least recently used one is dropped first.
+        """
+        self.ca = ca
+        self.use_hex = ca.sys.gc.USE_HEX_CA
+        self.use_moore = ca.sys.gc.USE_MOORE_NEIGHBORHOOD
+        self.max_cached = max_cached
+        self.fields: Dict[Tuple[int, int, int], Tuple[Set, Set]] = collections.OrderedDict()
+        # Cached fields of view per cell whose opacity they depend on.
+        self.dependents: Dict[Tuple[int, int], Set[Tuple[int, int, int]]] = collections.defaultdict(set)
+
+    def shift(self, x: int, y: int, dx: int, dy: int) -> Tuple[int, int]:
+        """
+        Returns the position dx, dy away from x, y, across the edges of the grid that wrap around.
+        """
+        x += dx
+        y += dy
+        if self.use_hex:
+            if self.ca.wrap_x:
+                i, j = self.ca.to_offset(x, y)
+                x, y = self.ca.from_offset(i % self.ca.width, j)
+            return x, y
+        if self.ca.wrap_x:
+            x %= self.ca.width
+        if self.ca.wrap_y:
+            y %= self.ca.height
+        return x, y
+
+    def compute_field_of_view(self, x: int, y: int, radius: int,
+                              opaque: Callable = None) -> Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]:
+        """
+        :returns The visible positions and the positions whose opacity was looked at.
+        """
+        tree = get_ray_tree(self.use_hex, self.use_moore, radius)
+        grid = self.ca.ca_grid
+        is_opaque = opaque if opaque is not None else lambda cell: cell.is_opaque()
+        dx, dy, terminal, skip = tree.dx, tree.dy, tree.terminal, tree.skip
+        visible = set()
+        examined = set()
+        i = 0
+        n = len(tree)
+        while i < n:
+            pos = self.shift(x, y, dx[i], dy[i])
+            if pos not in grid:
+                i = skip[i]
+                continue
+            if terminal[i]:
+                visible.add(pos)
+            # Opaque cells are seen but hide what is behind them, the origin never blocks.
+            if i > 0 and skip[i] > i + 1:
+                examined.add(pos)
+                if is_opaque(grid[pos]):
+                    i = skip[i]
+                    continue
+            i += 1
+        return visible, examined
+
+    def field_of_view(self, x: int, y: int, radius: int, opaque: Callable = None) -> Set[Tuple[int, int]]:
+        """
+        Returns the positions visible from x, y within the radius, measured in steps of the neighborhood.
+        :param opaque: Predicate that tells whether a cell blocks the view, instead of CACell.is_opaque.
+            Fields of view with a custom predicate are not cached.
+        :returns Set of positions, which must not be changed.
+        """
+        if opaque is not None:
+            return self.compute_field_of_view(x, y, radius, opaque)[0]
+        key = (x, y, radius)
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key][0]
+        visible, examined = self.compute_field_of_view(x, y, radius)
+        self.fields[key] = (visible, examined)
+        for pos in examined:
+            self.dependents[pos].add(key)
+        if len(self.fields) > self.max_cached:
+            self.drop(next(iter(self.fields)))
+        return visible
+
+    def is_visible(self, x1: int, y1: int, x2: int, y2: int, opaque: Callable = None) -> bool:
+        """
+        Whether x2, y2 can be seen from x1, y1, without a limit on the distance.
+        """
+        if (x1, y1) == (x2, y2):
+            return True
+        if self.use_hex:
+            line = hex_line(x2 - x1, y2 - y1)
+        else:
+            line = bresenham_line(x2 - x1, y2 - y1)
+        grid = self.ca.ca_grid
+        is_opaque = opaque if opaque is not None else lambda cell: cell.is_opaque()
+        for (dx, dy) in line[1:-1]:
+            pos = self.shift(x1, y1, dx, dy)
+            if pos not in grid or is_opaque(grid[pos]):
+                return False
+        return self.shift(x1, y1, *line[-1]) in grid
+
+    def drop(self, key: Tuple[int, int, int]):
+        _, examined = self.fields.pop(key)
+        for pos in examined:
+            dependents = self.dependents.get(pos)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self.dependents[pos]
+
+    def notify_opacity_changed(self, pos: Tuple[int, int]):
+        """
+        Drop the cached fields of view that looked at the cell.
+        """
+        for key in list(self.dependents.get(pos, ())):
+            self.drop(key)
+
+    def clear(self):
+        self.fields.clear()
+        self.dependents.clear()
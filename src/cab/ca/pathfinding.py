@@ -0,0 +1,195 @@
+"""
+This module contains the pathfinding service of the cellular automaton.
+Single queries are answered with A*, while agents that share their destinations use flow fields:
+a distance to the closest target for every reachable cell, computed once and cached per target set.
+Whether a cell can be entered is decided by CACell.is_passable().
+"""
+
+import collections
+import heapq
+
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+class FlowField:
+    """
+    Distances of all cells that can reach a set of targets, measured in steps.
+    """
+
+    def __init__(self, targets: FrozenSet[Tuple[int, int]]):
+        self.targets = targets
+        self.distances: Dict[Tuple[int, int], int] = dict()
+        self.dirty = True
+
+    def get_distance(self, pos: Tuple[int, int]) -> Optional[int]:
+        """
+        Returns the number of steps from the position to the closest target, None if no target is reachable.
+        """
+        return self.distances.get(pos)
+
+
+class PathFinder:
+    """
+    Answers path queries on the grid of a CA and caches flow fields between steps.
+    Call notify_passability_changed whenever is_passable() of a cell changes its answer.
+    """
+
+    def __init__(self, ca, max_fields: int = 16):
+        """
+        :param ca: The CA to find paths on.
+        :param max_fields: Number of flow fields kept in the cache, the least recently used one is dropped first.
+        """
+        self.ca = ca
+        self.max_fields = max_fields
+        self.fields: Dict[FrozenSet[Tuple[int, int]], FlowField] = collections.OrderedDict()
+
+    def is_passable(self, pos: Tuple[int, int]) -> bool:
+        return self.ca.ca_grid[pos].is_passable()
+
+    def heuristic(self, a: Tuple[int, int], b: Tuple[int, int]) -> int:
+        """
+        Lower bound of the number of steps between two positions. Zero if the grid wraps around.
+        """
+        if self.ca.wrap_x or self.ca.wrap_y:
+            return 0
+        if self.ca.sys.gc.USE_HEX_CA:
+            return int(self.ca.hex_distance(a[0], a[1], b[0], b[1]))
+        elif self.ca.sys.gc.USE_MOORE_NEIGHBORHOOD:
+            return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+        else:
+            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    def find_path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        Find a shortest path with A*.
+        :returns List of positions from start to goal, both included. Empty if goal can't be reached.
+        """
+        if start == goal:
+            return [start]
+        came_from = {start: None}
+        cost = {start: 0}
+        counter = 0
+        frontier = [(self.heuristic(start, goal), counter, start)]
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            if current == goal:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = came_from[current]
+                path.reverse()
+                return path
+            for pos in self.ca.neighbor_positions(*current):
+                new_cost = cost[current] + 1
+                if (pos not in cost or new_cost < cost[pos]) and (pos == goal or self.is_passable(pos)):
+                    cost[pos] = new_cost
+                    came_from[pos] = current
+                    counter += 1
+                    heapq.heappush(frontier, (new_cost + self.heuristic(pos, goal), counter, pos))
+        return []
+
+    def get_flow_field(self, targets: Iterable[Tuple[int, int]]) -> FlowField:
+        """
+        Returns the flow field towards the given targets, computing it only if it is not cached or outdated.
+        """
+        key = frozenset(targets)
+        field = self.fields.get(key)
+        if field is None:
+            field = FlowField(key)
+            self.fields[key] = field
+            if len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(key)
+        if field.dirty:
+            self.compute_flow_field(field)
+        return field
+
+    def compute_flow_field(self, field: FlowField):
+        """
+        Breadth-first search from all targets at once.
+        """
+        cab_log.trace('[PathFinder] computing flow field for {0} targets'.format(len(field.targets)))
+        distances = {pos: 0 for pos in field.targets}
+        queue = collections.deque(field.targets)
+        self.propagate(distances, queue)
+        field.distances = distances
+        field.dirty = False
+
+    def propagate(self, distances: Dict[Tuple[int, int], int], queue: collections.deque):
+        """
+        Continue a breadth-first search, lowering the distances of all cells reachable from the queue.
+        """
+        neighbor_positions = self.ca.neighbor_positions
+        while queue:
+            current = queue.popleft()
+            d = distances[current] + 1
+            for pos in neighbor_positions(*current):
+                if d < distances.get(pos, d + 1) and self.is_passable(pos):
+                    distances[pos] = d
+                    queue.append(pos)
+
+    def next_step(self, pos: Tuple[int, int], targets: Iterable[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        """
+        Returns the neighboring position that leads towards the closest target.
+        :returns The next position, pos itself if it is a target, None if no target is reachable.
+        """
+        field = self.get_flow_field(targets)
+        best = field.distances.get(pos)
+        if best is None:
+            return None
+        if best == 0:
+            return pos
+        step = None
+        for n in self.ca.neighbor_positions(*pos):
+            d = field.distances.get(n)
+            if d is not None and d < best:
+                best = d
+                step = n
+        return step
+
+    def notify_passability_changed(self, pos: Tuple[int, int]):
+        """
+        Update the cached flow fields after a cell became passable or impassable. Only the cells whose
+        distance depends on the changed cell are touched, fields it isn't part of stay as they are.
+        A cell that opens up only lowers distances, which is propagated from that cell. A closed cell
+        is repaired by close_cell.
+        """
+        passable = self.is_passable(pos)
+        for field in self.fields.values():
+            if field.dirty or pos in field.targets:
+                continue
+            if not passable:
+                if pos in field.distances:
+                    self.close_cell(field.distances, pos)
+                continue
+            reached = [field.distances[n] for n in self.ca.neighbor_positions(*pos) if n in field.distances]
+            if reached and min(reached) + 1 < field.distances.get(pos, min(reached) + 2):
+                field.distances[pos] = min(reached) + 1
+                self.propagate(field.distances, collections.deque([pos]))
+
+    def close_cell(self, distances: Dict[Tuple[int, int], int], pos: Tuple[int, int]):
+        """
+        Remove a cell that became impassable from a flow field. Cells that have no other neighbor one step
+        closer to a target lose their distance as well, in order of distance. They are reached again from the
+        cells around them that kept theirs.
+        """
+        neighbor_positions = self.ca.neighbor_positions
+        lost = {pos: distances.pop(pos)}
+        queue = collections.deque([pos])
+        while queue:
+            current = queue.popleft()
+            d = lost[current] + 1
+            for n in neighbor_positions(*current):
+                if distances.get(n) == d and not any(distances.get(m) == d - 1 for m in neighbor_positions(*n)):
+                    lost[n] = distances.pop(n)
+                    queue.append(n)
+        border = {n for lost_pos in lost for n in neighbor_positions(*lost_pos) if n in distances}
+        self.propagate(distances, collections.deque(sorted(border, key=distances.get)))
+
+    def clear(self):
+        self.fields.clear()
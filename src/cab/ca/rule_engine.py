@@ -0,0 +1,170 @@
+"""
+This module contains a declarative rule engine for outer-totalistic cellular automata.
+A rule maps the state of a cell and the sum of the states of its neighbors to the next state. It is compiled
+into a lookup table and applied to a whole generation at once, counting neighbors with array operations
+instead of calling sense_neighborhood and update on every cell.
+"""
+
+import re
+
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+import cab.ca.ca_array as cab_array
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+class TotalisticRule:
+    """
+    Outer-totalistic rule with a finite number of states.
+    next state = table[state][sum of neighbor states]
+    For two-state rules the neighbor sum is simply the number of living neighbors.
+    """
+
+    def __init__(self, table: Sequence[Sequence[int]], num_states: int = 2):
+        """
+        :param table: For each state a list of next states, indexed by the sum of the neighbor states.
+                      Sums beyond the end of a list keep the cell in its state.
+        :param num_states: Number of states, numbered 0 to num_states - 1.
+        """
+        self.table = [list(row) for row in table]
+        self.num_states = num_states
+        self.birth = None
+        self.survival = None
+
+    @classmethod
+    def from_birth_survival(cls, birth: Iterable[int], survival: Iterable[int]) -> 'TotalisticRule':
+        """
+        Create a two-state rule from the neighbor counts that let a dead cell be born or a living cell survive.
+        """
+        birth = frozenset(birth)
+        survival = frozenset(survival)
+        # No neighborhood has more than 8 cells.
+        dead = [1 if n in birth else 0 for n in range(9)]
+        alive = [1 if n in survival else 0 for n in range(9)]
+        rule = cls([dead, alive], 2)
+        rule.birth = birth
+        rule.survival = survival
+        return rule
+
+    @classmethod
+    def parse(cls, notation: str) -> 'TotalisticRule':
+        """
+        Create a two-state rule from its B/S notation, e.g. "B3/S23" for Conway's Game of Life.
+        """
+        match = re.fullmatch(r'\s*[Bb](\d*)\s*/\s*[Ss](\d*)\s*', notation)
+        if match is None:
+            raise ValueError('rule "{0}" is not in B/S notation'.format(notation))
+        return cls.from_birth_survival([int(c) for c in match.group(1)], [int(c) for c in match.group(2)])
+
+    def is_two_state(self) -> bool:
+        return self.birth is not None
+
+    def compile(self, num_neighbors: int) -> np.ndarray:
+        """
+        Build the lookup table for a neighborhood of the given size.
+        :returns Array of shape (num_states, maximum neighbor sum + 1).
+        """
+        max_sum = (self.num_states - 1) * num_neighbors
+        lookup = np.empty((self.num_states, max_sum + 1), dtype=np.uint8)
+        for state in range(self.num_states):
+            row = self.table[state]
+            for s in range(max_sum + 1):
+                lookup[state, s] = row[s] if s < len(row) else state
+        return lookup
+
+
+def default_palette(gc, num_states: int) -> List[Tuple[int, int, int]]:
+    """
+    State 0 gets the default cell color, the other states are shades from gray to white.
+    """
+    palette = [gc.DEFAULT_CELL_COLOR]
+    for state in range(1, num_states):
+        shade = 127 + int(128 * state / (num_states - 1))
+        palette.append((shade, shade, shade))
+    return palette
+
+
+class RuleEngine:
+    """
+    Steps the CA by applying a compiled TotalisticRule to a grid state.
+    The state of every cell is mirrored into the color attribute of its cell, so all visualizers keep working.
+    """
+
+    def __init__(self, ca, rule: TotalisticRule, palette: Sequence[Tuple[int, int, int]] = None,
+                 sync_colors: bool = True):
+        """
+        :param ca: The CA to step.
+        :param rule: The rule to apply.
+        :param palette: Color of each state.
+        :param sync_colors: Whether cell colors are updated after every generation. Disable for headless runs.
+        """
+        self.ca = ca
+        self.rule = rule
+        self.use_hex = ca.sys.gc.USE_HEX_CA
+        self.use_moore = ca.sys.gc.USE_MOORE_NEIGHBORHOOD
+        num_neighbors = len(cab_array.neighbor_offsets(self.use_hex, self.use_moore))
+        self.lookup = rule.compile(num_neighbors)
+        self.palette = list(palette) if palette is not None else default_palette(ca.sys.gc, rule.num_states)
+        self.sync_colors = sync_colors
+        self.state = ca.create_grid_state('rule_state', 'uint8', 0)
+        cab_log.trace('[RuleEngine] compiled rule to table of shape {0}'.format(self.lookup.shape))
+
+    def get_state(self, x: int, y: int) -> int:
+        i, j = self.ca.to_offset(x, y)
+        return int(self.state.read[j, i])
+
+    def set_state(self, x: int, y: int, value: int):
+        i, j = self.ca.to_offset(x, y)
+        self.state.read[j, i] = value
+        if self.sync_colors:
+            self.ca.ca_grid[x, y].color = self.palette[value]
+
+    def load_from_cells(self, get_state):
+        """
+        Initialize the states from the cells.
+        :param get_state: Function that returns the state of a cell.
+        """
+        for (x, y), cell in self.ca.ca_grid.items():
+            self.set_state(x, y, get_state(cell))
+
+    def step(self):
+        """
+        Compute the next generation.
+        """
+        lookup = self.lookup
+        use_hex = self.use_hex
+        use_moore = self.use_moore
+        wrap_x = self.ca.wrap_x
+
+        def kernel(block, row):
+            sums = cab_array.neighbor_sum(block, row, 1, use_hex, use_moore, wrap_x, dtype=np.int32)
+            return lookup[block[1:-1], sums]
+
+        self.ca.sweep_grid_state(self.state, kernel)
+        if self.sync_colors:
+            self.update_colors()
+
+    def update_colors(self):
+        """
+        Set the color of every cell that changed its state in the last generation.
+        """
+        new = self.state.read
+        old = self.state.write
+        grid = self.ca.ca_grid
+        palette = self.palette
+        from_offset = self.ca.from_offset
+        for (r0, r1) in self.state.tiles():
+            rows, cols = np.nonzero(new[r0:r1] != old[r0:r1])
+            values = new[r0:r1][rows, cols]
+            for j, i, value in zip((rows + r0).tolist(), cols.tolist(), values.tolist()):
+                grid[from_offset(i, j)].color = palette[value]
+
+    def sync_all_colors(self):
+        values = self.state.read
+        for (x, y), cell in self.ca.ca_grid.items():
+            i, j = self.ca.to_offset(x, y)
+            cell.color = self.palette[values[j, i]]
@@ -0,0 +1,151 @@
+"""
+This module contains the topology cache of the cellular automata.
+The topology of a grid, which cell is a neighbor of which, only depends on a few constants. It is computed
+once per configuration and kept as flat integer arrays: cells are numbered in offset layout,
+row * width + column, which is also the order in which the CAs create them.
+Topologies are shared by all CAs of a process, are inherited without copying by forked workers as long as
+nobody writes to them, and are optionally stored in gc.TOPOLOGY_CACHE_PATH to be reused by later runs.
+Geometry templates are cached separately, see cab.ca.geometry.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from array import array
+from typing import Dict, List, Tuple
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+# Increase whenever the stored format or the wiring of the CAs changes, to invalidate the disk cache.
+TOPOLOGY_VERSION = 2
+
+
+class Topology:
+    """
+    Neighbors of all cells in compressed sparse rows: the neighbors of cell k are the cells
+    neighbor_indices[neighbor_starts[k]:neighbor_starts[k + 1]], in the order the CA wires them.
+    """
+
+    def __init__(self, width: int, height: int, use_hex: bool, neighbor_starts: array, neighbor_indices: array):
+        self.width = width
+        self.height = height
+        self.use_hex = use_hex
+        self.neighbor_starts = neighbor_starts
+        self.neighbor_indices = neighbor_indices
+
+    def __len__(self) -> int:
+        return self.width * self.height
+
+    def position(self, index: int) -> Tuple[int, int]:
+        """
+        Returns the grid position of the cell with the given index.
+        """
+        j, i = divmod(index, self.width)
+        if self.use_hex:
+            return i - j // 2, j
+        return i, j
+
+    def index(self, x: int, y: int) -> int:
+        if self.use_hex:
+            return y * self.width + x + y // 2
+        return y * self.width + x
+
+    def neighbors(self, index: int) -> array:
+        return self.neighbor_indices[self.neighbor_starts[index]:self.neighbor_starts[index + 1]]
+
+
+def topology_key(ca) -> Tuple:
+    gc = ca.sys.gc
+    if gc.USE_HEX_CA:
+        return (TOPOLOGY_VERSION, ca.width, ca.height, True, None, gc.USE_CA_BORDERS,
+                tuple(tuple(d) for d in gc.HEX_DIRECTIONS))
+    return TOPOLOGY_VERSION, ca.width, ca.height, False, gc.USE_MOORE_NEIGHBORHOOD, gc.USE_CA_BORDERS, None
+
+
+def build_topology(ca) -> Topology:
+    """
+    Compute the topology of the grid of a CA from its neighbor_positions.
+    """
+    width, height = ca.width, ca.height
+    use_hex = ca.sys.gc.USE_HEX_CA
+    starts = array('q', [0])
+    indices = array('q')
+    for j in range(height):
+        for i in range(width):
+            x, y = ca.from_offset(i, j)
+            for (nx, ny) in ca.neighbor_positions(x, y):
+                ni, nj = ca.to_offset(nx, ny)
+                indices.append(nj * width + ni)
+            starts.append(len(indices))
+    return Topology(width, height, use_hex, starts, indices)
+
+
+# Topologies of this process by key.
+topologies: Dict[Tuple, Topology] = dict()
+
+
+def cache_file(directory: str, key: Tuple) -> str:
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(directory, 'topology-{0}.pickle'.format(digest))
+
+
+def get_topology(ca) -> Topology:
+    """
+    Returns the topology of the grid of a CA, from the cache of this process, from the disk cache
+    in gc.TOPOLOGY_CACHE_PATH, or newly computed, in that order.
+    """
+    key = topology_key(ca)
+    topology = topologies.get(key)
+    if topology is not None:
+        return topology
+    directory = ca.sys.gc.TOPOLOGY_CACHE_PATH
+    path = cache_file(directory, key) if directory is not None else None
+    if path is not None and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                topology = pickle.load(f)
+            cab_log.trace('[Topology] loaded {0}'.format(path))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # A broken file, e.g. from an interrupted run, is replaced.
+            topology = None
+    if topology is None:
+        topology = build_topology(ca)
+        if path is not None:
+            store(topology, path)
+    topologies[key] = topology
+    return topology
+
+
+def store(topology: Topology, path: str):
+    """
+    Write a topology to the disk cache. The file appears at once, so concurrent runs never read half of it.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(topology, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        cab_log.trace('[Topology] stored {0}'.format(path))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def connect_cells(cells: List, topology: Topology):
+    """
+    Set the neighbors of all cells of a CA from its topology.
+    Border cells are marked when the cells are created, see CAHex.create_cell.
+    :param cells: The cells in the order of the topology.
+    """
+    starts = topology.neighbor_starts
+    indices = topology.neighbor_indices
+    for k, cell in enumerate(cells):
+        cell.set_neighbors([cells[n] for n in indices[starts[k]:starts[k + 1]]])
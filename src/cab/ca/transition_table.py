@@ -0,0 +1,151 @@
+"""
+This module tabulates the transitions of cell classes with a finite set of states.
+A cell class that declares its states in the class attribute STATES and keeps its current state in the
+attribute state can be stepped by table lookups instead of calling sense_neighborhood and update on every cell.
+The table is filled lazily: whenever a configuration, i.e. the state of a cell and the states of its neighbors
+in the order of cell.neighbors, occurs for the first time, the methods of one cell that has it are called
+and the resulting state is memoized for all cells with the same configuration.
+This requires that the next state of a cell depends only on its configuration, not on its position,
+other attributes of its neighbors or random numbers.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+# Configurations with at most this many codes are looked up in a dense array, larger ones in a dictionary.
+DENSE_TABLE_LIMIT = 1 << 22
+
+
+class TransitionTable:
+    """
+    Steps the cells of a CA by looking up memoized transitions of their configurations.
+    """
+
+    def __init__(self, ca, states: Sequence = None, sync_cells: bool = True):
+        """
+        :param ca: The CA to step.
+        :param states: The states of the cells, by default the STATES attribute of the cell class.
+        :param sync_cells: Whether the state and color attributes of changed cells are updated after every
+                           generation. Disable for headless runs and call sync_all_cells() when needed.
+        """
+        self.ca = ca
+        self.cells = list(ca.ca_grid.values())
+        if states is None:
+            states = getattr(type(self.cells[0]), 'STATES', None)
+            if states is None:
+                raise ValueError('cell class {0} does not declare its STATES'.format(type(self.cells[0]).__name__))
+        self.states = list(states)
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+        self.sync_cells = sync_cells
+        # Color of the cells in each state, as observed after their update.
+        self.colors = [None] * len(self.states)
+
+        num_cells = len(self.cells)
+        position_index = {(cell.x, cell.y): i for i, cell in enumerate(self.cells)}
+        max_neighbors = max(len(cell.neighbors) for cell in self.cells)
+        # Missing neighbors point to an extra entry at the end of the values, holding the pseudo state 'absent'.
+        self.neighbor_index = np.full((num_cells, max_neighbors), num_cells, dtype=np.int64)
+        for i, cell in enumerate(self.cells):
+            for k, neighbor in enumerate(cell.neighbors):
+                self.neighbor_index[i, k] = position_index[neighbor.x, neighbor.y]
+        self.values = np.empty(num_cells + 1, dtype=np.int64)
+        self.values[num_cells] = len(self.states)
+        self.load_from_cells()
+
+        base = len(self.states) + 1
+        num_codes = base ** (max_neighbors + 1)
+        if num_codes >= 2 ** 63:
+            raise ValueError('{0} states with {1} neighbors are too many to tabulate'.format(base - 1, max_neighbors))
+        self.weights = base ** np.arange(max_neighbors + 1, dtype=np.int64)
+        if num_codes <= DENSE_TABLE_LIMIT:
+            self.dense = np.full(num_codes, -1, dtype=np.int64)
+        else:
+            self.dense = None
+        self.table = dict()
+        cab_log.trace('[TransitionTable] {0} states, {1} possible configurations'.format(base - 1, num_codes))
+
+    def __len__(self) -> int:
+        """
+        Number of configurations that have been tabulated so far.
+        """
+        return len(self.table)
+
+    def load_from_cells(self):
+        """
+        Read the states from the cells, e.g. after the user changed some of them.
+        """
+        for i, cell in enumerate(self.cells):
+            self.values[i] = self.state_index[cell.state]
+
+    def encode(self) -> np.ndarray:
+        """
+        Returns the configuration code of every cell.
+        """
+        values = self.values
+        codes = values[:-1] * self.weights[0]
+        codes += (values[self.neighbor_index] * self.weights[1:]).sum(axis=1)
+        return codes
+
+    def step(self):
+        """
+        Compute the next generation.
+        """
+        codes = self.encode()
+        if self.dense is not None:
+            new = self.dense[codes]
+            unknown = new < 0
+            if unknown.any():
+                self.learn(codes, unknown)
+                new = self.dense[codes]
+        else:
+            unique, inverse = np.unique(codes, return_inverse=True)
+            unknown = np.array([code not in self.table for code in unique.tolist()], dtype=bool)
+            if unknown.any():
+                self.learn(codes, unknown[inverse])
+            new = np.array([self.table[code] for code in unique.tolist()], dtype=np.int64)[inverse]
+        changed = np.flatnonzero(new != self.values[:-1])
+        self.values[:-1] = new
+        if self.sync_cells:
+            for i in changed.tolist():
+                self.sync_cell(i)
+
+    def learn(self, codes: np.ndarray, unknown: np.ndarray):
+        """
+        Tabulate the configurations of the masked cells by running the methods of one cell per configuration.
+        """
+        candidates = np.flatnonzero(unknown)
+        unique, first = np.unique(codes[candidates], return_index=True)
+        representatives = [self.cells[i] for i in candidates[first].tolist()]
+        cab_log.trace('[TransitionTable] tabulating {0} new configurations'.format(len(unique)))
+        if not self.sync_cells:
+            # Cell attributes may be outdated, so the representatives and their neighbors are refreshed first.
+            for i in candidates[first].tolist():
+                self.sync_cell(i)
+                for j in self.neighbor_index[i].tolist():
+                    if j < len(self.cells):
+                        self.sync_cell(j)
+        for cell in representatives:
+            cell.sense_neighborhood()
+        for code, cell in zip(unique.tolist(), representatives):
+            cell.update()
+            new = self.state_index[cell.state]
+            self.table[code] = new
+            self.colors[new] = cell.color
+            if self.dense is not None:
+                self.dense[code] = new
+
+    def sync_cell(self, i: int):
+        cell = self.cells[i]
+        value = int(self.values[i])
+        cell.state = self.states[value]
+        if self.colors[value] is not None:
+            cell.color = self.colors[value]
+
+    def sync_all_cells(self):
+        for i in range(len(self.cells)):
+            self.sync_cell(i)
@@ -62,6 +62,13 @@ class ComplexAutomaton:
                 self.ca = ca_rect.CARect(self)
             self.proto_cell = None
 
+        # Check whether the simulation should run independently from the GUI.
+        self.worker = None
+        if self.gc.USE_SIMULATION_THREAD and self.gc.GUI in ("TK", "TkImage", "PyGame"):
+            import cab.util.simulation_worker as cab_worker
+            cab_log.trace('[ComplexAutomaton] initializing simulation thread')
+            self.worker = cab_worker.SimulationWorker(self.gc, self)
+
         # Check for the UI that we want to use.
         if self.gc.GUI == None:
             import cab.util.io_headless as cab_io_hl
@@ -72,10 +79,18 @@ class ComplexAutomaton:
             import cab.util.io_tk as cab_io_tk
             cab_log.trace('[ComplexAutomaton] initializing Tk IO')
             self.visualizer = cab_io_tk.TkIO(self.gc, self)
+        elif self.gc.GUI == "TkImage":
+            import cab.util.io_tk_image as cab_io_tk_image
+            cab_log.trace('[ComplexAutomaton] initializing Tk image IO')
+            self.visualizer = cab_io_tk_image.TkImageIO(self.gc, self)
         elif self.gc.GUI == "PyGame":
             import cab.util.io_pygame as cab_io_pg
             cab_log.trace('[ComplexAutomaton] initializing Pygame IO')
             self.visualizer = cab_io_pg.PygameIO(self.gc, self)
+        elif self.gc.GUI == "Export":
+            import cab.util.io_export as cab_io_ex
+            cab_log.trace('[ComplexAutomaton] initializing frame export')
+            self.visualizer = cab_io_ex.ExportIO(self.gc, self)
         self.display_info()
 
     def display_info(self):
@@ -84,6 +99,7 @@ class ComplexAutomaton:
               "\n        [SPACE] pause/resume simulation"
               "\n          [S]   step simulation        "
               "\n          [R]   reset simulation       "
+              "\n          [F]   fast-forward simulation"
               "\n ".format(self.gc.TITLE, self.gc.VERSION))
 
     def reset_simulation(self):
@@ -92,7 +108,9 @@ class ComplexAutomaton:
         TODO: Improve this, as not everything that can be modified is reset.
         """
         cab_log.info('resetting simulation')
+        self.gc.NEXT_AGENT_ID = 0
         self.abm.__init__(self.gc, proto_agent=self.proto_agent)
+        self.ca.close_grid_states()
         self.ca.__init__(self, proto_cell=self.proto_cell)
         self.gc.TIME_STEP = 0
 
@@ -107,4 +125,6 @@ class ComplexAutomaton:
         """
         print("simulation log:")
         print()
+        if self.worker is not None:
+            self.worker.start()
         self.visualizer.render_simulation()
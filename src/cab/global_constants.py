@@ -9,7 +9,7 @@ class GlobalConstants:
     def __init__(self):
         self.VERSION = "version: 11-2018"
         self.TITLE = "TITLE"
-        self.GUI = None  # Options: "TK", "PyGame"
+        self.GUI = None  # Options: "TK", "TkImage", "PyGame", "Export"
         ################################
         #     SIMULATION CONSTANTS     #
         ################################
@@ -17,6 +17,17 @@ class GlobalConstants:
         self.RUN_SIMULATION = False
         self.TIME_STEP = 0
         self.ONE_AGENT_PER_CELL = False
+        # Agents propose actions on a snapshot of the world, which are then resolved, see cab.abm.two_phase.
+        self.USE_TWO_PHASE_AGENTS = False
+        self.TWO_PHASE_EXECUTOR = None  # Options: None (sequential), "thread", "process"
+        self.TWO_PHASE_WORKERS = 4
+        # Agents only act when they are due, see CabAgent.sleep_until and CabAgent.wait_for_event.
+        self.USE_EVENT_SCHEDULER = False
+        # Run the simulation in a background thread, the GUI then only renders snapshots.
+        self.USE_SIMULATION_THREAD = False
+        self.TARGET_STEPS_PER_SECOND = None  # None means as fast as possible.
+        self.TARGET_FPS = 30
+        self.FAST_FORWARD_STEPS = 1000
         ################################
         #         CA CONSTANTS         #
         ################################
@@ -29,10 +40,30 @@ class GlobalConstants:
         self.GRID_HEIGHT = self.DIM_Y * self.CELL_SIZE
         self.DEFAULT_CELL_COLOR = (34, 42, 48)
         self.DEFAULT_GRID_COLOR = (0, 0, 0)
+        self.DISPLAY_GRID = True
+        # Create cells in tiles of CHUNK_SIZE x CHUNK_SIZE only when they are first accessed.
+        self.USE_CHUNKED_GRID = False
+        self.CHUNK_SIZE = 64
+        # Directory for memory-mapped grid states, None keeps them in memory.
+        self.GRID_STATE_PATH = None
+        # Prefix of the memory-mapped files, which are then kept and reopened by later runs. None deletes them.
+        self.GRID_STATE_KEY = None
+        self.GRID_STATE_TILE_ROWS = 256
+        # Update cells asynchronously by the events they expose, see CACell.get_event_rate.
+        self.USE_ASYNC_CA = False
+        self.ASYNC_CA_TIME_PER_STEP = 1.0
+        # Convolution kernels with more non-zero weights than this are applied by FFT.
+        self.CONVOLUTION_MAX_DIRECT_TAPS = 49
+        # Wire the cells from a topology shared by all grids of the same size and type, see cab.ca.topology.
+        self.USE_TOPOLOGY_CACHE = False
+        # Directory where topologies are stored for later runs, None keeps them in memory only.
+        self.TOPOLOGY_CACHE_PATH = None
         ################################
         # Specifically for Rect. CAs   #
         ################################
         self.USE_MOORE_NEIGHBORHOOD = True
+        # Number of quadtree nodes the Hashlife engine keeps before it drops its caches.
+        self.HASHLIFE_MAX_NODES = 1 << 20
         ################################
         # Specifically for Hex CAs     #
         ################################
@@ -42,6 +73,20 @@ class GlobalConstants:
         #        ABM CONSTANTS         #
         ################################
         self.DEFAULT_AGENT_COLOR = (0, 255, 0)
+        # Id of the next agent, ids are counted per simulation and restart on reset.
+        self.NEXT_AGENT_ID = 0
+        # Recycle the objects of dead agents for new ones, see ABM.create_agent. None means no limit.
+        self.USE_AGENT_POOL = False
+        self.AGENT_POOL_SIZE = None
         ################################
         #      UTILITY CONSTANTS       #
         ################################
+        # Frame export, used if GUI is "Export".
+        self.EXPORT_PATH = "frames"
+        self.EXPORT_NUM_STEPS = 1000
+        self.EXPORT_EVERY_K_STEPS = 1
+        self.EXPORT_THREADS = 4
+        # Command of an encoder that reads raw RGB frames from stdin, None writes PNG files instead.
+        # Example: ["ffmpeg", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{width}x{height}",
+        #           "-r", "30", "-i", "-", "out.mp4"]
+        self.EXPORT_ENCODER_CMD = None
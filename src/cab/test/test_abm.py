@@ -0,0 +1,533 @@
+# CAB libraries
+from cab.abm.agent import CabAgent
+from cab.abm.continuous import ContinuousAgent, cell_at
+from cab.complex_automaton import ComplexAutomaton
+from cab.global_constants import GlobalConstants
+import cab.abm.two_phase as cab_two_phase
+
+# External libraries
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class StepRightAgent(CabAgent):
+    """
+    Proposes to move one cell to the right.
+    """
+
+    def __init__(self, x, y, gc, a_id):
+        super().__init__(x, y, gc)
+        self.a_id = a_id
+
+    def perceive_and_act(self, abm, ca):
+        pass
+
+    def propose(self, world):
+        return [cab_two_phase.Move(self.a_id, self.x + 1, self.y)]
+
+
+class TwoPhaseTestCase(unittest.TestCase):
+    """
+    Tests for the propose and commit execution of agents.
+    """
+
+    def make_simulation(self, positions):
+        gc = GlobalConstants()
+        gc.USE_TWO_PHASE_AGENTS = True
+        gc.ONE_AGENT_PER_CELL = True
+        simulation = ComplexAutomaton(gc)
+        for i, (x, y) in enumerate(positions):
+            simulation.abm.add_agent(StepRightAgent(x, y, gc, 'agent-{0}'.format(i)))
+        simulation.abm.schedule_new_agents()
+        return simulation
+
+    def test_queue_moves_along(self):
+        simulation = self.make_simulation([(1, 1), (2, 1), (3, 1)])
+        simulation.step_simulation()
+        self.assertEqual(sorted(simulation.abm.agent_locations), [(2, 1), (3, 1), (4, 1)])
+
+    def test_blocked_agent_stays(self):
+        simulation = self.make_simulation([(1, 1), (2, 1)])
+        blocker = simulation.abm.agent_locations[2, 1]
+        blocker.propose = lambda world: []
+        simulation.step_simulation()
+        self.assertEqual(sorted(simulation.abm.agent_locations), [(1, 1), (2, 1)])
+
+    def test_conflicts_are_reproducible(self):
+        winners = set()
+        for _ in range(3):
+            simulation = self.make_simulation([(1, 1), (3, 1)])
+            # Both agents claim the cell in between.
+            simulation.abm.agent_locations[3, 1].propose = lambda world, a_id='agent-1': [
+                cab_two_phase.Move(a_id, 2, 1)]
+            simulation.step_simulation()
+            self.assertEqual(len(simulation.abm.agent_locations), 2)
+            self.assertIn((2, 1), simulation.abm.agent_locations)
+            winners.add(simulation.abm.agent_locations[2, 1].a_id)
+        self.assertEqual(len(winners), 1)
+
+    def test_executors_agree(self):
+        outcomes = []
+        for executor in (None, 'thread', 'process'):
+            gc = GlobalConstants()
+            gc.USE_TWO_PHASE_AGENTS = True
+            gc.TWO_PHASE_EXECUTOR = executor
+            gc.TWO_PHASE_WORKERS = 2
+            simulation = ComplexAutomaton(gc)
+            for i in range(6):
+                simulation.abm.add_agent(BreederAgent(i, i, gc))
+            simulation.abm.schedule_new_agents()
+            simulation.step_simulation()
+            pool = simulation.abm.process_pool
+            for _ in range(7):
+                simulation.step_simulation()
+            # The worker processes are kept for all steps.
+            self.assertIs(simulation.abm.process_pool, pool)
+            self.assertEqual(pool is not None, executor == 'process' and cab_two_phase.can_fork())
+            agents = simulation.abm.agent_set
+            self.assertTrue(all(agent.gc is gc for agent in agents))
+            outcomes.append((sorted((a.a_id, a.x, a.y, a.age, a.born, a.marked) for a in agents),
+                             sorted(pos for pos, cell in simulation.ca.ca_grid.items() if cell.color == (1, 2, 3))))
+        self.assertGreater(len(outcomes[0][0]), 6)
+        self.assertEqual(outcomes[1], outcomes[0])
+        self.assertEqual(outcomes[2], outcomes[0])
+
+    def test_dead_agents_leave_their_cells_at_once(self):
+        gc = GlobalConstants()
+        gc.USE_TWO_PHASE_AGENTS = True
+        gc.ONE_AGENT_PER_CELL = True
+        gc.DIM_X = gc.DIM_Y = 5
+        gc.GRID_WIDTH = gc.GRID_HEIGHT = 5 * gc.CELL_SIZE
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        mover = StepRightAgent(1, 1, gc, 'mover')
+        victim = StepRightAgent(2, 1, gc, 'victim')
+        victim.propose = lambda world: [cab_two_phase.Die('victim')]
+        abm.add_agent(mover)
+        abm.add_agent(victim)
+        abm.schedule_new_agents()
+        self.assertEqual(abm.count_free_cells(), 23)
+        simulation.step_simulation()
+        self.assertEqual(abm.agent_locations, {(2, 1): mover})
+        self.assertEqual(abm.count_free_cells(), 24)
+        simulation.step_simulation()
+        self.assertEqual(abm.agent_locations, {(3, 1): mover})
+        self.assertEqual(abm.count_free_cells(), 24)
+        self.assertTrue(abm.get_occupancy().is_free(2, 1))
+
+
+class BreederAgent(CabAgent):
+    """
+    Walks to the right, marks its cells, has offspring every third step and dies at the age of seven.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.age = 0
+        self.born = gc.TIME_STEP
+        # Number of steps it started on a cell that was marked before.
+        self.marked = 0
+
+    def perceive_and_act(self, abm, ca):
+        pass
+
+    def propose(self, world):
+        actions = [cab_two_phase.Move(self.a_id, (self.x + 1) % self.gc.DIM_X, self.y),
+                   cab_two_phase.SetAttributes(self.a_id, {
+                       'age': self.age + 1,
+                       'marked': self.marked + (world.ca.ca_grid[self.x, self.y].color == (1, 2, 3))}),
+                   cab_two_phase.ModifyCell(self.a_id, self.x, self.y, {'color': (1, 2, 3)})]
+        if self.age % 3 == 2:
+            actions.append(cab_two_phase.Spawn(self.a_id, BreederAgent(self.x, world.time_step % 5, self.gc)))
+        if self.age == 6:
+            actions.append(cab_two_phase.Die(self.a_id))
+        return actions
+
+
+class SleepyAgent(CabAgent):
+    """
+    Records when it acts and then sleeps, or waits for an event if it has one.
+    """
+
+    def __init__(self, x, y, gc, nap, event=None):
+        super().__init__(x, y, gc)
+        self.nap = nap
+        self.event = event
+        self.acted = []
+
+    def perceive_and_act(self, abm, ca):
+        self.acted.append(self.gc.TIME_STEP)
+        if self.event is not None:
+            self.wait_for_event(self.event)
+        else:
+            self.sleep_for(self.nap)
+
+
+class EventSchedulerTestCase(unittest.TestCase):
+    """
+    Tests for the discrete-event scheduling of agents.
+    """
+
+    def test_agents_act_when_due(self):
+        gc = GlobalConstants()
+        gc.USE_EVENT_SCHEDULER = True
+        simulation = ComplexAutomaton(gc)
+        sleeper = SleepyAgent(1, 1, gc, 10)
+        waiter = SleepyAgent(2, 2, gc, 0, 'rain')
+        simulation.abm.add_agent(sleeper)
+        simulation.abm.add_agent(waiter)
+        simulation.abm.schedule_new_agents()
+        for _ in range(25):
+            if gc.TIME_STEP == 12:
+                simulation.abm.trigger_event('rain')
+            simulation.step_simulation()
+        self.assertEqual(sleeper.acted, [0, 10, 20])
+        self.assertEqual(waiter.acted, [0, 12])
+
+    def test_agents_killed_while_waiting_are_removed(self):
+        gc = GlobalConstants()
+        gc.USE_EVENT_SCHEDULER = True
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        sleeper = SleepyAgent(1, 1, gc, 100)
+        waiter = SleepyAgent(2, 2, gc, 0, 'rain')
+        abm.add_agent(sleeper)
+        abm.add_agent(waiter)
+        abm.schedule_new_agents()
+        simulation.step_simulation()
+        self.assertEqual(len(abm.scheduler), 2)
+        self.assertIn(waiter, abm.scheduler.waiting['rain'])
+        sleeper.dead = True
+        waiter.dead = True
+        simulation.step_simulation()
+        self.assertEqual(abm.agent_set, set())
+        self.assertEqual(abm.agent_locations, dict())
+        self.assertEqual(abm.count_agents(SleepyAgent), 0)
+        self.assertEqual(len(abm.scheduler), 0)
+        self.assertEqual(abm.scheduler.waiting, dict())
+        self.assertEqual(abm.scheduler.killed, [])
+        abm.trigger_event('rain')
+        simulation.step_simulation()
+        self.assertEqual(waiter.acted, [0])
+
+    def test_dead_can_be_set_before_the_agent_is_initialized(self):
+        class StillbornAgent(SleepyAgent):
+            def __init__(self, x, y, gc):
+                self.dead = True
+                super().__init__(x, y, gc, 1)
+
+        gc = GlobalConstants()
+        gc.USE_EVENT_SCHEDULER = True
+        simulation = ComplexAutomaton(gc)
+        agent = StillbornAgent(1, 1, gc)
+        simulation.abm.add_agent(agent)
+        simulation.abm.schedule_new_agents()
+        self.assertIs(agent.killed_agents, simulation.abm.scheduler.killed)
+        agent.dead = True
+        self.assertEqual(simulation.abm.scheduler.killed, [agent])
+        simulation.reset_simulation()
+        self.assertEqual(simulation.abm.scheduler.killed, [])
+
+    def test_waiting_agents_are_listed_once(self):
+        gc = GlobalConstants()
+        gc.USE_EVENT_SCHEDULER = True
+        simulation = ComplexAutomaton(gc)
+        waiter = SleepyAgent(2, 2, gc, 0, 'rain')
+        # Waits for rain, but gives up after a step.
+        waiter.perceive_and_act = lambda abm, ca: waiter.wait_for_event('rain', timeout=1)
+        simulation.abm.add_agent(waiter)
+        simulation.abm.schedule_new_agents()
+        for _ in range(200):
+            simulation.step_simulation()
+            self.assertLessEqual(len(simulation.abm.scheduler.waiting.get('rain', {})), 1)
+        self.assertEqual(len(simulation.abm.scheduler.queue), 1)
+
+
+class OccupancyTestCase(unittest.TestCase):
+    """
+    Tests for the index of free cells.
+    """
+
+    def test_free_cells_follow_agents(self):
+        for use_hex in (False, True):
+            gc = GlobalConstants()
+            gc.USE_HEX_CA = use_hex
+            gc.ONE_AGENT_PER_CELL = True
+            simulation = ComplexAutomaton(gc)
+            abm = simulation.abm
+            num_cells = len(simulation.ca.ca_grid)
+            self.assertEqual(abm.count_free_cells(), num_cells)
+            agents = []
+            for _ in range(num_cells - 1):
+                x, y = abm.random_free_position()
+                self.assertIn((x, y), simulation.ca.ca_grid)
+                agents.append(SleepyAgent(x, y, gc, 1))
+                abm.add_agent(agents[-1])
+            self.assertEqual(len(abm.agent_locations), num_cells - 1)
+            last = abm.random_free_position()
+            self.assertNotIn(last, abm.agent_locations)
+            neighbor = agents[0]
+            neighbor.prev_x, neighbor.prev_y = neighbor.x, neighbor.y
+            neighbor.x, neighbor.y = last
+            abm.update_agent_position(neighbor)
+            self.assertEqual(abm.random_free_position(), (neighbor.prev_x, neighbor.prev_y))
+            abm.remove_agent(agents[1])
+            self.assertEqual(abm.count_free_cells(), 2)
+            free = {pos for pos in simulation.ca.ca_grid if pos not in abm.agent_locations}
+            self.assertEqual(len(free), 2)
+            for _ in range(10):
+                self.assertIn(abm.random_free_position(), free)
+                neighbor = abm.random_free_neighbor(simulation.ca, *last)
+                self.assertTrue(neighbor is None or neighbor in free)
+
+    def test_moving_onto_a_killed_agent(self):
+        gc = GlobalConstants()
+        gc.ONE_AGENT_PER_CELL = True
+        gc.DIM_X = gc.DIM_Y = 5
+        gc.GRID_WIDTH = gc.GRID_HEIGHT = 5 * gc.CELL_SIZE
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        prey = SleepyAgent(2, 2, gc, 1)
+        hunter = HunterAgent(1, 2, gc, prey)
+        abm.add_agent(prey)
+        abm.add_agent(hunter)
+        abm.schedule_new_agents()
+        self.assertEqual(abm.count_free_cells(), 23)
+        simulation.step_simulation()
+        self.assertEqual(abm.agent_set, {hunter})
+        self.assertIs(abm.agent_locations[2, 2], hunter)
+        self.assertEqual(abm.count_free_cells(), 24)
+        simulation.step_simulation()
+        self.assertEqual(list(abm.agent_locations), [(3, 2)])
+        self.assertEqual(abm.count_free_cells(), 24)
+        self.assertTrue(abm.get_occupancy().is_free(2, 2))
+
+
+class HunterAgent(CabAgent):
+    """
+    Kills its prey and takes its cell in the first step, then walks one cell to the right.
+    """
+
+    def __init__(self, x, y, gc, prey):
+        super().__init__(x, y, gc)
+        self.prey = prey
+
+    def perceive_and_act(self, abm, ca):
+        self.prev_x, self.prev_y = self.x, self.y
+        if self.prey is not None:
+            self.prey.dead = True
+            self.x, self.y = self.prey.x, self.prey.y
+            self.prey = None
+        else:
+            self.x += 1
+
+
+class GrazerAgent(SleepyAgent):
+    """
+    Gains energy every step and dies when it has enough.
+    """
+    TAGS = ('animal',)
+    AGGREGATED_ATTRIBUTES = ('energy',)
+
+    def __init__(self, x, y, gc, energy):
+        super().__init__(x, y, gc, 0)
+        self.energy = energy
+
+    def reset(self, x, y, energy):
+        super().reset(x, y)
+        self.energy = energy
+        self.acted = []
+
+    def perceive_and_act(self, abm, ca):
+        self.energy += 1
+        self.dead = self.energy >= 3
+
+
+class RegistryTestCase(unittest.TestCase):
+    """
+    Tests for the indexes of agents by class and tag.
+    """
+
+    def test_counts_and_sums_follow_agents(self):
+        gc = GlobalConstants()
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        grazers = [GrazerAgent(i, 0, gc, i) for i in range(3)]
+        for agent in grazers + [SleepyAgent(5, 5, gc, 1)]:
+            abm.add_agent(agent)
+        abm.schedule_new_agents()
+        self.assertEqual(abm.count_agents(), 4)
+        self.assertEqual(abm.count_agents(SleepyAgent), 4)
+        self.assertEqual(abm.get_agents(GrazerAgent), set(grazers))
+        self.assertEqual(abm.count_agents(tag='animal'), 3)
+        self.assertEqual(abm.sum_agent_attribute(GrazerAgent, 'energy'), 3)
+        simulation.step_simulation()
+        # The grazer that reached 3 energy died, the others have 1 and 2.
+        self.assertEqual(abm.count_agents(GrazerAgent), 2)
+        self.assertEqual(abm.sum_agent_attribute(GrazerAgent, 'energy'), 3)
+        self.assertEqual(abm.sum_agent_attribute(SleepyAgent, 'energy'), 3)
+        abm.untag_agent(grazers[0], 'animal')
+        self.assertEqual(abm.get_agents(SleepyAgent, 'animal'), {grazers[1]})
+
+
+class AgentPoolTestCase(unittest.TestCase):
+    """
+    Tests for integer agent ids and the recycling of dead agents.
+    """
+
+    def test_ids_count_up_and_dead_agents_are_reused(self):
+        gc = GlobalConstants()
+        gc.USE_AGENT_POOL = True
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        grazers = [abm.create_agent(GrazerAgent, i, 0, energy=i) for i in range(3)]
+        self.assertEqual([agent.a_id for agent in grazers], [0, 1, 2])
+        for agent in grazers:
+            abm.add_agent(agent)
+        abm.schedule_new_agents()
+        simulation.step_simulation()
+        reborn = abm.create_agent(GrazerAgent, 7, 7, energy=0)
+        self.assertIs(reborn, grazers[2])
+        self.assertEqual((reborn.a_id, reborn.x, reborn.energy, reborn.dead), (3, 7, 0, False))
+        simulation.reset_simulation()
+        self.assertEqual(gc.NEXT_AGENT_ID, 0)
+
+
+class MailboxTestCase(unittest.TestCase):
+    """
+    Tests for the delivery of messages between agents.
+    """
+
+    def test_messages_arrive_next_step_in_sender_order(self):
+        gc = GlobalConstants()
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        first, second = SleepyAgent(1, 1, gc, 1), SleepyAgent(3, 3, gc, 1)
+        first.a_id, second.a_id = 'a', 'b'
+        abm.post_message(second, 5, 5, 'offer', 2)
+        abm.post_message(first, 5, 5, 'offer', 1)
+        abm.broadcast_message(simulation.ca, first, 1, 'alarm')
+        self.assertEqual(abm.receive_messages(5, 5), [])
+        simulation.step_simulation()
+        self.assertEqual([m.content for m in abm.receive_messages(5, 5)], [1, 2])
+        self.assertEqual(len(abm.receive_messages(2, 2, 'alarm')), 1)
+        self.assertEqual(len(abm.receive_messages(3, 3, 'alarm')), 0)
+        self.assertEqual(len(abm.mailbox), 2 + 9)
+        simulation.step_simulation()
+        self.assertEqual(len(abm.mailbox), 0)
+
+    def test_integer_senders_are_ordered_by_value(self):
+        gc = GlobalConstants()
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        agents = [SleepyAgent(1, 1, gc, 1) for _ in range(11)]
+        abm.post_message(None, 5, 5, 'offer', None)
+        for agent in reversed(agents):
+            abm.post_message(agent, 5, 5, 'offer', agent.a_id)
+        simulation.step_simulation()
+        self.assertEqual([m.content for m in abm.receive_messages(5, 5)], list(range(11)) + [None])
+
+
+class Bird(ContinuousAgent):
+    """
+    Flies to the right.
+    """
+
+    def perceive_and_act(self, abm, ca):
+        abm.space.move(self, self.px + 10, self.py)
+
+
+class ContinuousSpaceTestCase(unittest.TestCase):
+    """
+    Tests for agents with continuous positions.
+    """
+
+    def test_queries_wrap_around(self):
+        gc = GlobalConstants()
+        # Hexagonal grids without borders wrap around the left and right edges.
+        gc.USE_HEX_CA = True
+        gc.USE_CA_BORDERS = False
+        simulation = ComplexAutomaton(gc)
+        space = simulation.abm.use_continuous_space(simulation.ca, 30)
+        width = space.period_x
+        birds = [Bird(px, 100.5, gc) for px in (width - 12.5, 7.5, 40.5, 300.5)]
+        for bird in birds:
+            simulation.abm.add_agent(bird)
+        simulation.abm.schedule_new_agents()
+        self.assertEqual(sorted(d for _, d in space.query_radius(2.5, 100.5, 40)), [5.0, 15.0, 38.0])
+        self.assertEqual([a for a, _ in space.nearest(width - 2.5, 100.5, 2)], birds[:2])
+        simulation.step_simulation()
+        self.assertAlmostEqual(birds[0].px, width - 2.5)
+        cell = cell_at(gc, 17.5, 100.5)
+        self.assertEqual((birds[1].x, birds[1].y), cell)
+        self.assertEqual((birds[1].prev_x, birds[1].prev_y), cell)
+        self.assertIn(birds[1], simulation.abm.agent_locations[cell])
+        self.assertEqual([a for a, _ in space.nearest(2.5, 100.5, 2, exclude=birds[1])],
+                         [birds[0], birds[2]])
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class AgentPopulationTestCase(unittest.TestCase):
+    """
+    Tests for array-based agent populations.
+    """
+
+    def test_walk_stays_on_grid_and_dead_are_removed(self):
+        from cab.abm.agent_population import AgentPopulation
+        for use_hex in (False, True):
+            gc = GlobalConstants()
+            gc.USE_HEX_CA = use_hex
+            simulation = ComplexAutomaton(gc)
+            population = AgentPopulation(gc, simulation.ca, capacity=4)
+            population.add_attribute('energy', numpy.float64, 1.0)
+            population.spawn([0, 1, 2, 3, 4], 0, energy=[1.0, 0.0, 1.0, 0.0, 1.0])
+            simulation.abm.add_population(population)
+            for _ in range(20):
+                population.random_walk()
+                for (x, y) in zip(population.x.tolist(), population.y.tolist()):
+                    self.assertIn((x, y), simulation.ca.ca_grid)
+            population.kill(population['energy'] == 0.0)
+            simulation.step_simulation()
+            self.assertEqual(len(population), 3)
+            self.assertEqual(population.density().sum(), 3)
+            x, y = int(population.x[0]), int(population.y[0])
+            self.assertIn(0, [agent.index for agent in simulation.abm.agents_at(x, y)])
+
+    def test_agents_are_listed_on_their_cells(self):
+        from cab.abm.agent_population import AgentPopulation
+        gc = GlobalConstants()
+        gc.ONE_AGENT_PER_CELL = True
+        gc.DIM_X = gc.DIM_Y = 5
+        gc.GRID_WIDTH = gc.GRID_HEIGHT = 5 * gc.CELL_SIZE
+        simulation = ComplexAutomaton(gc)
+        abm = simulation.abm
+        population = AgentPopulation(gc, simulation.ca)
+        population.spawn([0, 1], 0)
+        abm.add_population(population)
+        population.spawn(2, 0)
+        self.assertEqual(abm.count_free_cells(), 22)
+        self.assertEqual(population.move_to(3, 0, [2]).tolist(), [True])
+        third = abm.agent_locations[3, 0]
+        self.assertEqual((third.index, third.x, third.y), (2, 3, 0))
+        self.assertNotIn((2, 0), abm.agent_locations)
+        self.assertEqual(abm.count_free_cells(), 22)
+        # Other agents see them in their neighborhood and can't take their cells.
+        self.assertIs(simulation.ca.get_agent_neighborhood(2, 1, 0)[1, 0][1], population.views[1])
+        intruder = SleepyAgent(1, 0, gc, 1)
+        abm.add_agent(intruder)
+        self.assertIsNot(abm.agent_locations[1, 0], intruder)
+        population.kill([0])
+        simulation.step_simulation()
+        self.assertEqual(sorted(abm.agent_locations), [(1, 0), (3, 0)])
+        self.assertEqual(abm.count_free_cells(), 23)
+        self.assertIs(abm.agent_locations[3, 0], third)
+        self.assertEqual(third.index, 1)
+        self.assertEqual(population.agents_at(3, 0), [third])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,709 @@
+# CAB libraries
+from cab.ca.cell import CellHex, CellRect
+from cab.complex_automaton import ComplexAutomaton
+from cab.global_constants import GlobalConstants
+
+# External libraries
+import math
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_simulation(use_hex, use_borders):
+    gc = GlobalConstants()
+    gc.USE_HEX_CA = use_hex
+    gc.USE_CA_BORDERS = use_borders
+    gc.DIM_X = 9
+    gc.DIM_Y = 7
+    gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+    gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+    gc.GRID_STATE_TILE_ROWS = 3
+    return ComplexAutomaton(gc)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class FieldLayerTestCase(unittest.TestCase):
+    """
+    Tests for the array-backed field layers of the CA.
+    """
+
+    def test_diffusion_matches_cell_neighbors(self):
+        # The arrays wrap around exactly where the cells are wired across the edges.
+        for use_hex in (False, True):
+            for use_borders in (False, True):
+                simulation = make_simulation(use_hex, use_borders)
+                ca = simulation.ca
+                layer = ca.add_field_layer('pheromone')
+                layer.values[:] = numpy.random.RandomState(1).rand(7, 9)
+                before = {pos: layer.get(*pos) for pos in ca.ca_grid}
+                layer.diffuse(0.4)
+                n = 6 if use_hex else 8
+                for pos, cell in ca.ca_grid.items():
+                    received = sum(before[nb.x, nb.y] for nb in cell.neighbors)
+                    kept = before[pos] * (1 - 0.4 + 0.4 * (n - len(cell.neighbors)) / n)
+                    self.assertAlmostEqual(layer.get(*pos), kept + received * 0.4 / n)
+
+    def test_diffusion_conserves_amount(self):
+        for use_hex in (False, True):
+            for use_borders in (False, True):
+                layer = make_simulation(use_hex, use_borders).ca.add_field_layer('resource')
+                layer.deposit([1, 2, 2], [3, 3, 3], 5.0)
+                layer.diffuse(0.5)
+                layer.diffuse(0.5)
+                self.assertAlmostEqual(float(layer.values.sum()), 15.0)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class GridStateTestCase(unittest.TestCase):
+    """
+    Tests for memory-mapped grid states.
+    """
+
+    def test_memmap_matches_memory(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            layers = []
+            for path in (None, directory):
+                simulation = make_simulation(True, False)
+                simulation.gc.GRID_STATE_PATH = path
+                layer = simulation.ca.add_field_layer('heat')
+                layer.deposit([1, 4], [2, 5], 3.0)
+                for _ in range(3):
+                    layer.diffuse(0.3)
+                layers.append(layer)
+            self.assertTrue(numpy.allclose(layers[0].values, layers[1].values))
+            self.assertIsInstance(layers[1].state.read, numpy.memmap)
+
+    def test_temporary_states_are_separate_and_deleted(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            automata = []
+            for value in (1.0, 2.0):
+                ca = make_simulation(False, True).ca
+                ca.sys.gc.GRID_STATE_PATH = directory
+                ca.create_grid_state('heat', fill=value)
+                automata.append(ca)
+            self.assertEqual([float(ca.grid_states['heat'].read[0, 0]) for ca in automata], [1.0, 2.0])
+            self.assertEqual(len(os.listdir(directory)), 4)
+            automata[0].close_grid_states()
+            self.assertEqual(len(os.listdir(directory)), 2)
+            automata[1].sys.reset_simulation()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_kept_states_are_reopened(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            values = []
+            for height in (7, 7, 8):
+                ca = make_simulation(False, True).ca
+                ca.sys.gc.GRID_STATE_PATH = directory
+                ca.sys.gc.GRID_STATE_KEY = 'run'
+                ca.height = height
+                state = ca.create_grid_state('count', 'int32', fill=0)
+                values.append(int(state.read[3, 3]))
+                # An odd number of generations leaves the latest one in the second file.
+                state.sweep(lambda block, row: block[1:-1] + 1)
+                ca.close_grid_states()
+            # The grid with another height doesn't reuse the files of the others.
+            self.assertEqual(values, [0, 1, 0])
+            self.assertEqual(len(os.listdir(directory)), 4)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ConvolutionTestCase(unittest.TestCase):
+    """
+    Tests for the large-kernel convolutions.
+    """
+
+    def test_fft_matches_direct(self):
+        from cab.ca.convolution import ring_kernel
+        for use_hex in (False, True):
+            for use_borders in (False, True):
+                ca = make_simulation(use_hex, use_borders).ca
+                kernel = ring_kernel(4, use_hex)
+                values = numpy.random.RandomState(3).rand(7, 9)
+                direct = ca.create_convolution(kernel, method='direct')(values)
+                fft = ca.create_convolution(kernel, method='fft')(values)
+                self.assertTrue(numpy.allclose(direct, fft))
+
+    def test_disc_sums_cell_neighborhood(self):
+        from cab.ca.convolution import disc_kernel
+        ca = make_simulation(True, True).ca
+        convolution = ca.create_convolution(disc_kernel(1, True), normalize=False)
+        values = numpy.ones((7, 9))
+        sums = convolution(values)
+        for (q, r), cell in ca.ca_grid.items():
+            i, j = ca.to_offset(q, r)
+            self.assertAlmostEqual(sums[j, i], len(cell.neighbors))
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class RuleEngineTestCase(unittest.TestCase):
+    """
+    Tests for the outer-totalistic rule engine.
+    """
+
+    def test_blinker_oscillates(self):
+        ca = make_simulation(False, True).ca
+        engine = ca.set_rule('B3/S23')
+        for x in (3, 4, 5):
+            engine.set_state(x, 3, 1)
+        ca.cycle_automaton()
+        alive = {pos for pos in ca.ca_grid if engine.get_state(*pos)}
+        self.assertEqual(alive, {(4, 2), (4, 3), (4, 4)})
+        self.assertEqual(ca.ca_grid[4, 2].color, engine.palette[1])
+        self.assertEqual(ca.ca_grid[3, 3].color, engine.palette[0])
+        ca.cycle_automaton()
+        alive = {pos for pos in ca.ca_grid if engine.get_state(*pos)}
+        self.assertEqual(alive, {(3, 3), (4, 3), (5, 3)})
+
+    def test_engines_are_not_replaced(self):
+        gc = GlobalConstants()
+        gc.USE_ASYNC_CA = True
+        simulation = ComplexAutomaton(gc, proto_cell=InfectableCell(0, 0, gc))
+        simulation.step_simulation()
+        kmc = simulation.ca.rule_engine
+        self.assertRaises(ValueError, simulation.ca.set_rule, 'B3/S23')
+        self.assertRaises(ValueError, simulation.ca.use_hashlife, 'B3/S23')
+        self.assertIs(simulation.ca.rule_engine, kmc)
+        simulation.ca.remove_rule_engine()
+        engine = simulation.ca.set_rule('B3/S23')
+        simulation.step_simulation()
+        self.assertIs(simulation.ca.rule_engine, engine)
+
+    def test_parse_rejects_other_notations(self):
+        from cab.ca.rule_engine import TotalisticRule
+        self.assertEqual(TotalisticRule.parse('B36/S23').birth, {3, 6})
+        self.assertRaises(ValueError, TotalisticRule.parse, '23/3')
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class BitGridTestCase(unittest.TestCase):
+    """
+    Tests for the bit-packed two-state backend.
+    """
+
+    def test_matches_rule_engine_across_words(self):
+        from cab.ca.rule_engine import RuleEngine, TotalisticRule
+        for use_borders in (False, True):
+            gc = GlobalConstants()
+            gc.USE_CA_BORDERS = use_borders
+            gc.DIM_X = 70
+            gc.DIM_Y = 6
+            gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+            gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+            ca = ComplexAutomaton(gc).ca
+            engine = RuleEngine(ca, TotalisticRule.parse('B3/S23'), sync_colors=False)
+            bits = ca.use_bit_grid('B3/S23')
+            state = numpy.random.RandomState(4).rand(gc.DIM_Y, gc.DIM_X) < 0.4
+            for (x, y) in ca.ca_grid:
+                engine.set_state(x, y, int(state[y, x]))
+                bits.set_state(x, y, int(state[y, x]))
+            for _ in range(5):
+                engine.step()
+                ca.cycle_automaton()
+                self.assertTrue((bits.unpack() == engine.state.read.astype(bool)).all())
+            self.assertEqual(ca.ca_grid[69, 5].color, bits.palette[bits.get_state(69, 5)])
+            self.assertEqual(bits.words.dtype, numpy.uint64)
+            self.assertEqual(bits.words.shape, (6, 2))
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class HashlifeTestCase(unittest.TestCase):
+    """
+    Tests for the Hashlife universe.
+    """
+
+    def test_glider_jumps_ahead(self):
+        universe = ComplexAutomaton(GlobalConstants()).ca.use_hashlife('B3/S23', bounded=False)
+        glider = [(1, 0), (2, 1), (0, 2), (1, 2), (2, 2)]
+        universe.set_cells(glider)
+        universe.advance(20)
+        # A glider moves one cell diagonally every four generations.
+        shift = 2 ** 18
+        self.assertEqual(sorted(universe.live_cells()), sorted((x + shift, y + shift) for (x, y) in glider))
+        self.assertEqual(universe.generation, 2 ** 20)
+
+    def test_bounded_blinker_keeps_inside(self):
+        ca = make_simulation(False, True).ca
+        universe = ca.use_hashlife('B3/S23')
+        universe.max_nodes = 50
+        universe.set_cells([(0, 0), (1, 0), (2, 0)])
+        universe.advance(0)
+        # The cell above the grid is not born, so the blinker at the border dies down to two cells.
+        self.assertEqual(sorted(universe.live_cells()), [(1, 0), (1, 1)])
+        universe.step()
+        self.assertEqual(universe.live_cells(), [])
+        self.assertEqual(ca.ca_grid[1, 0].color, universe.palette[0])
+
+    def test_matches_rule_engine_at_the_edge(self):
+        from cab.ca.rule_engine import RuleEngine, TotalisticRule
+        for use_borders in (False, True):
+            gc = GlobalConstants()
+            gc.USE_CA_BORDERS = use_borders
+            gc.DIM_X = 10
+            gc.DIM_Y = 8
+            gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+            gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+            ca = ComplexAutomaton(gc).ca
+            engine = RuleEngine(ca, TotalisticRule.parse('B3/S23'), sync_colors=False)
+            universe = ca.use_hashlife('B3/S23')
+            # A glider that runs into the lower right corner.
+            glider = [(5, 3), (6, 4), (4, 5), (5, 5), (6, 5)]
+            universe.set_cells(glider)
+            for (x, y) in glider:
+                engine.set_state(x, y, 1)
+            for _ in range(16):
+                engine.step()
+                universe.step()
+                alive = sorted(pos for pos in ca.ca_grid if engine.get_state(*pos))
+                self.assertEqual(sorted(universe.live_cells()), alive)
+            # The glider crashed into the bottom edge and left a block there.
+            self.assertEqual(sorted(universe.live_cells()), [(7, 6), (7, 7), (8, 6), (8, 7)])
+
+    def test_size_follows_the_ca(self):
+        gc = GlobalConstants()
+        # The grid size decides the size of the CA, DIM_X and DIM_Y keep their defaults.
+        gc.GRID_WIDTH = 12 * gc.CELL_SIZE
+        gc.GRID_HEIGHT = 7 * gc.CELL_SIZE
+        ca = ComplexAutomaton(gc).ca
+        universe = ca.use_hashlife('B3/S23')
+        self.assertEqual((universe.width, universe.height), (ca.width, ca.height))
+        # A blinker at the corner, cut off by the borders.
+        universe.set_cells([(11, 4), (11, 5), (11, 6)])
+        universe.step()
+        self.assertEqual(sorted(universe.live_cells()), [(10, 5), (11, 5)])
+        self.assertEqual(ca.ca_grid[10, 5].color, universe.palette[1])
+
+
+class MajorityCell(CellRect):
+    """
+    Takes the state of the majority of its neighbors, ties keep the current state.
+    """
+    STATES = (False, True)
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.state = (x * 7 + y * 3) % 5 < 2
+        self.next_state = self.state
+
+    def sense_neighborhood(self):
+        alive = sum(1 for n in self.neighbors if n.state)
+        if 2 * alive != len(self.neighbors):
+            self.next_state = 2 * alive > len(self.neighbors)
+
+    def update(self):
+        self.state = self.next_state
+
+    def clone(self, x, y):
+        return MajorityCell(x, y, self.gc)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TransitionTableTestCase(unittest.TestCase):
+    """
+    Tests for the tabulated transitions of finite-state cells.
+    """
+
+    def test_table_matches_cell_methods(self):
+        gc = GlobalConstants()
+        expected = ComplexAutomaton(gc, proto_cell=MajorityCell(0, 0, gc)).ca
+        tabulated = ComplexAutomaton(gc, proto_cell=MajorityCell(0, 0, gc)).ca
+        table = tabulated.tabulate_transitions()
+        for _ in range(3):
+            expected.cycle_automaton()
+            tabulated.cycle_automaton()
+        for pos, cell in expected.ca_grid.items():
+            self.assertEqual(tabulated.ca_grid[pos].state, cell.state)
+        self.assertGreater(len(table), 0)
+
+
+class InfectableCell(CellRect):
+    """
+    Gets infected with a rate proportional to its infected neighbors.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.infected = (x, y) == (0, 0)
+
+    def get_event_rate(self):
+        return 0.0 if self.infected else 0.5 * sum(1 for n in self.neighbors if n.infected)
+
+    def fire_event(self):
+        self.infected = True
+
+    def clone(self, x, y):
+        return InfectableCell(x, y, self.gc)
+
+
+class KineticMonteCarloTestCase(unittest.TestCase):
+    """
+    Tests for the asynchronous update by kinetic Monte Carlo.
+    """
+
+    def test_rate_tree_samples_by_rate(self):
+        from cab.ca.kmc import RateTree
+        tree = RateTree(5)
+        for i, rate in enumerate([1.0, 0.0, 2.0, 0.0, 1.0]):
+            tree.update(i, rate)
+        self.assertEqual(tree.total, 4.0)
+        self.assertEqual([tree.sample(t) for t in (0.5, 1.0, 2.9, 3.5)], [0, 2, 2, 4])
+
+    def test_rates_follow_events(self):
+        gc = GlobalConstants()
+        gc.USE_ASYNC_CA = True
+        simulation = ComplexAutomaton(gc, proto_cell=InfectableCell(0, 0, gc))
+        for _ in range(3):
+            simulation.step_simulation()
+        kmc = simulation.ca.rule_engine
+        infected = sum(1 for cell in simulation.ca.ca_grid.values() if cell.infected)
+        self.assertEqual(kmc.time, 3.0)
+        self.assertEqual(infected, kmc.num_events + 1)
+        expected = sum(cell.get_event_rate() for cell in simulation.ca.ca_grid.values())
+        self.assertAlmostEqual(kmc.rates.total, expected)
+
+
+class WallCell(CellRect):
+    """
+    Blocks the view if it is a wall.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.wall = False
+
+    def is_opaque(self):
+        return self.wall
+
+    def clone(self, x, y):
+        return WallCell(x, y, self.gc)
+
+
+class LineOfSightTestCase(unittest.TestCase):
+    """
+    Tests for the fields of view.
+    """
+
+    def test_walls_cast_shadows_until_removed(self):
+        gc = GlobalConstants()
+        simulation = ComplexAutomaton(gc, proto_cell=WallCell(0, 0, gc))
+        line_of_sight = simulation.ca.get_line_of_sight()
+        simulation.ca.ca_grid[12, 10].wall = True
+        visible = line_of_sight.field_of_view(10, 10, 4)
+        self.assertIn((12, 10), visible)
+        self.assertIn((13, 11), visible)
+        hidden = {(x, y) for x in range(6, 15) for y in range(6, 15)} - visible
+        self.assertEqual(hidden, {(13, 10), (14, 9), (14, 10), (14, 11)})
+        self.assertFalse(line_of_sight.is_visible(10, 10, 20, 10))
+        self.assertIs(line_of_sight.field_of_view(10, 10, 4), visible)
+        simulation.ca.ca_grid[12, 10].wall = False
+        line_of_sight.notify_opacity_changed((12, 10))
+        self.assertEqual(len(line_of_sight.field_of_view(10, 10, 4)), 81)
+
+
+class TopologyTestCase(unittest.TestCase):
+    """
+    Tests for the shared topology of grids.
+    """
+
+    def test_cached_wiring_matches_cell_by_cell_wiring(self):
+        import tempfile
+        import cab.ca.topology as cab_topology
+        grids = [(False, False, True), (False, True, True), (False, True, False), (True, False, True),
+                 (True, True, True)]
+        with tempfile.TemporaryDirectory() as directory:
+            for (use_hex, use_borders, use_moore) in grids:
+                wirings = []
+                for use_cache in (False, True, True):
+                    # The last run reads the topology from the disk cache.
+                    cab_topology.topologies.clear()
+                    gc = GlobalConstants()
+                    gc.USE_HEX_CA = use_hex
+                    gc.USE_CA_BORDERS = use_borders
+                    gc.USE_MOORE_NEIGHBORHOOD = use_moore
+                    gc.USE_TOPOLOGY_CACHE = use_cache
+                    gc.TOPOLOGY_CACHE_PATH = directory
+                    simulation = ComplexAutomaton(gc)
+                    wirings.append({pos: ([(n.x, n.y) for n in cell.neighbors], cell.is_border)
+                                    for pos, cell in simulation.ca.ca_grid.items()})
+                self.assertEqual(wirings[0], wirings[1])
+                self.assertEqual(wirings[0], wirings[2])
+                num_border = sum(1 for (_, is_border) in wirings[0].values() if is_border)
+                self.assertEqual(num_border, 2 * (gc.DIM_X + gc.DIM_Y) - 4 if use_hex and use_borders else 0)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class HexVectorTestCase(unittest.TestCase):
+    """
+    Tests for the array versions of the hex coordinate methods.
+    """
+
+    def test_matches_scalar_methods(self):
+        import cab.ca.hex_vector as hex_vector
+        from cab.ca.ca_hex import CAHex
+        q = numpy.linspace(-3.0, 3.0, 25)
+        r = numpy.linspace(2.5, -2.5, 25)
+        rounded = numpy.stack(hex_vector.hex_round(q, r), axis=1).tolist()
+        self.assertEqual(rounded, [list(CAHex.hex_round(a, b)) for a, b in zip(q, r)])
+        px, py = hex_vector.hex_to_pixel([0, 3, -2], [0, 1, 4], 15)
+        self.assertEqual(numpy.stack(hex_vector.pixel_to_hex(px + 4, py - 4, 15), axis=1).tolist(),
+                         [[0, 0], [3, 1], [-2, 4]])
+        self.assertEqual(hex_vector.distance_matrix([0, 2], [0, 0], [1, 0, -3], [0, 0, 3]).tolist(),
+                         [[1, 0, 3], [1, 2, 5]])
+
+    def test_shapes(self):
+        import cab.ca.hex_vector as hex_vector
+        ring = hex_vector.ring(1, 1, 2)
+        self.assertEqual(len({tuple(pos) for pos in ring.tolist()}), 12)
+        self.assertTrue((hex_vector.hex_distance(ring[:, 0], ring[:, 1], 1, 1) == 2).all())
+        self.assertEqual(len(hex_vector.spiral(0, 0, 3)), 37)
+        line = hex_vector.line(0, 0, 4, -2)
+        self.assertEqual(line[[0, -1]].tolist(), [[0, 0], [4, -2]])
+        self.assertTrue((hex_vector.hex_distance(line[1:, 0], line[1:, 1], line[:-1, 0], line[:-1, 1]) == 1).all())
+
+
+class GeometryTestCase(unittest.TestCase):
+    """
+    Tests for the shared shape templates of the cells.
+    """
+
+    @staticmethod
+    def cell_corners(cell, use_hex):
+        """
+        The corners as every cell computed them for itself before the templates.
+        """
+        if not use_hex:
+            w = h = cell.gc.CELL_SIZE
+            return [(cell.x * w, cell.y * h), (cell.x * w + w, cell.y * h),
+                    (cell.x * w + w, cell.y * h + h), (cell.x * w, cell.y * h + h)]
+        size = cell.gc.CELL_SIZE
+        horiz = size * 2 * (math.sqrt(3) / 2)
+        vert = size * 2 * (3 / 4)
+        corners = []
+        for i in range(6):
+            angle = 2 * math.pi / 6 * (i + 0.5)
+            x = (cell.x * horiz) + size * math.cos(angle)
+            offset = cell.y * (horiz / 2)
+            y = (cell.y * vert) + size * math.sin(angle)
+            corners.append((int(x) + int(offset), int(y)))
+        return corners
+
+    def test_template_corners_match_cell_corners(self):
+        for use_hex in (False, True):
+            ca = make_simulation(use_hex, True).ca
+            for cell in ca.ca_grid.values():
+                # Cells don't keep their corners, they are placed from the template.
+                self.assertFalse(hasattr(cell, 'corners'))
+                self.assertEqual(cell.get_corners(), self.cell_corners(cell, use_hex))
+            if numpy is not None:
+                self.assertEqual(ca.get_all_polygons().tolist(),
+                                 [[list(c) for c in cell.get_corners()] for cell in ca.ca_grid.values()])
+
+
+class SpreadingCell(CellRect):
+    """
+    Gets infected as soon as one of its neighbors is.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.infected = False
+        self.next_infected = False
+
+    def sense_neighborhood(self):
+        self.next_infected = self.infected or any(n.infected for n in self.neighbors)
+
+    def update(self):
+        self.infected = self.next_infected
+
+    def clone(self, x, y):
+        return SpreadingCell(x, y, self.gc)
+
+
+class SpreadingHexCell(CellHex):
+    sense_neighborhood = SpreadingCell.sense_neighborhood
+    update = SpreadingCell.update
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.infected = False
+        self.next_infected = False
+
+    def clone(self, x, y):
+        return SpreadingHexCell(x, y, self.gc)
+
+
+class ChunkedGridTestCase(unittest.TestCase):
+    """
+    Tests for the lazily allocated grid.
+    """
+
+    @staticmethod
+    def make_automaton(use_hex, use_borders, use_chunks):
+        gc = GlobalConstants()
+        gc.USE_HEX_CA = use_hex
+        gc.USE_CA_BORDERS = use_borders
+        gc.DIM_X = 21
+        gc.DIM_Y = 13
+        gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+        gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+        gc.USE_CHUNKED_GRID = use_chunks
+        gc.CHUNK_SIZE = 4
+        proto_cell = SpreadingHexCell(0, 0, gc) if use_hex else SpreadingCell(0, 0, gc)
+        return ComplexAutomaton(gc, proto_cell=proto_cell).ca
+
+    def test_spreading_rule_matches_complete_grid(self):
+        for use_hex in (False, True):
+            for use_borders in (False, True):
+                automata = [self.make_automaton(use_hex, use_borders, use_chunks) for use_chunks in (False, True)]
+                for ca in automata:
+                    ca.ca_grid[3, 2].infected = True
+                # Only the tile of the infected cell exists at first.
+                self.assertEqual(len(automata[1].ca_grid), 16)
+                for _ in range(30):
+                    for ca in automata:
+                        ca.cycle_automaton()
+                    infected = [{pos for pos, cell in ca.ca_grid.items() if cell.infected} for ca in automata]
+                    self.assertEqual(infected[0], infected[1])
+                self.assertEqual(len(infected[1]), 21 * 13)
+
+    def test_untouched_cells_are_not_on_the_border(self):
+        for use_hex in (False, True):
+            ca = self.make_automaton(use_hex, True, True)
+            self.assertIs(ca.ca_grid.peek((6, 6)), ca.ca_grid.default_cell)
+            self.assertFalse(ca.ca_grid.default_cell.is_border)
+            self.assertEqual(ca.ca_grid[0, 0].is_border, use_hex)
+            self.assertFalse(ca.ca_grid[6, 6].is_border)
+
+    def test_quiet_tiles_are_not_created(self):
+        ca = self.make_automaton(False, True, True)
+        ca.ca_grid[3, 2].next_infected = False
+        for _ in range(5):
+            ca.cycle_automaton()
+        self.assertEqual(len(ca.ca_grid), 16)
+
+class ObstacleCell(CellRect):
+    """
+    Can't be entered if it is blocked.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.blocked = False
+
+    def is_passable(self):
+        return not self.blocked
+
+    def clone(self, x, y):
+        return ObstacleCell(x, y, self.gc)
+
+
+class ObstacleHexCell(CellHex):
+    is_passable = ObstacleCell.is_passable
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.blocked = False
+
+    def clone(self, x, y):
+        return ObstacleHexCell(x, y, self.gc)
+
+
+class PathFinderTestCase(unittest.TestCase):
+    """
+    Tests for A* and flow fields against a breadth-first search along the neighbors of the cells.
+    """
+
+    @staticmethod
+    def distances(ca, targets):
+        distances = {pos: 0 for pos in targets}
+        frontier = list(targets)
+        while frontier:
+            reached = []
+            for pos in frontier:
+                for n in ca.ca_grid[pos].neighbors:
+                    if (n.x, n.y) not in distances and not n.blocked:
+                        distances[n.x, n.y] = distances[pos] + 1
+                        reached.append((n.x, n.y))
+            frontier = reached
+        return distances
+
+    def check(self, ca, pathfinder, targets, starts):
+        expected = self.distances(ca, targets)
+        self.assertEqual(pathfinder.get_flow_field(targets).distances, expected)
+        for start in starts:
+            path = pathfinder.find_path(start, targets[0])
+            to_goal = self.distances(ca, targets[:1]).get(start)
+            if to_goal is None or ca.ca_grid[start].blocked:
+                continue
+            self.assertEqual(len(path) - 1, to_goal)
+            for a, b in zip(path, path[1:]):
+                self.assertIn(b, [(n.x, n.y) for n in ca.ca_grid[a].neighbors])
+                self.assertTrue(ca.ca_grid[b].is_passable() or b == targets[0])
+            step = pathfinder.next_step(start, targets)
+            if start in expected and expected[start] > 0:
+                self.assertEqual(expected[step], expected[start] - 1)
+
+    def test_paths_and_fields_match_breadth_first_search(self):
+        import random
+        rng = random.Random(5)
+        for use_hex, use_moore in ((False, True), (False, False), (True, True)):
+            for use_borders in (False, True):
+                gc = GlobalConstants()
+                gc.USE_HEX_CA = use_hex
+                gc.USE_MOORE_NEIGHBORHOOD = use_moore
+                gc.USE_CA_BORDERS = use_borders
+                gc.DIM_X = 12
+                gc.DIM_Y = 9
+                gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+                gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+                proto_cell = ObstacleHexCell(0, 0, gc) if use_hex else ObstacleCell(0, 0, gc)
+                ca = ComplexAutomaton(gc, proto_cell=proto_cell).ca
+                positions = sorted(ca.ca_grid.keys())
+                for pos in positions:
+                    ca.ca_grid[pos].blocked = rng.random() < 0.3
+                pathfinder = ca.get_pathfinder()
+                targets = [pos for pos in positions if not ca.ca_grid[pos].blocked][:2]
+                self.check(ca, pathfinder, targets, rng.sample(positions, 15))
+                # Cached fields follow cells that open up or close.
+                for pos in rng.sample(positions, 20):
+                    ca.ca_grid[pos].blocked = not ca.ca_grid[pos].blocked
+                    pathfinder.notify_passability_changed(pos)
+                    self.assertEqual(pathfinder.get_flow_field(targets).distances, self.distances(ca, targets))
+                self.check(ca, pathfinder, targets, rng.sample(positions, 15))
+
+    def test_fields_are_repaired_without_recomputing(self):
+        gc = GlobalConstants()
+        gc.USE_MOORE_NEIGHBORHOOD = False
+        gc.DIM_X = 12
+        gc.DIM_Y = 9
+        gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+        gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+        ca = ComplexAutomaton(gc, proto_cell=ObstacleCell(0, 0, gc)).ca
+        # A wall splits the grid into two halves, each with a field of its own.
+        for y in range(gc.DIM_Y):
+            ca.ca_grid[5, y].blocked = True
+        pathfinder = ca.get_pathfinder()
+        left = pathfinder.get_flow_field([(1, 1)])
+        right = pathfinder.get_flow_field([(10, 7)])
+        left_distances = dict(left.distances)
+        computed = []
+        pathfinder.compute_flow_field = computed.append
+        for pos in ((8, 4), (9, 7), (8, 4)):
+            ca.ca_grid[pos].blocked = not ca.ca_grid[pos].blocked
+            pathfinder.notify_passability_changed(pos)
+            self.assertEqual(pathfinder.get_flow_field([(10, 7)]).distances, self.distances(ca, [(10, 7)]))
+            self.assertEqual(pathfinder.get_flow_field([(1, 1)]).distances, left_distances)
+        self.assertEqual(computed, [])
+        self.assertFalse(left.dirty or right.dirty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,310 @@
+# CAB libraries
+from cab.abm.agent import CabAgent
+from cab.complex_automaton import ComplexAutomaton
+from cab.global_constants import GlobalConstants
+from cab.util.io_tk import TkIO
+from cab.util.io_tk_image import TkImageIO
+from cab.util.simulation_worker import Command, FrameSnapshot, SimulationWorker
+
+# External libraries
+import os
+import struct
+import tempfile
+import unittest
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+
+def make_simulation(use_hex):
+    gc = GlobalConstants()
+    gc.USE_HEX_CA = use_hex
+    gc.CELL_SIZE = 4
+    gc.DIM_X = 5
+    gc.DIM_Y = 4
+    gc.GRID_WIDTH = gc.DIM_X * gc.CELL_SIZE
+    gc.GRID_HEIGHT = gc.DIM_Y * gc.CELL_SIZE
+    return ComplexAutomaton(gc)
+
+
+def make_image_io(simulation):
+    """
+    Create the image renderer without a Tk window, only the buffers are set up.
+    """
+    io = TkImageIO.__new__(TkImageIO)
+    io.gc = simulation.gc
+    io.core = simulation
+    io.width = simulation.gc.GRID_WIDTH
+    io.height = simulation.gc.GRID_HEIGHT
+    io.cell_shape_mapping = list()
+    io.init_cell_shape_mapping()
+    io.init_agent_shape_mapping()
+    return io
+
+
+def pixel(buffer, io, x, y):
+    start = (y * io.width + x) * 3
+    return tuple(buffer[start:start + 3])
+
+
+class TkImageTestCase(unittest.TestCase):
+    """
+    Tests for the color buffers of the image renderer.
+    """
+
+    def test_cells_are_painted_into_their_pixels(self):
+        simulation = make_simulation(False)
+        red = (255, 0, 0)
+        simulation.ca.ca_grid[2, 1].color = red
+        io = make_image_io(simulation)
+        for y in range(io.height):
+            for x in range(io.width):
+                expected = red if (x // 4, y // 4) == (2, 1) else simulation.gc.DEFAULT_CELL_COLOR
+                self.assertEqual(pixel(io.cell_buffer, io, x, y), expected)
+        # Only cells whose color changed are repainted.
+        simulation.ca.ca_grid[2, 1].color = simulation.gc.DEFAULT_CELL_COLOR
+        simulation.ca.ca_grid[0, 3].color = red
+        io.update_cells()
+        self.assertEqual(pixel(io.cell_buffer, io, 9, 5), simulation.gc.DEFAULT_CELL_COLOR)
+        self.assertEqual(pixel(io.cell_buffer, io, 1, 14), red)
+
+    def test_hex_cells_leave_no_gaps(self):
+        simulation = make_simulation(True)
+        for cell in simulation.ca.ca_grid.values():
+            cell.color = (0, 0, 255)
+        io = make_image_io(simulation)
+        self.assertEqual(set(pixel(io.cell_buffer, io, x, y) for y in range(io.height) for x in range(io.width)),
+                         {(0, 0, 255)})
+
+    def test_agents_are_stamped_onto_a_copy(self):
+        simulation = make_simulation(False)
+        io = make_image_io(simulation)
+        background = bytes(io.cell_buffer)
+        io.stamp_agents([(3, 2, (0, 255, 0)), (0, 0, (255, 255, 0))])
+        self.assertEqual(bytes(io.cell_buffer), background)
+        self.assertEqual(pixel(io.frame_buffer, io, 14, 10), (0, 255, 0))
+        self.assertEqual(pixel(io.frame_buffer, io, 0, 0), (255, 255, 0))
+        # The disc of radius 3 around the cell center 14, 10 ends 3 pixels away.
+        self.assertEqual(pixel(io.frame_buffer, io, 17, 10), (0, 255, 0))
+        self.assertEqual(pixel(io.frame_buffer, io, 18, 10), simulation.gc.DEFAULT_CELL_COLOR)
+        self.assertEqual(len(io.frame_buffer), len(io.cell_buffer))
+        # Without agents the cell buffer is shown as it is.
+        io.stamp_agents([])
+        self.assertIs(io.frame_buffer, io.cell_buffer)
+
+
+class RecordingCanvas(object):
+    """
+    Stands in for the Tk canvas, keeps the ovals that are drawn on it and the reconfigured polygons.
+    """
+
+    def __init__(self):
+        self.ovals = list()
+        self.polygons = list()
+        self.changes = list()
+
+    def create_polygon(self, corners, fill, outline):
+        self.polygons.append(corners)
+        return len(self.polygons)
+
+    def itemconfig(self, item, **options):
+        self.changes.append((item, options))
+
+    def create_oval(self, bounds, fill, outline, tags):
+        self.ovals.append((bounds, fill, tags))
+
+    def delete(self, tag):
+        self.ovals = [oval for oval in self.ovals if oval[2] != tag]
+
+
+def make_snapshot(colors):
+    """
+    A snapshot of the given cell colors without agents.
+    """
+    return FrameSnapshot(0, None, tuple(colors), tuple())
+
+
+def make_tk_io(simulation):
+    """
+    Create the Tk renderer on a recording canvas instead of a Tk window.
+    """
+    io = TkIO.__new__(TkIO)
+    io.gc = simulation.gc
+    io.core = simulation
+    io.canvas = RecordingCanvas()
+    io.cell_shape_mapping = list()
+    io.init_cell_shape_mapping()
+    return io
+
+
+class TkTestCase(unittest.TestCase):
+    """
+    Tests for the Tk canvas renderer.
+    """
+
+    def test_only_changed_cells_are_reconfigured(self):
+        simulation = make_simulation(False)
+        io = make_tk_io(simulation)
+        self.assertEqual(io.canvas.polygons[6], [4, 4, 8, 4, 8, 8, 4, 8])
+        colors = [color for (polygon, cell, color) in io.cell_shape_mapping]
+        io.draw_snapshot(make_snapshot(colors))
+        self.assertEqual(io.canvas.changes, [])
+        colors[6] = (255, 0, 0)
+        io.draw_snapshot(make_snapshot(colors))
+        self.assertEqual(io.canvas.changes, [(7, {'fill': '#ff0000', 'outline': '#000000'})])
+        # Toggling the grid touches every outline once.
+        simulation.gc.DISPLAY_GRID = not simulation.gc.DISPLAY_GRID
+        io.canvas.changes = list()
+        io.draw_snapshot(make_snapshot(colors))
+        io.draw_snapshot(make_snapshot(colors))
+        self.assertEqual(len(io.canvas.changes), len(colors))
+        self.assertEqual(io.canvas.changes[6], (7, {'outline': '#ff0000'}))
+
+    def test_population_agents_are_drawn(self):
+        from cab.abm.agent_population import AgentPopulation
+        simulation = make_simulation(True)
+        population = AgentPopulation(simulation.gc, simulation.ca)
+        population.spawn([1, 2], [0, 3])
+        simulation.abm.add_population(population)
+        io = make_tk_io(simulation)
+        io.draw_populations()
+        io.draw_populations()
+        self.assertEqual(len(io.canvas.ovals), 2)
+        self.assertEqual({oval[2] for oval in io.canvas.ovals}, {'population'})
+
+
+class WalkingAgent(CabAgent):
+    """
+    Walks one cell to the right per step and counts how often it is clicked.
+    """
+
+    def __init__(self, x, y, gc):
+        super().__init__(x, y, gc)
+        self.clicks = 0
+
+    def perceive_and_act(self, abm, ca):
+        self.prev_x, self.prev_y = self.x, self.y
+        self.x = (self.x + 1) % self.gc.DIM_X
+
+    def on_lmb_click(self, abm, ca):
+        self.clicks += 1
+
+
+class SimulationWorkerTestCase(unittest.TestCase):
+    """
+    Tests for the simulation thread and its snapshots.
+    """
+
+    def test_commands_run_in_the_thread_and_are_published(self):
+        simulation = make_simulation(False)
+        walker = WalkingAgent(0, 1, simulation.gc)
+        simulation.abm.add_agent(walker)
+        simulation.abm.schedule_new_agents()
+        worker = SimulationWorker(simulation.gc, simulation)
+        self.assertEqual(worker.get_snapshot().time_step, 0)
+        worker.start()
+        worker.submit(Command.FAST_FORWARD, 6)
+        worker.submit(Command.STEP)
+        # The walker is at 7 % 5 = 2 now, a click on any other cell misses it.
+        worker.submit(Command.CLICK, (1, 2, 1))
+        worker.submit(Command.CLICK, (1, 3, 1))
+        worker.submit(Command.CLICK, (3, 2, 1))
+        worker.stop()
+        worker.join(10)
+        self.assertFalse(worker.is_alive())
+        snapshot = worker.get_snapshot()
+        self.assertEqual(snapshot.time_step, 7)
+        self.assertEqual(snapshot.agents, ((2, 1, walker.color, walker.size),))
+        self.assertEqual(len(snapshot.cell_colors), len(simulation.ca.ca_grid))
+        self.assertEqual(walker.clicks, 1)
+
+    def test_running_simulation_publishes_snapshots(self):
+        simulation = make_simulation(False)
+        simulation.gc.TARGET_FPS = 1000
+        worker = SimulationWorker(simulation.gc, simulation)
+        first = worker.get_snapshot()
+        worker.start()
+        worker.submit(Command.TOGGLE_RUN)
+        for _ in range(1000):
+            if worker.get_snapshot().time_step >= 20:
+                break
+            worker.join(0.01)
+        worker.stop()
+        worker.join(10)
+        self.assertFalse(worker.is_alive())
+        self.assertIsNot(worker.get_snapshot(), first)
+        self.assertGreaterEqual(worker.get_snapshot().time_step, 20)
+
+
+@unittest.skipIf(pygame is None, 'pygame is not installed')
+class PygameTestCase(unittest.TestCase):
+    """
+    Tests for the Pygame renderer.
+    """
+
+    def test_cells_of_new_tiles_are_drawn(self):
+        from cab.util.io_pygame import PygameIO
+        gc = GlobalConstants()
+        gc.CELL_SIZE = 4
+        gc.DIM_X = gc.DIM_Y = 8
+        gc.GRID_WIDTH = gc.GRID_HEIGHT = 32
+        gc.USE_CHUNKED_GRID = True
+        gc.CHUNK_SIZE = 4
+        simulation = ComplexAutomaton(gc)
+        worker = SimulationWorker(simulation.gc, simulation)
+        first = worker.get_snapshot()
+        worker.publish_snapshot()
+        self.assertIs(worker.get_snapshot().cell_positions, first.cell_positions)
+        simulation.ca.ca_grid[6, 6].color = (255, 0, 0)
+        worker.publish_snapshot()
+        snapshot = worker.get_snapshot()
+        self.assertIn((6, 6), snapshot.cell_positions)
+        self.assertEqual(len(snapshot.cell_positions), len(first.cell_positions) + 16)
+        io = PygameIO.__new__(PygameIO)
+        io.gc = simulation.gc
+        io.ca = simulation.ca
+        io.surface = pygame.Surface((32, 32))
+        io.snapshot_positions = None
+        io.draw_snapshot(first)
+        io.draw_snapshot(snapshot)
+        self.assertEqual(tuple(io.surface.get_at((26, 26)))[:3], (255, 0, 0))
+
+
+@unittest.skipIf(pygame is None, 'pygame is not installed')
+class ExportTestCase(unittest.TestCase):
+    """
+    Tests for the offscreen frame export.
+    """
+
+    def test_every_kth_frame_is_written_as_png(self):
+        with tempfile.TemporaryDirectory() as directory:
+            gc = GlobalConstants()
+            gc.GUI = 'Export'
+            gc.CELL_SIZE = 4
+            gc.DIM_X = 6
+            gc.DIM_Y = 5
+            gc.EXPORT_PATH = os.path.join(directory, 'frames')
+            gc.EXPORT_NUM_STEPS = 5
+            gc.EXPORT_EVERY_K_STEPS = 2
+            gc.EXPORT_THREADS = 2
+            simulation = ComplexAutomaton(gc)
+            simulation.ca.ca_grid[1, 1].color = (255, 0, 0)
+            simulation.run_main_loop()
+            self.assertEqual(gc.TIME_STEP, 5)
+            files = sorted(os.listdir(gc.EXPORT_PATH))
+            self.assertEqual(files, ['frame_000000.png', 'frame_000002.png', 'frame_000004.png'])
+            for name in files:
+                path = os.path.join(gc.EXPORT_PATH, name)
+                with open(path, 'rb') as png_file:
+                    data = png_file.read()
+                self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+                self.assertEqual(struct.unpack('>II', data[16:24]), (24, 20))
+                image = pygame.image.load(path)
+                self.assertEqual(image.get_size(), (24, 20))
+                self.assertEqual(tuple(image.get_at((6, 6)))[:3], (255, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+This module contains an offscreen CAB io implementation that exports frames instead of showing them.
+The cells and agents are drawn with the same methods as in PygameIO, but onto an offscreen surface.
+Frames are either written as numbered PNG files or piped as raw RGB data into an encoder process.
+"""
+
+import collections
+import concurrent.futures
+import os
+import struct
+import subprocess
+import zlib
+
+import pygame
+
+import cab.global_constants as cab_gc
+import cab.util.io_pygame as cab_io_pg
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+def write_png(path: str, data: bytes, width: int, height: int):
+    """
+    Write raw RGB data as a PNG file.
+    The compression is done by zlib, which releases the GIL, so several frames can be encoded in parallel.
+    :param path: Path of the file to write.
+    :param data: RGB pixel data, row by row without padding.
+    :param width: Width of the image in pixels.
+    :param height: Height of the image in pixels.
+    """
+    def chunk(tag, payload):
+        return struct.pack('>I', len(payload)) + tag + payload + struct.pack('>I', zlib.crc32(tag + payload))
+
+    row_bytes = width * 3
+    # Every row is prefixed with filter type 0 (no filter).
+    raw = b''.join(b'\x00' + data[y * row_bytes:(y + 1) * row_bytes] for y in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    with open(path, 'wb') as png_file:
+        png_file.write(b'\x89PNG\r\n\x1a\n')
+        png_file.write(chunk(b'IHDR', header))
+        png_file.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        png_file.write(chunk(b'IEND', b''))
+
+
+class ExportIO(cab_io_pg.PygameIO):
+    """
+    Headless visualization that renders every k-th step into an image sequence or a video.
+    Drawing happens in the simulation thread, file writing and encoding in a background thread pool.
+    """
+
+    def __init__(self, gc: cab_gc.GlobalConstants, cab_core):
+        self.encoder = None
+        self.executor = None
+        self.pending = collections.deque()
+        super().__init__(gc, cab_core)
+        self.width, self.height = self.surface.get_size()
+
+    def init_surface(self, width: int, height: int):
+        """
+        Create an offscreen surface instead of opening a window.
+        """
+        self.surface = pygame.Surface((width, height), 0, 32)
+
+    def render_simulation(self):
+        cab_log.trace("[ExportIO] start exporting simulation")
+        self.start_export()
+        try:
+            self.export_frame(0)
+            for frame in range(1, self.gc.EXPORT_NUM_STEPS + 1):
+                self.core.step_simulation()
+                if frame % self.gc.EXPORT_EVERY_K_STEPS == 0:
+                    self.export_frame(frame)
+        finally:
+            self.finish_export()
+
+    def start_export(self):
+        if self.gc.EXPORT_ENCODER_CMD is None:
+            os.makedirs(self.gc.EXPORT_PATH, exist_ok=True)
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.gc.EXPORT_THREADS)
+        else:
+            # Frames have to arrive at the encoder in order, hence only one writing thread.
+            cmd = [arg.format(width=self.width, height=self.height) for arg in self.gc.EXPORT_ENCODER_CMD]
+            cab_log.info('[ExportIO] starting encoder: {0}'.format(' '.join(cmd)))
+            self.encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def export_frame(self, frame: int):
+        """
+        Draw the current state of the simulation and hand it over to the thread pool.
+        """
+        self.surface.fill(self.gc.DEFAULT_CELL_COLOR)
+        self.draw_frame()
+        data = pygame.image.tostring(self.surface, 'RGB')
+        if self.encoder is None:
+            path = os.path.join(self.gc.EXPORT_PATH, 'frame_{0:06d}.png'.format(frame))
+            future = self.executor.submit(write_png, path, data, self.width, self.height)
+        else:
+            future = self.executor.submit(self.encoder.stdin.write, data)
+        self.pending.append(future)
+        # Keep the number of frames in memory bounded if the writers can't keep up.
+        while len(self.pending) > 2 * self.gc.EXPORT_THREADS:
+            self.pending.popleft().result()
+        cab_log.trace('[ExportIO] exporting frame {0}'.format(frame))
+
+    def finish_export(self):
+        while self.pending:
+            self.pending.popleft().result()
+        self.executor.shutdown()
+        if self.encoder is not None:
+            self.encoder.stdin.close()
+            self.encoder.wait()
+        cab_log.info('[ExportIO] export finished')
@@ -31,6 +31,9 @@ class PygameIO(cab_io.IoInterface):
         self.ca = cab_core.ca
         self.surface = None
         self.io_handler = cab_pygame_io.InputHandler(cab_core)
+        self.clock = pygame.time.Clock()
+        self.snapshot_positions = None
+        self.snapshot_corners = None
 
         # Initialize UI components.
         pygame.init()
@@ -43,23 +46,45 @@ class PygameIO(cab_io.IoInterface):
         else:
             offset_x = self.gc.CELL_SIZE * self.gc.DIM_X
             offset_y = self.gc.CELL_SIZE * self.gc.DIM_Y
-        self.surface = pygame.display.set_mode((offset_x, offset_y), pygame.locals.HWSURFACE | pygame.locals.DOUBLEBUF, 32)
-        pygame.display.set_caption('Complex Automaton Base')
+        self.init_surface(offset_x, offset_y)
         cab_log.trace("[PygameIO] initializing done")
 
+    def init_surface(self, width: int, height: int):
+        """
+        Open the window that is drawn on.
+        """
+        self.surface = pygame.display.set_mode((width, height), pygame.locals.HWSURFACE | pygame.locals.DOUBLEBUF, 32)
+        pygame.display.set_caption('Complex Automaton Base')
+
     def render_frame(self):
         self.io_handler.process_input()
 
+        if self.core.worker is not None:
+            self.draw_snapshot(self.core.worker.get_snapshot())
+            pygame.display.flip()
+            self.clock.tick(self.gc.TARGET_FPS)
+            return
+
         if self.gc.RUN_SIMULATION:
             self.core.step_simulation()
 
+        self.draw_frame()
+        pygame.display.flip()
+
+    def draw_frame(self):
+        """
+        Draw all cells and agents onto the surface.
+        """
         draw_cell = self.draw_cell
         for c in list(self.ca.ca_grid.values()):
             draw_cell(c)
         draw_agent = self.draw_agent
         for a in self.abm.agent_set:
             draw_agent(a)
-        pygame.display.flip()
+        draw_agent_shape = self.draw_agent_shape
+        for population in self.abm.populations:
+            for (x, y, color, size) in population.drawables():
+                draw_agent_shape(x, y, color, size)
 
 # TODO: Change render_simulation to fit the whole simulation loop inside.
     def render_simulation(self):
@@ -67,22 +92,45 @@ class PygameIO(cab_io.IoInterface):
         while True:
             self.render_frame()
 
+    def draw_snapshot(self, snapshot):
+        """
+        Draw a frame snapshot published by the simulation thread.
+        The cell corners are only placed again when the snapshot lists other cells than the last one,
+        which happens when a chunked grid grows.
+        """
+        if snapshot is None:
+            return
+        if snapshot.cell_positions is not self.snapshot_positions:
+            # The grid is owned by the simulation thread, so the corners come from the positions of the snapshot.
+            geometry = self.ca.geometry
+            self.snapshot_corners = [geometry.corners(x, y) for (x, y) in snapshot.cell_positions]
+            self.snapshot_positions = snapshot.cell_positions
+        draw_polygon = self.draw_polygon
+        for corners, color in zip(self.snapshot_corners, snapshot.cell_colors):
+            draw_polygon(corners, color)
+        draw_agent_shape = self.draw_agent_shape
+        for (x, y, color, size) in snapshot.agents:
+            draw_agent_shape(x, y, color, size)
+
     def draw_agent(self, agent: cab_agent.CabAgent):
         """
         Simple exemplary visualization. Draw agent as a black circle
         """
         if agent.x is not None and agent.y is not None and not agent.dead:
-            radius = int(agent.size / 1.25)
+            self.draw_agent_shape(agent.x, agent.y, agent.color, agent.size)
+
+    def draw_agent_shape(self, agent_x, agent_y, color, size):
+        radius = int(size / 1.25)
 
-            horiz = self.gc.CELL_SIZE * 2 * (math.sqrt(3) / 2)
-            offset = agent.y * (horiz / 2)
-            x = int(agent.x * horiz) + int(offset)
+        horiz = self.gc.CELL_SIZE * 2 * (math.sqrt(3) / 2)
+        offset = agent_y * (horiz / 2)
+        x = int(agent_x * horiz) + int(offset)
 
-            vert = self.gc.CELL_SIZE * 2 * (3 / 4)
-            y = int(agent.y * vert)
+        vert = self.gc.CELL_SIZE * 2 * (3 / 4)
+        y = int(agent_y * vert)
 
-            pygame.draw.circle(self.surface, agent.color, (x, y), radius, 0)
-            pygame.gfxdraw.aacircle(self.surface, x, y, radius, (50, 100, 50))
+        pygame.draw.circle(self.surface, color, (x, y), radius, 0)
+        pygame.gfxdraw.aacircle(self.surface, x, y, radius, (50, 100, 50))
 
     def draw_cell(self, cell: cab_cell.CACell):
         """
@@ -91,9 +139,12 @@ class PygameIO(cab_io.IoInterface):
         if cell is None:
             pass
         else:
-            pygame.gfxdraw.filled_polygon(self.surface, cell.get_corners(), cell.color)
-            if self.gc.DISPLAY_GRID:
-                pygame.gfxdraw.aapolygon(self.surface, cell.get_corners(), self.gc.DEFAULT_GRID_COLOR)
-            else:
-                pygame.gfxdraw.aapolygon(self.surface, cell.get_corners(), cell.color)
+            self.draw_polygon(self.ca.geometry.corners(cell.x, cell.y), cell.color)
             return
+
+    def draw_polygon(self, corners, color):
+        pygame.gfxdraw.filled_polygon(self.surface, corners, color)
+        if self.gc.DISPLAY_GRID:
+            pygame.gfxdraw.aapolygon(self.surface, corners, self.gc.DEFAULT_GRID_COLOR)
+        else:
+            pygame.gfxdraw.aapolygon(self.surface, corners, color)
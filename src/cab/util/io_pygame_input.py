@@ -10,6 +10,7 @@ import math
 # Internal Simulation System Component imports.
 import cab.ca.ca_hex as cab_ca_hex
 import cab.util.logging as cab_log
+import cab.util.simulation_worker as cab_worker
 
 __author__ = 'Michael Wagner'
 
@@ -74,6 +75,11 @@ class InputHandler:
         else:
             pos_x, pos_y = self.get_mouse_rect_coords()
 
+        # The simulation thread owns all cells and agents, let it handle the click.
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.CLICK, (button, pos_x, pos_y))
+            return
+
         # Click on left mouse button.
         if button == 1:
             # Check if agents at this location and trigger their lmb click method.
@@ -103,6 +109,10 @@ class InputHandler:
         Method to process all the keyboard inputs.
         This is not supposed to be overwritten.
         """
+        if self.core.worker is not None and active_key in (pygame.K_SPACE, pygame.K_r, pygame.K_s, pygame.K_f):
+            self.forward_keyboard_action(active_key)
+            return
+
         if active_key == pygame.K_SPACE:
             self.core.gc.RUN_SIMULATION = not self.core.gc.RUN_SIMULATION
             if self.core.gc.RUN_SIMULATION:
@@ -120,6 +130,12 @@ class InputHandler:
             self.core.step_simulation()
             cab_log.info('[PyGameIO] < stepping simulation')
 
+        # Simulation Standard: 'f' advances the simulation by many steps without drawing.
+        if active_key == pygame.K_f:
+            cab_log.info('[PyGameIO] < fast-forwarding simulation')
+            for _ in range(self.core.gc.FAST_FORWARD_STEPS):
+                self.core.step_simulation()
+
         # Simulation Standard: 'q' closes the simulation and visualization window.
         if active_key == pygame.K_q:
             cab_log.info('[PyGameIO] < shutting down simulation')
@@ -133,6 +149,19 @@ class InputHandler:
             else:
                 cab_log.info('[PyGameIO] > hiding grid')
 
+    def forward_keyboard_action(self, active_key: int):
+        """
+        Translate the standard simulation keys into commands for the simulation thread.
+        """
+        if active_key == pygame.K_SPACE:
+            self.core.worker.submit(cab_worker.Command.TOGGLE_RUN)
+        elif active_key == pygame.K_r:
+            self.core.worker.submit(cab_worker.Command.RESET)
+        elif active_key == pygame.K_s:
+            self.core.worker.submit(cab_worker.Command.STEP)
+        elif active_key == pygame.K_f:
+            self.core.worker.submit(cab_worker.Command.FAST_FORWARD, self.core.gc.FAST_FORWARD_STEPS)
+
     def custom_keyboard_action(self, active_key: int):
         """
         Customizable Method to process keyboard inputs.
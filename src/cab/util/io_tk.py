@@ -11,6 +11,7 @@ import tkinter
 import cab.ca.ca_hex as cab_ca
 import cab.util.io_interface as cab_io
 import cab.util.logging as cab_log
+import cab.util.simulation_worker as cab_worker
 
 __author__ = 'Michael Wagner'
 
@@ -29,6 +30,8 @@ class TkIO(cab_io.IoInterface):
         self.canvas = None
         self.cell_shape_mapping = list()
         self.agent_shape_mapping = list()
+        self.grid_displayed = True
+        self.last_snapshot = None
 
         self.init_canvas()
         self.init_cell_shape_mapping()
@@ -52,13 +55,15 @@ class TkIO(cab_io.IoInterface):
         self.canvas.pack()
 
     def init_cell_shape_mapping(self):
+        geometry = self.core.ca.geometry
         for k, v in list(self.core.ca.ca_grid.items()):
-            corners_list = [i for tupl in v.get_corners() for i in tupl]
+            corners_list = [i for tupl in geometry.corners(v.x, v.y) for i in tupl]
             col_f = self.get_color_string(v.color)
             col_o = self.get_color_string((0, 0, 0))
             polygon = self.canvas.create_polygon(corners_list, fill=col_f, outline=col_o)
             old_color = v.color
             self.cell_shape_mapping.append((polygon, v, old_color))
+        self.grid_displayed = True
 
     def init_agent_shape_mapping(self):
         for agent in self.core.abm.agent_set:
@@ -86,22 +91,27 @@ class TkIO(cab_io.IoInterface):
                 self.agent_shape_mapping.append((circle, agent, old_color))
 
     def update_cells(self):
+        self.recolor_cells([cell.color for (polygon, cell, color) in self.cell_shape_mapping])
+
+    def recolor_cells(self, new_colors):
+        """
+        Reconfigure the polygons of cells whose color changed. The outlines of the other cells are only
+        touched when DISPLAY_GRID was toggled since the last frame.
+        :param new_colors: One color per entry of cell_shape_mapping.
+        """
+        display_grid = self.gc.DISPLAY_GRID
+        toggled = display_grid != self.grid_displayed
+        col_grid = self.get_color_string((0, 0, 0))
         new_list = list()
-        for (polygon, cell, color) in self.cell_shape_mapping:
-            if cell.color != color:
-                col = self.get_color_string(cell.color)
-                self.canvas.itemconfig(polygon, fill=col)
-                old_color = cell.color
-                new_list.append((polygon, cell, old_color))
-            else:
-                new_list.append((polygon, cell, color))
-            # Update grid drawing
-            if self.gc.DISPLAY_GRID:
-                col_o = self.get_color_string((0, 0, 0))
-            else:
-                col_o = self.get_color_string(cell.color)
-            self.canvas.itemconfig(polygon, outline=col_o)
+        for (polygon, cell, color), new_color in zip(self.cell_shape_mapping, new_colors):
+            if new_color != color:
+                col_f = self.get_color_string(new_color)
+                self.canvas.itemconfig(polygon, fill=col_f, outline=col_grid if display_grid else col_f)
+            elif toggled:
+                self.canvas.itemconfig(polygon, outline=col_grid if display_grid else self.get_color_string(color))
+            new_list.append((polygon, cell, new_color))
         self.cell_shape_mapping = new_list
+        self.grid_displayed = display_grid
 
     def update_agents(self):
         new_list = list()
@@ -156,6 +166,24 @@ class TkIO(cab_io.IoInterface):
                 self.canvas.move(oval, dx, dy)
             new_list.append((oval, agent, color))
         self.agent_shape_mapping = new_list
+        self.draw_populations()
+
+    def draw_populations(self):
+        """
+        Draw the agents of populations. They have no objects of their own to keep ovals for,
+        so they are redrawn from scratch.
+        """
+        self.canvas.delete('population')
+        horiz = self.gc.CELL_SIZE * 2 * (math.sqrt(3) / 2)
+        vert = self.gc.CELL_SIZE * 2 * (3 / 4)
+        col_o = self.get_color_string((0, 0, 0))
+        for population in self.core.abm.populations:
+            for (agent_x, agent_y, color, size) in population.drawables():
+                radius = int(size / 1.25)
+                x = int(agent_x * horiz) + int(agent_y * (horiz / 2))
+                y = int(agent_y * vert)
+                self.canvas.create_oval([x - radius, y - radius, x + radius, y + radius],
+                                        fill=self.get_color_string(color), outline=col_o, tags='population')
 
     def clear_cell_shape_mapping(self):
         for (polygon, cell, old_color) in self.cell_shape_mapping:
@@ -167,6 +195,32 @@ class TkIO(cab_io.IoInterface):
             self.canvas.delete(oval)
         self.agent_shape_mapping = list()
 
+    def draw_snapshot(self, snapshot):
+        """
+        Draw a frame snapshot published by the simulation thread.
+        Cells are matched with their polygons by position in the grid, agents are redrawn from scratch.
+        """
+        self.recolor_cells(snapshot.cell_colors)
+
+        self.canvas.delete('agent')
+        horiz = self.gc.CELL_SIZE * 2 * (math.sqrt(3) / 2)
+        vert = self.gc.CELL_SIZE * 2 * (3 / 4)
+        col_o = self.get_color_string((0, 0, 0))
+        for (agent_x, agent_y, color, size) in snapshot.agents:
+            radius = int(size / 1.25)
+            x = int(agent_x * horiz) + int(agent_y * (horiz / 2))
+            y = int(agent_y * vert)
+            self.canvas.create_oval([x - radius, y - radius, x + radius, y + radius],
+                                    fill=self.get_color_string(color), outline=col_o, tags='agent')
+
+    def render_snapshot(self):
+        """Draws the latest snapshot of the simulation thread at a fixed frame rate"""
+        snapshot = self.core.worker.get_snapshot()
+        if snapshot is not None and snapshot is not self.last_snapshot:
+            self.draw_snapshot(snapshot)
+            self.last_snapshot = snapshot
+        self.root.after(max(1, int(1000 / self.gc.TARGET_FPS)), self.render_snapshot)
+
     def render_frame(self):
         """Draws a new frame every N milliseconds"""
         self.update_cells()
@@ -176,7 +230,11 @@ class TkIO(cab_io.IoInterface):
         self.root.after(1, self.render_frame)
 
     def render_simulation(self):
-        self.render_frame()
+        if self.core.worker is not None:
+            self.clear_agent_shape_mapping()
+            self.render_snapshot()
+        else:
+            self.render_frame()
         self.root.mainloop()
 
     @staticmethod
@@ -198,6 +256,7 @@ class TkInputActions:
         self.root.bind('<space>', self.key_space)
         self.root.bind('s', self.key_s)
         self.root.bind('r', self.key_r)
+        self.root.bind('f', self.key_f)
         self.root.bind('q', self.key_q)
         self.root.bind('g', self.key_g)
         self.root.bind('<Button-1>', self.mouse_left)
@@ -205,6 +264,9 @@ class TkInputActions:
         self.root.bind('<Button-3>', self.mouse_right)
 
     def key_space(self, event):
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.TOGGLE_RUN)
+            return
         self.core.gc.RUN_SIMULATION = not self.core.gc.RUN_SIMULATION
         if self.core.gc.RUN_SIMULATION:
             cab_log.info('[TkIO] < simulation resumed')
@@ -212,10 +274,25 @@ class TkInputActions:
             cab_log.info('[TkIO] < simulation paused')
 
     def key_s(self, event):
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.STEP)
+            return
         cab_log.info('[TkIO] < stepping simulation')
         self.core.step_simulation()
 
+    def key_f(self, event):
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.FAST_FORWARD, self.gc.FAST_FORWARD_STEPS)
+            return
+        cab_log.info('[TkIO] < fast-forwarding simulation')
+        for _ in range(self.gc.FAST_FORWARD_STEPS):
+            self.core.step_simulation()
+
     def key_r(self, event):
+        if self.core.worker is not None:
+            # The grid keeps its layout, so the shape mapping stays valid for the snapshots.
+            self.core.worker.submit(cab_worker.Command.RESET)
+            return
         cab_log.info('[TkIO] < simulation reset')
         self.core.reset_simulation()
         self.ui.clear_cell_shape_mapping()
@@ -248,6 +325,10 @@ class TkInputActions:
         else:
             pos_x, pos_y = self.get_mouse_rect_coords()
 
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.CLICK, (1, pos_x, pos_y))
+            return
+
         cab_log.info('[TkIO] < triggering cell action')
         self.core.ca.ca_grid[pos_x, pos_y].on_lmb_click(self.core.abm, self.core.ca)
         if self.gc.ONE_AGENT_PER_CELL:
@@ -273,6 +354,10 @@ class TkInputActions:
         else:
             pos_x, pos_y = self.get_mouse_rect_coords()
 
+        if self.core.worker is not None:
+            self.core.worker.submit(cab_worker.Command.CLICK, (3, pos_x, pos_y))
+            return
+
         cab_log.info('[TkIO] < triggering cell action')
         self.core.ca.ca_grid[pos_x, pos_y].on_rmb_click(self.core.abm, self.core.ca)
         if self.gc.ONE_AGENT_PER_CELL:
@@ -0,0 +1,196 @@
+"""
+This module contains a CAB io implementation in TkInter that paints the grid into a single image.
+Instead of one canvas item per cell, all cells are rasterized into a color buffer which is
+handed to a Tk PhotoImage. This keeps Tk responsive for worlds with millions of cells.
+"""
+
+# External library imports.
+import math
+import tkinter
+
+# Internal Simulation System component imports.
+import cab.util.io_tk as cab_io_tk
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+def rasterize_polygon(corners, width, height):
+    """
+    Scanline-fill a convex polygon and return the covered pixels as spans.
+    A pixel belongs to the polygon if its center lies inside, so neighboring cells sharing an edge
+    neither overlap nor leave gaps.
+    :param corners: List of (x, y) corner tuples, as returned by geometry.corners().
+    :param width: Width of the image in pixels, spans are clipped to it.
+    :param height: Height of the image in pixels, spans are clipped to it.
+    :returns List of (y, x_start, x_end) tuples with x_end being exclusive.
+    """
+    spans = []
+    ys = [c[1] for c in corners]
+    y_min = max(0, int(math.floor(min(ys))))
+    y_max = min(height, int(math.ceil(max(ys))))
+    n = len(corners)
+    for y in range(y_min, y_max):
+        sample_y = y + 0.5
+        xs = []
+        for k in range(n):
+            x1, y1 = corners[k]
+            x2, y2 = corners[(k + 1) % n]
+            if y1 == y2:
+                continue
+            if (y1 <= sample_y < y2) or (y2 <= sample_y < y1):
+                xs.append(x1 + (sample_y - y1) * (x2 - x1) / (y2 - y1))
+        if len(xs) < 2:
+            continue
+        x_start = max(0, int(math.ceil(min(xs) - 0.5)))
+        x_end = min(width, int(math.ceil(max(xs) - 0.5)))
+        if x_start < x_end:
+            spans.append((y, x_start, x_end))
+    return spans
+
+
+def disc_spans(radius):
+    """
+    Returns the spans of a filled disc centered on the origin.
+    :param radius: Radius of the disc in pixels.
+    :returns List of (dy, dx_start, dx_end) tuples with dx_end being exclusive.
+    """
+    spans = []
+    for dy in range(-radius, radius + 1):
+        half = int(math.sqrt(radius * radius - dy * dy))
+        spans.append((dy, -half, half + 1))
+    return spans
+
+
+class TkImageIO(cab_io_tk.TkIO):
+    """
+    Tk visualization that renders the cellular automaton into a PhotoImage.
+    Cells are rasterized once into byte spans of an RGB buffer, so a color change of a cell only
+    rewrites its own pixels. Agents are stamped as small discs onto a copy of that buffer each frame.
+    The grid outline is not drawn in this mode.
+    """
+
+    def __init__(self, gc, cab_core):
+        self.image = None
+        self.image_item = None
+        self.cell_buffer = bytearray()
+        self.frame_buffer = bytearray()
+        self.agent_spans = list()
+        super().__init__(gc, cab_core)
+
+    def init_canvas(self):
+        super().init_canvas()
+        self.image = tkinter.PhotoImage(width=self.width, height=self.height)
+        self.image_item = self.canvas.create_image(0, 0, anchor=tkinter.NW, image=self.image)
+
+    def init_cell_shape_mapping(self):
+        """
+        Rasterize every cell into its spans of the color buffer and paint the initial colors.
+        The cell shape mapping holds (byte spans, cell, last painted color) for every cell.
+        """
+        self.cell_buffer = bytearray(bytes(self.gc.DEFAULT_CELL_COLOR) * (self.width * self.height))
+        row_bytes = self.width * 3
+        # The exact outlines are used, since the truncated pixel corners of neighboring hexagons
+        # do not line up and would leave gaps in the raster.
+        geometry = self.core.ca.geometry
+        for cell in list(self.core.ca.ca_grid.values()):
+            spans = [(y * row_bytes + x1 * 3, y * row_bytes + x2 * 3)
+                     for (y, x1, x2) in rasterize_polygon(geometry.outline(cell.x, cell.y), self.width, self.height)]
+            self.paint_spans(spans, cell.color)
+            self.cell_shape_mapping.append((spans, cell, cell.color))
+        cab_log.trace("[TkImageIO] rasterized {0} cells".format(len(self.cell_shape_mapping)))
+
+    def init_agent_shape_mapping(self):
+        """
+        Agents are not kept as canvas items, only the disc shape is precomputed.
+        """
+        self.agent_spans = disc_spans(max(1, int(self.gc.CELL_SIZE / 1.25)))
+
+    def paint_spans(self, spans, color):
+        color_bytes = bytes(color)
+        buf = self.cell_buffer
+        for (start, end) in spans:
+            buf[start:end] = color_bytes * ((end - start) // 3)
+
+    def update_cells(self):
+        new_list = list()
+        for (spans, cell, color) in self.cell_shape_mapping:
+            if cell.color != color:
+                self.paint_spans(spans, cell.color)
+                new_list.append((spans, cell, cell.color))
+            else:
+                new_list.append((spans, cell, color))
+        self.cell_shape_mapping = new_list
+
+    def update_agents(self):
+        """
+        Compose the frame from the cell buffer and stamp all living agents on top of it.
+        """
+        agents = [(a.x, a.y, a.color) for a in self.core.abm.agent_set
+                  if a.x is not None and a.y is not None and not a.dead]
+        for population in self.core.abm.populations:
+            agents.extend((x, y, color) for (x, y, color, _) in population.drawables())
+        self.stamp_agents(agents)
+
+    def stamp_agents(self, agents):
+        """
+        Build the frame buffer from the cell buffer with the given agents drawn as discs.
+        :param agents: Iterable of (x, y, color) tuples.
+        """
+        frame = None
+        row_bytes = self.width * 3
+        for (agent_x, agent_y, color) in agents:
+            if frame is None:
+                frame = bytearray(self.cell_buffer)
+            cx, cy = self.get_agent_pixel_position(agent_x, agent_y)
+            color_bytes = bytes(color)
+            for (dy, dx1, dx2) in self.agent_spans:
+                y = cy + dy
+                if y < 0 or y >= self.height:
+                    continue
+                x1 = max(0, cx + dx1)
+                x2 = min(self.width, cx + dx2)
+                if x1 < x2:
+                    frame[y * row_bytes + x1 * 3:y * row_bytes + x2 * 3] = color_bytes * (x2 - x1)
+        self.frame_buffer = self.cell_buffer if frame is None else frame
+
+    def get_agent_pixel_position(self, x, y):
+        """
+        Returns the pixel coordinates of the center of the cell at grid position x, y.
+        """
+        if self.gc.USE_HEX_CA:
+            horiz = self.gc.CELL_SIZE * 2 * (math.sqrt(3) / 2)
+            vert = self.gc.CELL_SIZE * 2 * (3 / 4)
+            return int(x * horiz) + int(y * (horiz / 2)), int(y * vert)
+        else:
+            half = self.gc.CELL_SIZE // 2
+            return x * self.gc.CELL_SIZE + half, y * self.gc.CELL_SIZE + half
+
+    def refresh_image(self):
+        header = 'P6 {0} {1} 255 '.format(self.width, self.height).encode('ascii')
+        self.image.configure(data=header + bytes(self.frame_buffer), format='PPM')
+
+    def clear_cell_shape_mapping(self):
+        self.cell_shape_mapping = list()
+
+    def clear_agent_shape_mapping(self):
+        pass
+
+    def draw_snapshot(self, snapshot):
+        new_list = list()
+        for (spans, cell, color), new_color in zip(self.cell_shape_mapping, snapshot.cell_colors):
+            if new_color != color:
+                self.paint_spans(spans, new_color)
+            new_list.append((spans, cell, new_color))
+        self.cell_shape_mapping = new_list
+        self.stamp_agents((x, y, color) for (x, y, color, size) in snapshot.agents)
+        self.refresh_image()
+
+    def render_frame(self):
+        """Draws a new frame every N milliseconds"""
+        self.update_cells()
+        self.update_agents()
+        self.refresh_image()
+        if self.gc.RUN_SIMULATION:
+            self.core.step_simulation()
+        self.root.after(1, self.render_frame)
@@ -0,0 +1,168 @@
+"""
+This module contains a background driver for the simulation.
+The simulation advances in its own thread and publishes immutable frame snapshots,
+which the GUI renders at a fixed frame rate. Input is forwarded to the worker as commands.
+"""
+
+import collections
+import queue
+import threading
+import time
+
+from enum import Enum
+
+import cab.global_constants as cab_gc
+import cab.util.logging as cab_log
+
+__author__ = 'Michael Wagner'
+
+
+class Command(Enum):
+    TOGGLE_RUN = 0
+    STEP = 1
+    RESET = 2
+    FAST_FORWARD = 3
+    CLICK = 4
+    STOP = 5
+
+
+FrameSnapshot = collections.namedtuple('FrameSnapshot', ['time_step', 'cell_positions', 'cell_colors', 'agents'])
+FrameSnapshot.__doc__ = """
+Immutable picture of the simulation after a step.
+cell_positions holds the (x, y) position of every cell, in the iteration order of ca.ca_grid. It is the same
+object in consecutive snapshots until the grid grows, so renderers only recompute cell shapes when it changes.
+cell_colors holds one color per cell, in the same order.
+agents holds one (x, y, color, size) tuple per living agent.
+"""
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Runs the simulation loop of a ComplexAutomaton in a separate thread.
+    All modifications of the simulation happen inside this thread, the GUI only reads snapshots.
+    """
+
+    def __init__(self, gc: cab_gc.GlobalConstants, cab_core):
+        super().__init__(name='cab-simulation', daemon=True)
+        self.gc = gc
+        self.core = cab_core
+        self.commands = queue.Queue()
+        self.snapshot_lock = threading.Lock()
+        self.snapshot = None
+        self.running = True
+        self.step_interval = None
+        if self.gc.TARGET_STEPS_PER_SECOND:
+            self.step_interval = 1.0 / self.gc.TARGET_STEPS_PER_SECOND
+        self.publish_interval = 1.0 / self.gc.TARGET_FPS
+        self.last_publish = 0.0
+        self.cell_positions = tuple()
+        self.publish_snapshot()
+
+    def submit(self, command: Command, argument=None):
+        """
+        Hand a command over to the simulation thread. Safe to call from any thread.
+        :param command: The command to execute.
+        :param argument: Number of steps for FAST_FORWARD, (button, x, y) for CLICK.
+        """
+        self.commands.put((command, argument))
+
+    def get_snapshot(self) -> FrameSnapshot:
+        with self.snapshot_lock:
+            return self.snapshot
+
+    def publish_snapshot(self):
+        """
+        Take a snapshot of the current simulation state and make it available to the GUI.
+        """
+        cells = list(self.core.ca.ca_grid.values())
+        if len(cells) != len(self.cell_positions):
+            # Cells are never removed, so the same number of cells means the same positions.
+            self.cell_positions = tuple((cell.x, cell.y) for cell in cells)
+        cell_colors = tuple(cell.color for cell in cells)
+        agents = [(a.x, a.y, a.color, a.size) for a in self.core.abm.agent_set
+                  if a.x is not None and a.y is not None and not a.dead]
+        for population in self.core.abm.populations:
+            agents.extend(population.drawables())
+        agents = tuple(agents)
+        snapshot = FrameSnapshot(self.gc.TIME_STEP, self.cell_positions, cell_colors, agents)
+        with self.snapshot_lock:
+            self.snapshot = snapshot
+        self.last_publish = time.perf_counter()
+
+    def run(self):
+        cab_log.trace('[SimulationWorker] starting simulation thread')
+        next_step = time.perf_counter()
+        while self.running:
+            # While paused, block until the GUI sends something to do.
+            self.process_commands(block=not self.gc.RUN_SIMULATION)
+            if not self.running or not self.gc.RUN_SIMULATION:
+                continue
+
+            if self.step_interval is not None:
+                delay = next_step - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_step = max(next_step + self.step_interval, time.perf_counter() - self.step_interval)
+
+            self.core.step_simulation()
+            if time.perf_counter() - self.last_publish >= self.publish_interval:
+                self.publish_snapshot()
+        cab_log.trace('[SimulationWorker] simulation thread stopped')
+
+    def process_commands(self, block: bool):
+        try:
+            command, argument = self.commands.get(block=block)
+        except queue.Empty:
+            return
+        while True:
+            self.execute(command, argument)
+            try:
+                command, argument = self.commands.get_nowait()
+            except queue.Empty:
+                break
+        self.publish_snapshot()
+
+    def execute(self, command: Command, argument):
+        if command == Command.TOGGLE_RUN:
+            self.gc.RUN_SIMULATION = not self.gc.RUN_SIMULATION
+            if self.gc.RUN_SIMULATION:
+                cab_log.info('[SimulationWorker] < simulation resumed')
+            else:
+                cab_log.info('[SimulationWorker] < simulation paused')
+        elif command == Command.STEP:
+            cab_log.info('[SimulationWorker] < stepping simulation')
+            self.core.step_simulation()
+        elif command == Command.RESET:
+            cab_log.info('[SimulationWorker] < simulation reset')
+            self.core.reset_simulation()
+        elif command == Command.FAST_FORWARD:
+            num_steps = argument if argument is not None else self.gc.FAST_FORWARD_STEPS
+            cab_log.info('[SimulationWorker] < fast-forwarding {0} steps'.format(num_steps))
+            for _ in range(num_steps):
+                self.core.step_simulation()
+        elif command == Command.CLICK:
+            self.click(*argument)
+        elif command == Command.STOP:
+            self.running = False
+
+    def click(self, button: int, pos_x: int, pos_y: int):
+        """
+        Trigger the click methods of the cell and agents at the given position.
+        :param button: 1 for the left, 3 for the right mouse button.
+        """
+        abm = self.core.abm
+        ca = self.core.ca
+        if (pos_x, pos_y) not in ca.ca_grid:
+            return
+        for agent in abm.agents_at(pos_x, pos_y):
+            if button == 1:
+                agent.on_lmb_click(abm, ca)
+            elif button == 3:
+                agent.on_rmb_click(abm, ca)
+        if button == 1:
+            ca.ca_grid[pos_x, pos_y].on_lmb_click(abm, ca)
+        elif button == 3:
+            ca.ca_grid[pos_x, pos_y].on_rmb_click(abm, ca)
+
+    def stop(self):
+        self.submit(Command.STOP)